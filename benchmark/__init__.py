@@ -0,0 +1,8 @@
+"""
+
+Micro-benchmarks for Caster core.
+
+Each benchmark module can be run on its own, e.g.
+`python -m benchmark.recognition_dispatch`.
+
+"""
@@ -0,0 +1,73 @@
+"""
+
+Compare cold and warm start up of the `Controller` for large
+configurations. A cold start parses and validates `caster.yml`, a warm
+start restores the configuration snapshot.
+
+"""
+import os
+import tempfile
+import timeit
+
+import yaml
+
+from castervoice.core import Controller
+
+
+CONTEXT_COUNTS = [20, 200, 1000]
+REPEAT = 5
+NUMBER = 10
+
+
+def make_config(context_count):
+    contexts = [{"name": "global",
+                 "plugins": []}]
+    for index in range(context_count):
+        contexts.append({"name": f"context{index}",
+                         "extends": "global",
+                         "executable": f"app{index % 20}",
+                         "title": f"Window {index}",
+                         f"benchplugin{index % 10}": {"mode": "normal"},
+                         "plugins": []})
+
+    return {"plugins": {"config": {f"benchplugin{index}": {"option": index}
+                                   for index in range(10)}},
+            "engine": {"text": {}},
+            "contexts": contexts}
+
+
+def bench_startup(config_dir, cold):
+    """Time creating a `Controller` from `config_dir`.
+
+    :returns: Minimum start up time in milliseconds
+
+    """
+    snapshot_path = os.path.join(config_dir, "caster.yml.snapshot")
+
+    def start():
+        if cold and os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+        Controller(config_dir=config_dir)
+
+    # Create the snapshot used by warm starts
+    start()
+
+    timings = timeit.repeat(start, repeat=REPEAT, number=NUMBER)
+    return min(timings) / NUMBER * 1e3
+
+
+def main():
+    print(f"{'contexts':>8} {'cold ms':>9} {'warm ms':>9}")
+    for context_count in CONTEXT_COUNTS:
+        with tempfile.TemporaryDirectory() as config_dir:
+            with open(os.path.join(config_dir, "caster.yml"), "w",
+                      encoding="utf-8") as config_file:
+                yaml.dump(make_config(context_count), config_file)
+
+            cold = bench_startup(config_dir, True)
+            warm = bench_startup(config_dir, False)
+        print(f"{context_count:>8} {cold:>9.2f} {warm:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
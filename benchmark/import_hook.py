@@ -0,0 +1,60 @@
+"""
+
+Measure the per-import overhead of the development mode import hook
+(`castervoice.core.dependency_manager.ModuleReloader`).
+
+"""
+import timeit
+
+from dragonfly import get_engine
+
+from castervoice.core.dependency_manager import ModuleReloader
+
+
+REPEAT = 5
+NUMBER = 100000
+
+# Statements of already imported modules. Only the cost of the import
+# statement itself is measured.
+STATEMENTS = {
+    "import module": "import json",
+    "import submodule": "import os.path",
+    "from package import": "from json import decoder, loads",
+    "from . import": "from . import decoder",
+}
+
+
+def bench_statement(statement):
+    """Time `statement` executed within a module's namespace.
+
+    :returns: Minimum time per import in microseconds
+
+    """
+    code = compile(statement, "<benchmark>", "exec")
+    namespace = {"__name__": "json.benchmark", "__package__": "json"}
+    # pylint: disable=exec-used
+    timings = timeit.repeat(lambda: exec(code, namespace),
+                            repeat=REPEAT, number=NUMBER)
+    return min(timings) / NUMBER * 1e6
+
+
+def main():
+    get_engine("text")
+
+    baseline = {name: bench_statement(statement)
+                for name, statement in STATEMENTS.items()}
+
+    reloader = ModuleReloader()
+    hooked = {name: bench_statement(statement)
+              for name, statement in STATEMENTS.items()}
+    reloader.close()
+
+    print(f"{'statement':>20} {'base usec':>10} {'hook usec':>10}"
+          f" {'overhead':>10}")
+    for name in STATEMENTS:
+        print(f"{name:>20} {baseline[name]:>10.3f} {hooked[name]:>10.3f}"
+              f" {hooked[name] - baseline[name]:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+
+Measure the cost of attributing a recognized rule to its plugin in
+`castervoice.watcher.on_recognition` for a growing number of loaded
+plugins.
+
+"""
+import timeit
+
+from dragonfly import Grammar, MappingRule, Function
+
+from castervoice import watcher
+from castervoice.core import Controller, Plugin
+
+
+PLUGIN_COUNTS = [5, 50, 500]
+GRAMMARS_PER_PLUGIN = 3
+REPEAT = 5
+NUMBER = 10000
+
+
+def make_plugin_class(index):
+    """Create a plugin class with its own (fake) module path as id."""
+
+    def get_grammars(self):
+        grammars = []
+        for grammar_index in range(GRAMMARS_PER_PLUGIN):
+            rule = MappingRule(name=f"rule_{index}_{grammar_index}",
+                               mapping={f"bench {index} {grammar_index}":
+                                        Function(lambda: None)})
+            grammar = Grammar(f"{self.id}_{grammar_index}")
+            grammar.add_rule(rule)
+            grammars.append(grammar)
+        return grammars
+
+    return type(f"BenchPlugin{index}", (Plugin,),
+                {"__module__": f"benchplugin{index}",
+                 "get_grammars": get_grammars})
+
+
+def bench_dispatch(controller, plugin_count):
+    """Time `on_recognition` for the last loaded plugin's rule.
+
+    :returns: Mean time per call in microseconds
+
+    """
+    plugin_manager = controller.plugin_manager
+
+    for index in range(plugin_count):
+        plugin = make_plugin_class(index)(plugin_manager)
+        plugin_manager.plugins[plugin.id] = plugin
+        plugin.load()
+
+    # The last plugin's last grammar is the worst case for a linear scan
+    rule = plugin.grammars[-1].rules[0]
+    words = ("bench", str(plugin_count - 1))
+
+    timings = timeit.repeat(lambda: watcher.on_recognition(words, rule, None),
+                            repeat=REPEAT, number=NUMBER)
+
+    plugin_manager.unload_plugins()
+    plugin_manager.plugins.clear()
+
+    return min(timings) / NUMBER * 1e6
+
+
+def main():
+    controller = Controller({"engine": {"text": {}}})
+
+    print(f"{'plugins':>8} {'grammars':>9} {'usec/call':>10}")
+    for plugin_count in PLUGIN_COUNTS:
+        usec = bench_dispatch(controller, plugin_count)
+        print(f"{plugin_count:>8} {plugin_count * GRAMMARS_PER_PLUGIN:>9}"
+              f" {usec:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
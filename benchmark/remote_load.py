@@ -0,0 +1,124 @@
+"""
+
+Load test the recognition server with the text engine on one machine.
+
+Clients run in threads, each with a persistent connection, pipelining
+`--pipeline` requests at a time. Reports throughput and round trip
+latencies.
+
+    python -m benchmark.remote_load --clients 1 10 50
+
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import gevent
+
+from castervoice.core import Controller
+from castervoice.remote import RecognitionClient, RecognitionServer
+from benchmark.suite import PLUGIN_SOURCE
+
+
+PLUGIN_ID = "benchremote_plugin"
+
+
+def make_controller(directory, rules):
+    with open(os.path.join(directory, f"{PLUGIN_ID}.py"), "w",
+              encoding="utf-8") as plugin_file:
+        plugin_file.write(PLUGIN_SOURCE.format(grammars=1, rules=rules,
+                                               name="bench"))
+    sys.path.insert(0, directory)
+
+    with open(os.path.join(directory, "caster.yml"), "w",
+              encoding="utf-8") as config_file:
+        json.dump({"engine": {"text": {}}, "plugins": {},
+                   "contexts": [{"name": "global",
+                                 "plugins": [PLUGIN_ID]}]}, config_file)
+
+    return Controller(config_dir=directory, execute_actions=False)
+
+
+def run_client(address, phrases, pipeline, latencies):
+    with RecognitionClient(address, timeout=30) as client:
+        for start in range(0, len(phrases), pipeline):
+            sent = []
+            for phrase in phrases[start:start + pipeline]:
+                sent.append((client.send_text(phrase), time.perf_counter()))
+            for request_id, started in sent:
+                if client.receive(request_id) is None:
+                    raise RuntimeError("Phrase not recognized")
+                latencies.append(time.perf_counter() - started)
+
+
+def bench_clients(address, clients, args):
+    phrases = [f"bench 0 {index % args.rules}"
+               for index in range(args.requests)]
+    latencies = []
+    threads = [threading.Thread(target=run_client,
+                                args=(address, phrases, args.pipeline,
+                                      latencies))
+               for _ in range(clients)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    # The server's connections are served by this thread's hub
+    while any(thread.is_alive() for thread in threads):
+        gevent.sleep(0.001)
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{clients:>8} {len(latencies) / duration:>12.0f}"
+          f" {statistics.median(latencies) * 1e3:>10.3f}"
+          f" {latencies[int(len(latencies) * 0.95)] * 1e3:>10.3f}"
+          f" {latencies[-1] * 1e3:>10.3f}")
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+            description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 10, 50],
+                        help='Numbers of concurrent clients.')
+    parser.add_argument('--requests', type=int, default=500,
+                        help='Requests per client.')
+    parser.add_argument('--pipeline', type=int, default=1,
+                        help='Requests in flight per client.')
+    parser.add_argument('--rules', type=int, default=100,
+                        help='Rules (mapping entries) of the grammar.')
+    parser.add_argument('--address',
+                        help='Listen on `HOST:PORT` instead of a Unix'
+                             ' socket.')
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        controller = make_controller(directory, args.rules)
+        address = args.address or f"unix:{directory}/server.sock"
+        server = RecognitionServer(controller, address)
+        server.start()
+        engine_thread = threading.Thread(target=server.serve_engine,
+                                         daemon=True)
+        engine_thread.start()
+
+        print(f"{'clients':>8} {'requests/s':>12} {'p50 (ms)':>10}"
+              f" {'p95 (ms)':>10} {'max (ms)':>10}")
+        try:
+            for clients in args.clients:
+                bench_clients(address, clients, args)
+        finally:
+            server.close()
+            engine_thread.join()
+
+
+if __name__ == "__main__":
+    main()
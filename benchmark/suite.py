@@ -0,0 +1,298 @@
+"""
+
+Benchmark suite running a `Controller` with the text engine and
+synthetic plugins.
+
+Measures start up, `mimic()` throughput, context evaluation, watcher
+fan-out and plugin state persistence. Results can be written as JSON
+and compared against a stored baseline:
+
+    python -m benchmark.suite --output baseline.json
+    python -m benchmark.suite --baseline baseline.json
+
+Exits with status 1 if any result regressed by more than `--threshold`.
+
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from castervoice import watcher
+from castervoice.core import Controller
+
+
+PLUGIN_SOURCE = """
+from dragonfly import Function, Grammar, MappingRule
+from castervoice.core.plugin import Plugin
+
+
+class BenchPlugin(Plugin):
+    def get_grammars(self):
+        grammars = []
+        for grammar_index in range({grammars}):
+            grammar = Grammar(f"{{self.id}}_{{grammar_index}}")
+            grammar.add_rule(MappingRule(
+                    name=f"{{self.id}}_{{grammar_index}}",
+                    mapping={{f"{name} {{grammar_index}} {{rule_index}}":
+                             Function(lambda: None)
+                             for rule_index in range({rules})}}))
+            grammars.append(grammar)
+        return grammars
+"""
+
+LOWER = "lower"
+HIGHER = "higher"
+
+
+class Suite:
+    # pylint: disable=too-many-instance-attributes
+
+    """Synthetic Caster set up shared by all benchmarks."""
+
+    def __init__(self, args, directory):
+        self.args = args
+        self.directory = directory
+        self.results = {}
+        self.controller = None
+
+        self.plugin_ids = [f"benchsuite_plugin{index}"
+                           for index in range(args.plugins)]
+        self.phrases = [f"bench {index} {grammar_index} {rule_index}"
+                        for index in range(args.plugins)
+                        for grammar_index in range(args.grammars)
+                        for rule_index in range(args.rules)]
+
+        self.config_dir = os.path.join(directory, "config")
+        self.state_dir = os.path.join(directory, "state")
+        self.write_plugins()
+        self.write_config()
+
+    def write_plugins(self):
+        plugin_dir = os.path.join(self.directory, "plugins")
+        os.makedirs(plugin_dir)
+        for index, plugin_id in enumerate(self.plugin_ids):
+            with open(os.path.join(plugin_dir, f"{plugin_id}.py"), "w",
+                      encoding="utf-8") as plugin_file:
+                plugin_file.write(PLUGIN_SOURCE.format(
+                        grammars=self.args.grammars, rules=self.args.rules,
+                        name=f"bench {index}"))
+        sys.path.insert(0, plugin_dir)
+
+    def write_config(self):
+        # All plugins are active globally, further contexts only add
+        # to the cost of evaluating contexts
+        contexts = [{"name": "global", "plugins": self.plugin_ids}]
+        for index in range(self.args.contexts):
+            plugin_id = self.plugin_ids[index % len(self.plugin_ids)]
+            contexts.append({"name": f"context{index}",
+                             "executable": f"app{index}",
+                             "title": f"Window {index}",
+                             "plugins": [plugin_id]})
+
+        os.makedirs(self.config_dir)
+        with open(os.path.join(self.config_dir, "caster.yml"), "w",
+                  encoding="utf-8") as config_file:
+            json.dump({"engine": {"text": {}}, "plugins": {},
+                       "contexts": contexts}, config_file)
+
+    def record(self, name, value, unit, better=LOWER):
+        self.results[name] = {"value": value, "unit": unit,
+                              "better": better}
+        print(f"{name:<40} {value:>12.3f} {unit}")
+
+    def start(self):
+        if self.controller is not None:
+            self.controller.plugin_manager.unload_plugins()
+        for plugin_id in self.plugin_ids:
+            sys.modules.pop(plugin_id, None)
+
+        self.controller = Controller(config_dir=self.config_dir,
+                                     plugin_state_dir=self.state_dir)
+        return self.controller
+
+    def bench_startup(self):
+        timings = []
+        for _ in range(self.args.repeat):
+            start = time.perf_counter()
+            self.start()
+            timings.append(time.perf_counter() - start)
+        self.record("startup", min(timings) * 1e3, "ms")
+
+    def bench_mimic(self):
+        engine = self.controller.engine
+        phrases = random.Random(0).choices(self.phrases,
+                                           k=self.args.mimics)
+        timings = []
+        for _ in range(self.args.repeat):
+            start = time.perf_counter()
+            for phrase in phrases:
+                engine.mimic(phrase)
+            timings.append(time.perf_counter() - start)
+        self.record("mimic_throughput",
+                    len(phrases) / min(timings), "mimics/s", HIGHER)
+
+    def bench_context_evaluation(self):
+        context_manager = self.controller.context_manager
+        contexts = list(context_manager.contexts.values())
+        timings = []
+        for _ in range(self.args.repeat):
+            start = time.perf_counter()
+            for index in range(self.args.iterations):
+                # A new window evaluates all contexts
+                window = (f"app{index % max(self.args.contexts, 1)}",
+                          f"Window {index}", index)
+                context_manager.matches(contexts[0].node, *window)
+            timings.append(time.perf_counter() - start)
+        self.record("context_evaluation",
+                    min(timings) / self.args.iterations * 1e6, "us/window")
+
+    def bench_watcher_fanout(self):
+        plugin = self.controller.plugin_manager.plugins[self.plugin_ids[0]]
+        rule = plugin.grammars[0].rules[0]
+        words = tuple(self.phrases[0].split())
+
+        for consumers in self.args.consumers:
+            subscriptions = [watcher.subscribe(self.args.iterations)
+                             for _ in range(consumers)]
+            timings = []
+            for _ in range(self.args.repeat):
+                start = time.perf_counter()
+                for _ in range(self.args.iterations):
+                    watcher.on_recognition(words, rule, None)
+                timings.append(time.perf_counter() - start)
+                for subscription in subscriptions:
+                    while len(subscription):
+                        subscription.get()
+            for subscription in subscriptions:
+                watcher.unsubscribe(subscription)
+
+            self.record(f"watcher_fanout_{consumers}",
+                        min(timings) / self.args.iterations * 1e6, "us/event")
+
+        # Consumers filtering for other plugins should cost nothing
+        filtered = [watcher.subscribe(plugins=[f"other{index}"])
+                    for index in range(max(self.args.consumers))]
+        timings = []
+        for _ in range(self.args.repeat):
+            start = time.perf_counter()
+            for _ in range(self.args.iterations):
+                watcher.on_recognition(words, rule, None)
+            timings.append(time.perf_counter() - start)
+        for subscription in filtered:
+            watcher.unsubscribe(subscription)
+
+        self.record(f"watcher_filtered_{len(filtered)}",
+                    min(timings) / self.args.iterations * 1e6, "us/event")
+
+    def bench_state_persist(self):
+        plugin = self.controller.plugin_manager.plugins[self.plugin_ids[0]]
+        plugin.state = {f"word{index}": index
+                        for index in range(self.args.state_size)}
+
+        timings = []
+        for _ in range(self.args.iterations):
+            start = time.perf_counter()
+            plugin.persist_state()
+            timings.append(time.perf_counter() - start)
+        self.controller.plugin_manager.flush_states()
+
+        self.record("state_persist_median",
+                    statistics.median(timings) * 1e6, "us")
+        self.record("state_persist_max", max(timings) * 1e6, "us")
+
+    def run(self):
+        self.bench_startup()
+        self.bench_mimic()
+        self.bench_context_evaluation()
+        self.bench_watcher_fanout()
+        self.bench_state_persist()
+        self.controller.plugin_manager.unload_plugins()
+
+
+def compare(results, baseline, threshold):
+    """Compare `results` against `baseline`.
+
+    :returns: List of names of regressed results
+
+    """
+    regressions = []
+    print(f"\n{'benchmark':<40} {'baseline':>12} {'current':>12}"
+          f" {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]["value"]
+        value = result["value"]
+        change = (value - reference) / reference if reference else 0.0
+        if result["better"] == HIGHER:
+            change = -change
+
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<40} {reference:>12.3f} {value:>12.3f}"
+              f" {change:>+8.1%}{' REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+            description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--plugins', type=int, default=20)
+    parser.add_argument('--grammars', type=int, default=3,
+                        help='Grammars per plugin.')
+    parser.add_argument('--rules', type=int, default=20,
+                        help='Rules (mapping entries) per grammar.')
+    parser.add_argument('--contexts', type=int, default=50)
+    parser.add_argument('--consumers', type=int, nargs='+',
+                        default=[1, 10, 100],
+                        help='Numbers of watcher consumers.')
+    parser.add_argument('--state-size', type=int, default=1000,
+                        help='Number of entries in the persisted state.')
+    parser.add_argument('--iterations', type=int, default=1000,
+                        help='Iterations of fast benchmarks.')
+    parser.add_argument('--mimics', type=int, default=100,
+                        help='Number of mimicked phrases.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', metavar='FILE',
+                        help='Write results as JSON to FILE.')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='Compare results against JSON baseline FILE.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative change considered a regression.')
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        suite = Suite(args, directory)
+        suite.run()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump({"python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "parameters": {name: value for name, value
+                                      in vars(args).items()
+                                      if name not in ("output", "baseline",
+                                                      "threshold")},
+                       "results": suite.results}, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(suite.results, baseline["results"], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
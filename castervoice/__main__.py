@@ -2,14 +2,17 @@ import argparse
 import logging
 import os
 import sys
+import threading
 
 import gevent
 import gevent.queue
 from gevent.pywsgi import WSGIServer
 from gevent import monkey
 
-from castervoice import watcher
-from castervoice.core import Controller
+from castervoice import batch, watcher
+from castervoice.hub_bridge import HubBridge
+from castervoice.remote import RecognitionServer
+from castervoice.core import Controller, profiler
 from castervoice.web import app as web_app
 
 
@@ -26,6 +29,14 @@ def default_plugin_state_dir(config_dir):
     return f"{config_dir}/plugins.state"
 
 
+def default_grammar_cache_dir(config_dir):
+    return f"{config_dir}/grammars.cache"
+
+
+def default_package_cache_dir(config_dir):
+    return f"{config_dir}/packages.cache"
+
+
 def get_parser():
     parser = argparse.ArgumentParser(
             formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -38,14 +49,64 @@ def get_parser():
                              'are reloaded if any of the plugin\'s files are '
                              'altered.')
 
+    parser.add_argument('--no-config-reload', action='store_true',
+                        help='Do not apply changes of `caster.yml` while '
+                             'running.')
+
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Print wall time and peak memory of start up '
+                             'phases and of each plugin. Plugins are loaded '
+                             'one after another while profiling.')
+
+    parser.add_argument('--profile-output', metavar='FILE',
+                        help='Write the start up profile as JSON to FILE. '
+                             'Implies `--profile-startup`.')
+
+    parser.add_argument('--profile-exit', action='store_true',
+                        help='Exit after start up was profiled, e.g. to '
+                             'check for start up regressions in CI. '
+                             'Implies `--profile-startup`.')
+
     parser.add_argument('--plugin-state-dir',
                         help='Plugin state directory. By default this is a '
                              'subdirectory within `config_dir`.')
 
+    parser.add_argument('--grammar-cache-dir',
+                        help='Directory caching built plugin grammars. By '
+                             'default this is a subdirectory within '
+                             '`config_dir`.')
+
+    parser.add_argument('--package-cache-dir',
+                        help='Directory holding the package install manifest '
+                             'and local wheel cache. By default this is a '
+                             'subdirectory within `config_dir`.')
+
     parser.add_argument('--verbose', '-v', action='count',
                         default=0, help=f'Verbose logging (max level:\
                                           {len(VERBOSITY_LOG_LEVEL)}).')
 
+    subparsers = parser.add_subparsers(dest='command')
+
+    batch_parser = subparsers.add_parser(
+            'batch',
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            help='Recognize utterances from a file and exit.',
+            description=batch.__doc__)
+    batch_parser.add_argument('input', nargs='?', default='-',
+                              help='File with one utterance per line, `-` '
+                                   'reads from stdin.')
+    batch_parser.add_argument('--json', action='store_true',
+                              help='Write results as JSON.')
+
+    serve_parser = subparsers.add_parser(
+            'serve',
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            help='Serve recognitions to clients instead of executing '
+                 'actions.')
+    serve_parser.add_argument('address', nargs='?', default='127.0.0.1:23424',
+                              help='`HOST:PORT` or `unix:PATH` to listen '
+                                   'on.')
+
     return parser
 
 
@@ -65,6 +126,12 @@ def get_args():
     if not args.plugin_state_dir:
         args.plugin_state_dir = default_plugin_state_dir(args.config_dir)
 
+    if not args.grammar_cache_dir:
+        args.grammar_cache_dir = default_grammar_cache_dir(args.config_dir)
+
+    if not args.package_cache_dir:
+        args.package_cache_dir = default_package_cache_dir(args.config_dir)
+
     try:
         return verify_parsed_args(args)
     except ValueError as error:
@@ -83,12 +150,27 @@ def main():
 
     args = get_args()
 
+    # Threads are not patched: The engine and workers run in native
+    # threads which must not be scheduled by the hub.
+    monkey.patch_all(thread=False, queue=False, subprocess=False, ssl=False)
+
     logging.basicConfig(level=VERBOSITY_LOG_LEVEL[args.verbose])
 
+    if args.profile_startup or args.profile_output or args.profile_exit:
+        profiler.start()
+
+    batch_mode = args.command == 'batch'
+    serve_mode = args.command == 'serve'
+
     try:
         controller = Controller(config_dir=os.path.abspath(args.config_dir),
                                 plugin_state_dir=args.plugin_state_dir,
-                                dev_mode=args.develop)
+                                dev_mode=args.develop,
+                                grammar_cache_dir=args.grammar_cache_dir,
+                                package_cache_dir=args.package_cache_dir,
+                                watch_config=not (args.no_config_reload
+                                                  or batch_mode),
+                                execute_actions=not serve_mode)
     # pylint: disable=broad-except
     except Exception as error:
         logging.getLogger().error("Controller failed with: %s", error)
@@ -96,13 +178,57 @@ def main():
             logging.getLogger().exception(error)
         sys.exit(1)
 
-    gevent.spawn(controller.listen, watcher.on_begin,
-                 watcher.on_recognition, watcher.on_failure)
+    startup_profile = profiler.stop()
+    if startup_profile is not None:
+        print(startup_profile.report())
+        if args.profile_output:
+            startup_profile.write_json(args.profile_output)
+        if args.profile_exit:
+            sys.exit(0)
+
+    if batch_mode:
+        if args.input == '-':
+            passed = batch.run_batch(controller, sys.stdin, sys.stdout,
+                                     args.json)
+        else:
+            with open(args.input, 'r', encoding='utf-8') as input_file:
+                passed = batch.run_batch(controller, input_file, sys.stdout,
+                                         args.json)
+        sys.exit(0 if passed else 1)
+
+    # The engine's recognition loop blocks in native code. Running it
+    # on the hub would stall the web server and vice versa. Events are
+    # created on the engine thread and published on the hub.
+    bridge = HubBridge()
+
+    def on_begin():
+        bridge.call(watcher.publish, watcher.create_begin_event())
+        print("Speech start detected.")
+
+    def on_recognition(words, rule, node):
+        bridge.call(watcher.publish, watcher.create_event(words, rule, node))
+
+    def on_failure():
+        bridge.call(watcher.publish, watcher.create_failure_event())
+        print("Sorry, what was that?")
+
+    if serve_mode:
+        server = RecognitionServer(controller, args.address)
+        server.start()
+        engine_thread = threading.Thread(target=server.serve_engine,
+                                         name="castervoice-engine",
+                                         daemon=True)
+    else:
+        engine_thread = threading.Thread(
+                target=controller.listen, name="castervoice-engine",
+                args=(on_begin, on_recognition, on_failure,
+                      watcher.on_post_recognition),
+                daemon=True)
+    engine_thread.start()
 
     if args.verbose > 0:
         gevent.spawn(watcher.log)
 
-    monkey.patch_all(subprocess=False, ssl=False)
     http_server = WSGIServer(('', 23423), web_app)
     http_server.serve_forever()
 
@@ -0,0 +1,194 @@
+"""
+
+Push utterances through the engine without a microphone.
+
+Each input line is one utterance. On engines supporting it (Kaldi),
+a line naming a `.wav` file is recognized from that file. All other
+lines are mimicked.
+
+A line may state the expected match after a tab, either a plugin id
+(`casterplugin.dictation`) or a plugin id and rule name separated by a
+colon (`casterplugin.dictation:DictationRule`). A recognition not
+matching its expectation counts as a failure.
+
+Note that the actions of recognized rules are executed.
+
+"""
+import json
+import statistics
+import time
+
+from dragonfly import MimicFailure
+from dragonfly.grammar.recobs_callbacks import \
+    register_recognition_callback
+
+
+class UtteranceResult:
+
+    """Outcome of one utterance."""
+
+    __slots__ = ("utterance", "expected", "plugin_id", "rule_name",
+                 "latency")
+
+    def __init__(self, utterance, expected):
+        self.utterance = utterance
+        self.expected = expected
+        self.plugin_id = None
+        self.rule_name = None
+        self.latency = None
+
+    recognized = property(lambda self: self.rule_name is not None,
+                          doc="Boolean indicating whether a rule matched.")
+
+    @property
+    def passed(self):
+        """Boolean indicating whether the expected rule matched."""
+        if not self.recognized:
+            return False
+        if self.expected is None:
+            return True
+
+        plugin_id, _, rule_name = self.expected.partition(":")
+        return plugin_id == self.plugin_id \
+            and rule_name in ("", self.rule_name)
+
+    def to_dict(self):
+        return {"utterance": self.utterance, "expected": self.expected,
+                "plugin": self.plugin_id, "rule": self.rule_name,
+                "latency": self.latency, "passed": self.passed}
+
+
+def parse_utterances(lines):
+    """Parse input lines into `(utterance, expected)` tuples.
+
+    Empty lines and lines starting with `#` are skipped.
+
+    """
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        utterance, _, expected = line.partition("\t")
+        yield utterance.strip(), expected.strip() or None
+
+
+class BatchRecognizer:
+
+    """Recognizes utterances with the controller's engine."""
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._result = None
+
+    def _on_recognition(self, words, rule):
+        # pylint: disable=unused-argument
+        plugin = self._controller.plugin_manager \
+            .get_grammar_plugin(rule.grammar)
+        self._result.plugin_id = plugin.id if plugin else None
+        self._result.rule_name = rule.name
+
+    def recognize(self, utterance, expected=None):
+        """Recognize a single utterance.
+
+        :returns: `UtteranceResult`
+
+        """
+        engine = self._controller.engine
+        self._result = result = UtteranceResult(utterance, expected)
+
+        start = time.perf_counter()
+        if utterance.endswith(".wav") \
+                and hasattr(engine, "recognize_wave_file"):
+            engine.recognize_wave_file(utterance)
+        else:
+            try:
+                engine.mimic(utterance.split())
+            except MimicFailure:
+                pass
+        result.latency = time.perf_counter() - start
+
+        self._result = None
+        return result
+
+    def run(self, utterances):
+        """Recognize all `(utterance, expected)` tuples.
+
+        :returns: List of `UtteranceResult`
+
+        """
+        observer = register_recognition_callback(self._on_recognition)
+        try:
+            with self._controller.engine.connection():
+                return [self.recognize(utterance, expected)
+                        for utterance, expected in utterances]
+        finally:
+            observer.unregister()
+
+
+def summarize(results, duration):
+    """Aggregate `results` of a batch run taking `duration` seconds."""
+    latencies = sorted(result.latency for result in results)
+    summary = {
+        "utterances": len(results),
+        "recognized": sum(1 for result in results if result.recognized),
+        "failed": sum(1 for result in results if not result.passed),
+        "duration": duration,
+        "throughput": len(results) / duration if duration else None,
+    }
+    if latencies:
+        summary.update({
+            "latency_mean": statistics.mean(latencies),
+            "latency_p50": latencies[len(latencies) // 2],
+            "latency_p95": latencies[min(len(latencies) - 1,
+                                         int(len(latencies) * 0.95))],
+            "latency_max": latencies[-1],
+        })
+    return summary
+
+
+def format_report(results, summary):
+    lines = []
+    for result in results:
+        status = "ok" if result.passed else "FAIL"
+        match = f"{result.plugin_id}:{result.rule_name}" \
+            if result.recognized else "-"
+        expected = f" (expected {result.expected})" \
+            if result.expected and not result.passed else ""
+        lines.append(f"{status:<4} {result.latency * 1e3:>8.2f}ms"
+                     f"  {result.utterance!r} -> {match}{expected}")
+
+    lines.append("")
+    lines.append(f"{summary['utterances']} utterances,"
+                 f" {summary['recognized']} recognized,"
+                 f" {summary['failed']} failed"
+                 f" in {summary['duration']:.3f}s")
+    if summary["utterances"]:
+        lines.append(f"Throughput: {summary['throughput']:.1f}"
+                     " utterances/s")
+        lines.append(f"Latency: mean {summary['latency_mean'] * 1e3:.2f}ms"
+                     f", p50 {summary['latency_p50'] * 1e3:.2f}ms"
+                     f", p95 {summary['latency_p95'] * 1e3:.2f}ms"
+                     f", max {summary['latency_max'] * 1e3:.2f}ms")
+    return "\n".join(lines)
+
+
+def run_batch(controller, lines, output, as_json=False):
+    """Recognize utterances of `lines` and write a report to `output`.
+
+    :returns: `True` if all utterances passed
+
+    """
+    recognizer = BatchRecognizer(controller)
+
+    start = time.perf_counter()
+    results = recognizer.run(parse_utterances(lines))
+    summary = summarize(results, time.perf_counter() - start)
+
+    if as_json:
+        json.dump({"results": [result.to_dict() for result in results],
+                   "summary": summary}, output, indent=2)
+        output.write("\n")
+    else:
+        output.write(format_report(results, summary) + "\n")
+
+    return summary["failed"] == 0
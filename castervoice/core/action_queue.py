@@ -0,0 +1,269 @@
+"""
+
+Execute recognized rules' actions on worker threads.
+
+Rules of plugins with `Plugin.queue_actions` set do not execute their
+actions in the engine's recognition callback. Their recognitions are
+queued and processed by a pool of workers instead, so slow actions do
+not delay recognizing the next utterance.
+
+Actions of a single plugin are executed one after another in the order
+they were recognized. Actions of different plugins run concurrently.
+
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+from castervoice.metrics import Histogram
+
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+EXPIRED = "expired"
+
+
+class ActionJob():
+
+    """Queued action of a plugin."""
+
+    __slots__ = ("plugin_id", "function", "queued", "deadline", "state",
+                 "_queue")
+
+    def __init__(self, queue, plugin_id, function, timeout):
+        self._queue = queue
+        self.plugin_id = plugin_id
+        self.function = function
+        self.queued = time.monotonic()
+        self.deadline = self.queued + timeout if timeout is not None \
+            else None
+        self.state = PENDING
+
+    def cancel(self):
+        """Cancel the job if it did not start yet.
+
+        :returns: `True` if the job was cancelled
+
+        """
+        return self._queue.cancel(self)
+
+
+class ActionQueue():
+    # pylint: disable=too-many-instance-attributes
+
+    """Worker pool executing actions in order per plugin.
+
+    `timeout` is the maximum number of seconds an action may wait in
+    the queue. Actions not started in time are dropped, e.g. to not
+    type text into a window the user switched away from in the
+    meantime. Running actions can not be interrupted.
+
+    """
+
+    def __init__(self, workers=4, timeout=None):
+        """
+
+        :param workers: Number of worker threads
+        :param timeout: Default queueing timeout in seconds. Actions
+                        never expire if `None`.
+
+        """
+        self._executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="castervoice-action")
+        self._timeout = timeout
+
+        # plugin_id -> deque of pending `ActionJob`. A plugin has an
+        # entry while one of its jobs is scheduled on the executor.
+        self._lanes = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._depth = 0
+        self._running = 0
+        self._closed = False
+
+        self._counts = {DONE: 0, FAILED: 0, CANCELLED: 0, EXPIRED: 0}
+        self._submitted = 0
+        self._wait_latency = Histogram()
+        self._execution_latency = Histogram()
+        # plugin_id -> `Histogram` of seconds waited in the plugin's lane
+        self._lane_wait_latency = {}
+
+    log = property(lambda self: logging.getLogger("castervoice.ActionQueue"),
+                   doc="Get class logger.")
+
+    timeout = property(lambda self: self._timeout,
+                       doc="Default queueing timeout in seconds.")
+
+    depth = property(lambda self: self._depth,
+                     doc="Number of actions waiting to be executed.")
+
+    running = property(lambda self: self._running,
+                       doc="Number of actions being executed.")
+
+    wait_latency = property(lambda self: self._wait_latency,
+                            doc="`Histogram` of seconds actions waited in"
+                                " the queue.")
+
+    execution_latency = property(lambda self: self._execution_latency,
+                                 doc="`Histogram` of seconds actions took"
+                                     " to execute.")
+
+    def lane_wait_latency(self):
+        """Get seconds actions waited in the queue per plugin.
+
+        :returns: Dictionary mapping plugin ids to `Histogram`
+
+        """
+        with self._lock:
+            return dict(self._lane_wait_latency)
+
+    def stats(self):
+        """Get counters of the queue.
+
+        :returns: Dictionary
+
+        """
+        with self._lock:
+            return dict(self._counts, submitted=self._submitted,
+                        depth=self._depth, running=self._running)
+
+    def submit(self, plugin_id, function, timeout=None):
+        """Queue `function` to be called after queued actions of
+        `plugin_id`.
+
+        :param plugin_id: Plugin the action belongs to
+        :param function: Callable without arguments
+        :param timeout: Queueing timeout overriding the default
+        :returns: `ActionJob`
+
+        """
+        job = ActionJob(self, plugin_id, function,
+                        self._timeout if timeout is None else timeout)
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Action queue is closed")
+
+            self._submitted += 1
+            self._depth += 1
+            lane = self._lanes.get(plugin_id)
+            if lane is not None:
+                lane.append(job)
+                return job
+            self._lanes[plugin_id] = deque([job])
+
+        self._executor.submit(self._run_next, plugin_id)
+        return job
+
+    def cancel(self, job):
+        """Cancel `job` if it did not start yet.
+
+        :returns: `True` if the job was cancelled
+
+        """
+        with self._lock:
+            if job.state != PENDING:
+                return False
+            self._lanes[job.plugin_id].remove(job)
+            self._finish(job, CANCELLED)
+            return True
+
+    def cancel_plugin(self, plugin_id):
+        """Cancel all pending actions of `plugin_id`.
+
+        :returns: Number of cancelled actions
+
+        """
+        with self._lock:
+            lane = self._lanes.get(plugin_id, ())
+            jobs = list(lane)
+            for job in jobs:
+                lane.remove(job)
+                self._finish(job, CANCELLED)
+            return len(jobs)
+
+    def _finish(self, job, state):
+        # Called with `_lock` held
+        if job.state == PENDING:
+            self._depth -= 1
+        job.state = state
+        self._counts[state] += 1
+        self._idle.notify_all()
+
+    def _run_next(self, plugin_id):
+        # Executes a single job per task so that a busy plugin does
+        # not keep a worker from serving other plugins.
+        with self._lock:
+            lane = self._lanes[plugin_id]
+            job = lane.popleft() if lane else None
+            if job is not None:
+                started = time.monotonic()
+                if job.deadline is not None and started > job.deadline:
+                    self._finish(job, EXPIRED)
+                    self.log.warning("Dropped action of %s queued for"
+                                     " %.3fs", plugin_id,
+                                     started - job.queued)
+                    job = None
+                else:
+                    self._depth -= 1
+                    self._running += 1
+                    job.state = RUNNING
+
+        if job is not None:
+            self._execute(job, started)
+
+        with self._lock:
+            if not lane:
+                del self._lanes[plugin_id]
+                return
+
+        self._executor.submit(self._run_next, plugin_id)
+
+    def _execute(self, job, started):
+        state = DONE
+        try:
+            job.function()
+        except Exception:  # pylint: disable=W0703
+            state = FAILED
+            self.log.exception("Action of %s failed", job.plugin_id)
+
+        with self._lock:
+            self._running -= 1
+            self._wait_latency.observe(started - job.queued)
+            lane_wait_latency = self._lane_wait_latency.get(job.plugin_id)
+            if lane_wait_latency is None:
+                lane_wait_latency = self._lane_wait_latency[job.plugin_id] \
+                    = Histogram()
+            lane_wait_latency.observe(started - job.queued)
+            self._execution_latency.observe(time.monotonic() - started)
+            self._finish(job, state)
+
+    def join(self, timeout=None):
+        """Wait until all queued actions were executed.
+
+        :returns: `True` if the queue is idle
+
+        """
+        with self._lock:
+            return self._idle.wait_for(
+                    lambda: self._depth == 0 and self._running == 0,
+                    timeout)
+
+    def close(self, cancel=False):
+        """Stop accepting actions and wait for queued actions.
+
+        :param cancel: Cancel pending actions instead of executing them
+
+        """
+        with self._lock:
+            self._closed = True
+        if cancel:
+            for plugin_id in list(self._lanes):
+                self.cancel_plugin(plugin_id)
+        self.join()
+        self._executor.shutdown()
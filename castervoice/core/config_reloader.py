@@ -0,0 +1,133 @@
+"""
+
+Apply changes of Caster's configuration file while running.
+
+"""
+import logging
+import os
+import time
+
+from dragonfly import get_current_engine
+
+from castervoice.core.file_watcher import create_file_watcher
+
+
+# Sections of the `plugins` configuration which are not applied while
+# running
+RESTART_PLUGIN_SECTIONS = ("lazy", "grammar_cache", "state", "actions")
+
+
+class ConfigDiff():
+
+    """Structural difference between two validated configurations."""
+
+    def __init__(self, old, new):
+        """
+
+        :param old: Current configuration
+        :param new: Changed configuration
+
+        """
+        old_contexts = {context["name"]: context
+                        for context in old["contexts"]}
+        new_contexts = {context["name"]: context
+                        for context in new["contexts"]}
+
+        self.added_contexts = [name for name in new_contexts
+                               if name not in old_contexts]
+        self.removed_contexts = [name for name in old_contexts
+                                 if name not in new_contexts]
+        self.changed_contexts = [name for name, context
+                                 in new_contexts.items()
+                                 if name in old_contexts
+                                 and old_contexts[name] != context]
+        # Context order determines which contexts can be extended
+        self.reordered_contexts = list(old_contexts) != list(new_contexts)
+
+        old_plugins = old["plugins"]
+        new_plugins = new["plugins"]
+
+        old_configs = old_plugins.get("config") or {}
+        new_configs = new_plugins.get("config") or {}
+        self.changed_plugin_configs = sorted(
+                plugin_id for plugin_id in old_configs.keys()
+                | new_configs.keys()
+                if old_configs.get(plugin_id) != new_configs.get(plugin_id))
+
+        old_packages = old_plugins.get("packages") or []
+        self.added_packages = [package for package
+                               in new_plugins.get("packages") or []
+                               if package not in old_packages]
+
+        self.restart_required = [
+                f"plugins.{section}" for section in RESTART_PLUGIN_SECTIONS
+                if old_plugins.get(section) != new_plugins.get(section)]
+        if old.get("engine") != new.get("engine"):
+            self.restart_required.append("engine")
+
+    @property
+    def contexts_changed(self):
+        """Boolean indicating whether any context changed."""
+        return bool(self.added_contexts or self.removed_contexts
+                    or self.changed_contexts or self.reordered_contexts)
+
+    def __bool__(self):
+        return bool(self.contexts_changed or self.changed_plugin_configs
+                    or self.added_packages or self.restart_required)
+
+    def __repr__(self):
+        return (f"ConfigDiff(added_contexts={self.added_contexts},"
+                f" removed_contexts={self.removed_contexts},"
+                f" changed_contexts={self.changed_contexts},"
+                f" changed_plugin_configs={self.changed_plugin_configs},"
+                f" added_packages={self.added_packages},"
+                f" restart_required={self.restart_required})")
+
+
+class ConfigReloader():
+
+    """Reload the controller's configuration when its file changes."""
+
+    # Interval in seconds in which the file is checked for changes
+    CHECK_INTERVAL = 0.1
+
+    # Seconds without further changes before reloading
+    DEBOUNCE = 0.1
+
+    def __init__(self, controller, path):
+        """
+
+        :param controller: Caster controller
+        :param path: Configuration file
+
+        """
+        self._controller = controller
+
+        self._watcher = create_file_watcher()
+        self._watcher.watch(os.path.abspath(path))
+        self._last_change = None
+
+        self._timer = get_current_engine() \
+            .create_timer(self.check, self.CHECK_INTERVAL)
+
+    log = property(lambda self:
+                   logging.getLogger("castervoice.ConfigReloader"),
+                   doc="Get class logger.")
+
+    def check(self):
+        """Reload once the file did not change for `DEBOUNCE` seconds."""
+        self._controller.apply_pending_config()
+
+        now = time.monotonic()
+
+        if self._watcher.changes():
+            self._last_change = now
+        elif self._last_change is not None \
+                and now - self._last_change >= self.DEBOUNCE:
+            self._last_change = None
+            self._controller.reload_config()
+
+    def close(self):
+        """Stop watching the configuration file."""
+        self._timer.stop()
+        self._watcher.close()
@@ -0,0 +1,125 @@
+"""
+
+Compiled snapshot of Caster's configuration file.
+
+Parsing and validating `caster.yml` only happens once the file's
+content changes. Otherwise the validated configuration is restored
+from a binary snapshot next to the configuration file.
+
+"""
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import tempfile
+
+
+# Bump if `validate_config` changes what a valid configuration is
+SNAPSHOT_VERSION = 1
+
+
+def validate_config(config):
+    """Validate and normalize configuration `config`.
+
+    Missing `plugins` and `contexts` sections are added.
+
+    :param config: Configuration dictionary
+    :returns: Normalized configuration
+    :raises ValueError: If the configuration is malformed
+
+    """
+    if config is None:
+        config = {}
+    if not isinstance(config, dict):
+        raise ValueError("Configuration must be a mapping!")
+
+    plugins = config.setdefault("plugins", {})
+    if plugins is None:
+        plugins = config["plugins"] = {}
+    if not isinstance(plugins, dict):
+        raise ValueError("Configuration `plugins` must be a mapping!")
+
+    contexts = config.setdefault("contexts", [])
+    if contexts is None:
+        contexts = config["contexts"] = []
+    if not isinstance(contexts, list):
+        raise ValueError("Configuration `contexts` must be a list!")
+
+    for context in contexts:
+        if not isinstance(context, dict):
+            raise ValueError(f"Context configuration must be a mapping."
+                             f" Got: {context!r}")
+        if not isinstance(context.get("name"), str):
+            raise ValueError(f"Context requires a name! Got: {context!r}")
+        if not isinstance(context.setdefault("plugins", []), list):
+            raise ValueError(f"Context '{context['name']}' `plugins` must"
+                             " be a list!")
+
+    return config
+
+
+class ConfigSnapshot():
+
+    """Binary snapshot of a validated configuration file."""
+
+    def __init__(self, path):
+        """
+
+        :param path: Snapshot file
+
+        """
+        self._path = path
+
+    log = property(lambda self:
+                   logging.getLogger("castervoice.ConfigSnapshot"),
+                   doc="Get class logger.")
+
+    path = property(lambda self: self._path,
+                    doc="Snapshot file.")
+
+    @staticmethod
+    def key(content):
+        """Compute snapshot key of configuration file `content`."""
+        digest = hashlib.sha256(content)
+        digest.update(f"{SNAPSHOT_VERSION}:{sys.version_info[:2]}".encode())
+        return digest.hexdigest()
+
+    def load(self, key):
+        """Restore configuration.
+
+        :param key: Key of the current configuration file content
+        :returns: Configuration or `None` if the snapshot is missing
+                  or stale
+
+        """
+        try:
+            with open(self._path, 'rb') as snapshot_file:
+                snapshot_key, config = pickle.load(snapshot_file)
+        except FileNotFoundError:
+            return None
+        except Exception:  # pylint: disable=W0703
+            self.log.exception("Discarding invalid configuration snapshot")
+            return None
+
+        if snapshot_key != key:
+            return None
+        return config
+
+    def store(self, key, config):
+        """Store validated `config` of the configuration with `key`."""
+        try:
+            data = pickle.dumps((key, config), pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as error:
+            self.log.warning("Configuration can not be snapshotted: %s",
+                             error)
+            return
+
+        try:
+            with tempfile.NamedTemporaryFile(
+                    dir=os.path.dirname(os.path.abspath(self._path)),
+                    delete=False) as snapshot_file:
+                snapshot_file.write(data)
+            os.replace(snapshot_file.name, self._path)
+        except OSError:
+            self.log.exception("Failed storing configuration snapshot")
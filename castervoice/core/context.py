@@ -1,4 +1,3 @@
-from dragonfly.grammar.context import LogicAndContext
 from dragonfly import (
         AppContext,
         Context as DragonflyContext
@@ -7,8 +6,17 @@ from dragonfly import (
 
 class Context(DragonflyContext):
 
-    def __init__(self, name, manager):
-        """TODO: to be defined. """
+    """Dragonfly context backed by a node of the manager's `ContextGraph`"""
+
+    def __init__(self, name, manager, node=None):
+        """
+
+        :param name: Context name
+        :param manager: Context manager
+        :param node: Compiled `ContextNode`. If `None` the context
+                     always matches while enabled.
+
+        """
 
         super().__init__()
 
@@ -16,72 +24,368 @@ class Context(DragonflyContext):
         self._name = self._str
         self._enabled = True
 
-        self._contexts = []
-
         self.manager = manager
+        self.node = node
+
+    name = property(lambda self: self._name,
+                    doc="Context name.")
+
+    enabled = property(lambda self: self._enabled,
+                       doc="Boolean indicating whether the context"
+                           " is enabled.")
 
     def matches(self, executable, title, handle):
-        return self._enabled and LogicAndContext(*self._contexts) \
-            .matches(executable, title, handle)
+        if self.node is None:
+            return self._enabled
+        return self.manager.matches(self.node, executable, title, handle)
+
+    def enable(self):
+        """Enable context."""
+        self._enabled = True
+        self.manager.invalidate()
+
+    def disable(self):
+        """Disable context."""
+        self._enabled = False
+        self.manager.invalidate()
 
 
 class ConfigContext(Context):
 
     """Interpret context from Caster configuration"""
 
-    def __init__(self, manager, config):
-        """TODO: to be defined. """
+    # Context configuration keys which are no plugin context selectors
+    RESERVED_KEYS = frozenset(("name", "plugins", "extends",
+                               "executable", "title"))
+
+    def __init__(self, manager, config, extends=None):
+        """
+
+        :param manager: Context manager
+        :param config: Context configuration
+        :param extends: `Context` extended by this context
+
+        """
+
+        super().__init__(config["name"], manager)
 
-        super().__init__(config.pop("name"), manager)
+        self.extends = extends
 
-        executable = config.pop("executable", None)
-        title = config.pop("title", None)
+        graph = manager.graph
+        nodes = [graph.enabled(self)]
+
+        if extends is not None:
+            nodes.append(extends.node)
+
+        executable = config.get("executable")
+        title = config.get("title")
         if title is not None or executable is not None:
-            self._contexts.append(AppContext(executable=executable,
-                                             title=title))
+            nodes.append(graph.app(executable, title))
 
         # Apply plugin specific contexts
         for plugin_id, desired_state in config.items():
+            if plugin_id not in self.RESERVED_KEYS:
+                nodes.append(graph.plugin(plugin_id, desired_state))
+
+        self.node = graph.all_of(*nodes)
+
+
+class ContextNode:
+
+    """Node of a compiled `ContextGraph`.
+
+    `cost` orders sibling nodes so that cheap tests are evaluated
+    before expensive ones. Results of `cacheable` nodes only depend on
+    the foreground window and enabled contexts.
+
+    """
+
+    __slots__ = ("index",)
+
+    cost = 0
+    cacheable = True
+
+    def __init__(self):
+        self.index = None
 
-            self._contexts.append(
-                    PluginContext(manager, plugin_id, desired_state))
+    def evaluate(self, graph, executable, title, handle):
+        raise NotImplementedError()
 
 
-class PluginContext(Context):
+class EnabledNode(ContextNode):
 
-    """Lazily loads plugin contexts on matching
+    """Matches while `context` is enabled."""
+
+    __slots__ = ("context",)
+
+    def __init__(self, context):
+        super().__init__()
+        self.context = context
+
+    def evaluate(self, graph, executable, title, handle):
+        return self.context.enabled
+
+    def __repr__(self):
+        return f"enabled({self.context.name})"
+
+
+class AppNode(ContextNode):
+
+    """Matches the foreground window's executable and/or title."""
+
+    __slots__ = ("_context",)
+
+    cost = 1
+
+    def __init__(self, executable, title):
+        super().__init__()
+        self._context = AppContext(executable=executable, title=title)
+
+    def evaluate(self, graph, executable, title, handle):
+        return self._context.matches(executable, title, handle)
+
+    def __repr__(self):
+        return repr(self._context)
+
+
+class PluginNode(ContextNode):
+
+    """Lazily loads a plugin provided context on first evaluation
 
     Plugin contexts may not be available at start up
     while plugins are still loaded sequentially.
 
+    A plugin which does not provide a context for `desired_state`
+    does not restrict matching.
+
+    Plugin contexts may depend on any state of the plugin, so they are
+    evaluated on every check.
+
     """
 
-    def __init__(self, manager, plugin_id, desired_state):
+    __slots__ = ("_manager", "_plugin_id", "_desired_state",
+                 "_context", "_loaded")
+
+    cost = 2
+    cacheable = False
 
-        super().__init__(plugin_id, manager)
+    def __init__(self, manager, plugin_id, desired_state):
+        super().__init__()
 
+        self._manager = manager
         self._plugin_id = plugin_id
         self._desired_state = desired_state
 
+        self._context = None
+        self._loaded = False
+
+    plugin_id = property(lambda self: self._plugin_id,
+                         doc="Id of the plugin providing the context.")
+
+    def reset(self):
+        """Get the plugin context anew on next evaluation."""
+        self._context = None
         self._loaded = False
 
     def load(self):
         try:
-            plugin_context = self.manager \
+            self._context = self._manager \
                 .get_plugin_context(self._plugin_id,
                                     self._desired_state)
-            self._contexts.append(plugin_context)
 
         except Exception as error:  # pylint: disable=W0703
-            self.manager.log.exception(
+            self._manager.log.exception(
                     "Error while applying plugin specific"
-                    f" context in context '{self._name}'."
-                    " Unable to get context for plugin"
+                    f" context. Unable to get context for plugin"
                     f" {self._plugin_id}: {error}")
 
-    def matches(self, executable, title, handle):
+    def evaluate(self, graph, executable, title, handle):
         if not self._loaded:
             self.load()
             self._loaded = True
 
-        return super().matches(executable, title, handle)
+        if self._context is None:
+            return True
+
+        return self._context.matches(executable, title, handle)
+
+    def __repr__(self):
+        return f"{self._plugin_id}({self._desired_state!r})"
+
+
+class AllNode(ContextNode):
+
+    """Matches if all children match."""
+
+    __slots__ = ("children", "cost", "cacheable")
+
+    def __init__(self, children):
+        super().__init__()
+        self.children = children
+        self.cost = max(child.cost for child in children)
+        self.cacheable = all(child.cacheable for child in children)
+
+    def evaluate(self, graph, executable, title, handle):
+        return all(graph.evaluate(child) for child in self.children)
+
+    def __repr__(self):
+        return f"({' & '.join(repr(child) for child in self.children)})"
+
+
+class AnyNode(AllNode):
+
+    """Matches if any child matches."""
+
+    __slots__ = ()
+
+    def evaluate(self, graph, executable, title, handle):
+        return any(graph.evaluate(child) for child in self.children)
+
+    def __repr__(self):
+        return f"({' | '.join(repr(child) for child in self.children)})"
+
+
+def _freeze(value):
+    """Convert configuration `value` into a hashable equivalent."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item))
+                            for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class ContextGraph:
+
+    """Flat DAG of compiled contexts.
+
+    Identical nodes (e.g. the same `(plugin_id, desired_state)` plugin
+    context used by several contexts) are created only once and each
+    cacheable node is evaluated at most once until the graph is `reset`.
+
+    """
+
+    def __init__(self, manager):
+        self._manager = manager
+
+        self._nodes = []
+        # Intern keys of `_nodes` by index
+        self._keys = []
+        self._interned = {}
+
+        self._window = None
+        self._results = []
+
+    nodes = property(lambda self: tuple(self._nodes),
+                     doc="All compiled nodes.")
+
+    def _intern(self, key, factory):
+        node = self._interned.get(key)
+        if node is None:
+            node = factory()
+            node.index = len(self._nodes)
+            self._nodes.append(node)
+            self._keys.append(key)
+            self._interned[key] = node
+        return node
+
+    def collect(self, roots):
+        """Discard nodes not reachable from `roots`.
+
+        Called after recompiling contexts, nodes of replaced contexts
+        are otherwise kept forever. Invalidates all results.
+
+        :param roots: Nodes still in use
+
+        """
+        reachable = set()
+        pending = list(roots)
+        while pending:
+            node = pending.pop()
+            if node.index not in reachable:
+                reachable.add(node.index)
+                pending.extend(getattr(node, "children", ()))
+
+        # Children precede their parents, keeping the order keeps
+        # children's indices valid while renumbering
+        nodes = []
+        keys = []
+        for node, key in zip(self._nodes, self._keys):
+            if node.index not in reachable:
+                continue
+            node.index = len(nodes)
+            if isinstance(node, AllNode):
+                key = (key[0], frozenset(child.index
+                                         for child in node.children))
+            nodes.append(node)
+            keys.append(key)
+
+        self._nodes = nodes
+        self._keys = keys
+        self._interned = dict(zip(keys, nodes))
+        self._window = None
+        self._results = []
+
+    def enabled(self, context):
+        """Node matching while `context` is enabled."""
+        return self._intern(("enabled", id(context)),
+                            lambda: EnabledNode(context))
+
+    def app(self, executable, title):
+        """Node matching the foreground window."""
+        return self._intern(("app", executable, title),
+                            lambda: AppNode(executable, title))
+
+    def plugin(self, plugin_id, desired_state):
+        """Node matching a plugin provided context."""
+        return self._intern(("plugin", plugin_id, _freeze(desired_state)),
+                            lambda: PluginNode(self._manager, plugin_id,
+                                               desired_state))
+
+    def all_of(self, *nodes):
+        """Node matching if all `nodes` match."""
+        return self._combine(AllNode, nodes)
+
+    def any_of(self, *nodes):
+        """Node matching if any of `nodes` match."""
+        return self._combine(AnyNode, nodes)
+
+    def _combine(self, node_type, nodes):
+        children = []
+        for node in nodes:
+            # Flatten nested nodes of the same type
+            # pylint: disable=unidiomatic-typecheck
+            flattened = node.children if type(node) is node_type \
+                else (node,)
+            for child in flattened:
+                if child not in children:
+                    children.append(child)
+
+        if len(children) == 1:
+            return children[0]
+
+        # Evaluate cheap tests first
+        children.sort(key=lambda child: child.cost)
+
+        key = (node_type.__name__,
+               frozenset(child.index for child in children))
+        return self._intern(key, lambda: node_type(tuple(children)))
+
+    def reset(self, executable, title, handle):
+        """Discard all results and evaluate for the given window."""
+        self._window = (executable, title, handle)
+        self._results = [None] * len(self._nodes)
+
+    def evaluate(self, node):
+        """Evaluate `node`, cacheable nodes at most once per `reset`."""
+        if node.index >= len(self._results):
+            self._results.extend([None] * (len(self._nodes)
+                                           - len(self._results)))
+
+        result = self._results[node.index]
+        if result is None:
+            result = bool(node.evaluate(self, *self._window))
+            if node.cacheable:
+                self._results[node.index] = result
+
+        return result
@@ -1,11 +1,16 @@
+import copy
 import logging
 
-from dragonfly.grammar.context import LogicOrContext, LogicAndContext
-
-from castervoice.core.context import ConfigContext
+from castervoice.core.context import (
+        ConfigContext,
+        Context,
+        ContextGraph,
+        PluginNode
+        )
 
 
 class ContextManager():
+    # pylint: disable=too-many-instance-attributes
 
     """Docstring for ContextManager. """
 
@@ -19,41 +24,75 @@ class ContextManager():
 
         self._config = config
         self._contexts = {}
+        self._plugin_contexts = {}
+        self._graph = ContextGraph(self)
+
+        # Window `(executable, title, handle)` for which the graph
+        # currently holds results
+        self._window = None
+        self._cache_hits = 0
+        self._cache_misses = 0
+
         self.init_contexts(self._config)
 
     log = property(lambda self:
                    logging.getLogger("castervoice.ContextManager"),
                    doc="TODO")
 
-    def init_contexts(self, config):
-        """TODO: Docstring for init_contexts.
+    graph = property(lambda self: self._graph,
+                     doc="Compiled context graph.")
 
-        :config: TODO
-        :returns: TODO
+    contexts = property(lambda self: self._contexts,
+                        doc="Configured contexts by name.")
+
+    def init_contexts(self, config, previous_config=None):
+        """Compile configured contexts and apply them to their plugins.
+
+        :config: List of context configurations
+        :previous_config: List of context configurations the current
+                          contexts were compiled from. Contexts whose
+                          configuration did not change are kept.
 
         """
+        plugin_manager = self._controller.plugin_manager
+
+        # Import all referenced plugins up front as imports can
+        # run concurrently
+        plugin_manager.import_plugins(
+                plugin_id for context_config in config
+                for plugin_id in context_config.get("plugins", [])
+                if isinstance(plugin_id, str))
+
+        previous = {context_config.get("name"): context_config
+                    for context_config in previous_config or []}
+
+        contexts = {}
         plugin_contexts = {}
         for context_config in config:
             try:
                 context_name = context_config["name"]
             except KeyError:
                 self.log.exception("Configured context requires a name!")
-                return
-
-            self.log.info("Initializing context: %s", context_name)
+                continue
 
-            context_plugins = context_config.pop("plugins", [])
-            extends = context_config.pop("extends", None)
-
-            context = ConfigContext(self, context_config)
+            context_plugins = context_config.get("plugins", [])
+            extends = context_config.get("extends")
 
+            extended_context = None
             if isinstance(extends, str):
-                extended_context = self._contexts.get(extends)
-                if extended_context:
-                    self._contexts[context_name] = \
-                        LogicAndContext(extended_context, context)
-            else:
-                self._contexts[context_name] = context
+                extended_context = contexts.get(extends)
+                if extended_context is None:
+                    self.log.error("Context '%s' extends unknown context"
+                                   " '%s'", context_name, extends)
+
+            context = self._contexts.get(context_name)
+            if context is None \
+                    or previous.get(context_name) != context_config \
+                    or context.extends is not extended_context:
+                self.log.info("Initializing context: %s", context_name)
+                context = ConfigContext(self, context_config,
+                                        extended_context)
+            contexts[context_name] = context
 
             for plugin_id in context_plugins:
                 if not isinstance(plugin_id, str):
@@ -62,24 +101,124 @@ class ContextManager():
                                    plugin_id)
                     continue
 
-                self._controller.plugin_manager.init_plugin(plugin_id)
+                plugin_manager.init_plugin(plugin_id)
 
                 if plugin_id not in plugin_contexts:
                     plugin_contexts[plugin_id] = []
-                plugin_contexts[plugin_id] \
-                    .append(self._contexts[context_name])
+                plugin_contexts[plugin_id].append(context)
+
+        self._contexts = contexts
+        self._apply_plugin_contexts(plugin_contexts)
+
+        self._graph.collect(
+                context.node for context in (*self._contexts.values(),
+                                             *self._plugin_contexts.values())
+                if context.node is not None)
+        self.invalidate()
+
+    def _apply_plugin_contexts(self, plugin_contexts):
+        """Apply contexts to plugins whose contexts changed.
+
+        :param plugin_contexts: Dictionary mapping plugin ids to the
+                                list of contexts the plugin is part of
+
+        """
+        plugin_manager = self._controller.plugin_manager
+
+        for plugin_id in self._plugin_contexts.keys() \
+                - plugin_contexts.keys():
+            plugin_manager.remove_plugin(plugin_id)
 
         # Plugins may be present in various contexts
-        for plugin_id, plugin_context in plugin_contexts.items():
-            plugin_manager = self._controller.plugin_manager
+        current_plugin_contexts = self._plugin_contexts
+        self._plugin_contexts = {}
+        for plugin_id, contexts in plugin_contexts.items():
+            node = self._graph.any_of(*(context.node for context in contexts))
+
+            # Nodes are interned, an unchanged plugin context has the
+            # same node
+            current = current_plugin_contexts.get(plugin_id)
+            if current is not None and current.node is node:
+                self._plugin_contexts[plugin_id] = current
+                continue
+
+            name = " | ".join(context.name for context in contexts)
+            self._plugin_contexts[plugin_id] = Context(name, self, node)
             plugin_manager \
-                .apply_context(plugin_id,
-                               LogicOrContext(*plugin_context))
+                .apply_context(plugin_id, self._plugin_contexts[plugin_id])
+
+    def update_contexts(self, config):
+        """Apply changed context configurations.
+
+        Only changed contexts are recompiled. Plugins are initialized
+        or removed as required and only plugins whose contexts changed
+        are applied a new context.
+
+        :config: List of context configurations
+
+        """
+        previous_config = self._config
+        self._config = config
+        self.init_contexts(config, previous_config)
+
+    cache_hits = property(lambda self: self._cache_hits,
+                          doc="Number of context checks served from cache.")
+
+    cache_misses = property(lambda self: self._cache_misses,
+                            doc="Number of context evaluations.")
+
+    def matches(self, node, executable, title, handle):
+        """Check whether compiled context `node` matches the window.
+
+        Contexts only depending on the window and enabled contexts are
+        evaluated once per distinct window. Further checks for the same
+        window are served from cache until the window changes or the
+        cache is invalidated (see `invalidate`). Plugin provided
+        contexts may depend on other state and are evaluated on every
+        check.
+
+        :param node: Compiled context node
+        :returns: Boolean
+
+        """
+        window = (executable, title, handle)
+        if window == self._window:
+            self._cache_hits += 1
+        else:
+            self._cache_misses += 1
+            self._window = window
+            self._graph.reset(executable, title, handle)
+            for context in (*self._contexts.values(),
+                            *self._plugin_contexts.values()):
+                if context.node.cacheable:
+                    self._graph.evaluate(context.node)
+
+        return self._graph.evaluate(node)
+
+    def invalidate(self):
+        """Invalidate cached context results.
+
+        Called when a context or plugin is enabled or disabled.
+
+        """
+        self._window = None
+
+    def reload_plugin_contexts(self, plugin_id):
+        """Discard contexts provided by plugin `plugin_id`.
+
+        Called when the plugin was replaced.
+
+        """
+        for node in self._graph.nodes:
+            if isinstance(node, PluginNode) and node.plugin_id == plugin_id:
+                node.reset()
+        self.invalidate()
 
     def get_plugin_context(self, plugin_id, desired_state):
         """TODO: Docstring for get_plugin_context.
         :returns: TODO
 
         """
+        # Desired states are part of the loaded configuration
         return self._controller.plugin_manager \
-            .get_context(plugin_id, desired_state)
+            .get_context(plugin_id, copy.deepcopy(desired_state))
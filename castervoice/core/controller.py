@@ -1,7 +1,9 @@
 # Since Python >= 3.7
+from concurrent.futures import ThreadPoolExecutor, wait
 import importlib.resources as pkg_resources
 import logging
 import os
+import time
 import yaml
 
 try:
@@ -12,45 +14,89 @@ except ImportError:
 from dragonfly import get_engine
 
 import casterconfig
+from castervoice.core.config_reloader import (
+        ConfigDiff,
+        ConfigReloader,
+        RESTART_PLUGIN_SECTIONS
+        )
+from castervoice.core.config_snapshot import ConfigSnapshot, validate_config
+from castervoice.core import profiler
 from castervoice.core.plugin import PluginManager
 from castervoice.core.dependency_manager import DependencyManager
 from castervoice.core.context_manager import ContextManager
 
 
 class Controller:
+    # pylint: disable=too-many-instance-attributes
 
     """Docstring for Controller. """
 
     # Class wide singleton instance of Controller
     _controller = None
 
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
     def __init__(self, config=None, config_dir=None,
-                 plugin_state_dir=None, dev_mode=False):
+                 plugin_state_dir=None, dev_mode=False,
+                 grammar_cache_dir=None, package_cache_dir=None,
+                 watch_config=False, execute_actions=True):
         """
             `config`: Dictionary or path to file containing configuration.
+            `grammar_cache_dir`: Directory caching built plugin grammars.
+            `package_cache_dir`: Directory caching installed packages.
+            `watch_config`: Apply changes of `caster.yml` in `config_dir`
+                            while running.
+            `execute_actions`: Execute actions of recognized rules. See
+                               `PluginManager.recognition_forwarder`.
         """
 
         self._config_dir = config_dir
-        self._config = self.load_config(config, config_dir)
+        self._config_override = config if isinstance(config, dict) else None
+        with profiler.phase("load_config"):
+            self._config = self.load_config(config, config_dir)
 
         self._dev_mode = dev_mode
 
         self.log.info(" ---- Caster: Initializing ----")
-        self._engine = self.init_engine()
-        self._dependency_manager = DependencyManager(self)
-
-        self._plugin_manager = PluginManager(self, self._config["plugins"],
-                                             plugin_state_dir)
-        self._context_manager = ContextManager(self, self._config["contexts"])
+        with profiler.phase("init_engine"):
+            self._engine = self.init_engine()
+        with profiler.phase("dependency_manager"):
+            self._dependency_manager = DependencyManager(self,
+                                                         package_cache_dir)
+        self._context_manager = None
+
+        with profiler.phase("plugin_manager"):
+            self._plugin_manager = PluginManager(self,
+                                                 self._config["plugins"],
+                                                 plugin_state_dir,
+                                                 grammar_cache_dir,
+                                                 execute_actions)
+        with profiler.phase("context_manager"):
+            self._context_manager = ContextManager(self,
+                                                   self._config["contexts"])
 
         self.log.info(" ---- Caster: Loading plugins ----")
-        self._plugin_manager.load_plugins()
+        with profiler.phase("load_plugins"):
+            self._plugin_manager.load_plugins()
+
+        # Reloaded `(config, diff)` waiting for its packages, installed
+        # one reload at a time by `_package_installer`
+        self._pending_reload = None
+        self._package_install = None
+        self._package_installer = None
+
+        self._config_reloader = None
+        if watch_config and isinstance(config_dir, str):
+            self._config_reloader = ConfigReloader(
+                    self, os.path.join(config_dir, "caster.yml"))
 
         Controller._controller = self
 
     plugin_manager = property(lambda self: self._plugin_manager,
                               doc="TODO")
 
+    context_manager = property(lambda self: self._context_manager,
+                               doc="Get context manager.")
+
     dependency_manager = property(lambda self: self._dependency_manager,
                                   doc="TODO")
 
@@ -86,11 +132,8 @@ class Controller:
 
         if isinstance(config_dir, str):
             try:
-                with open(config_dir + "/caster.yml", "r",
-                          encoding="utf-8") as ymlfile:
-                    config_from_file = yaml.load(ymlfile, Loader=Loader)
-                    if config_from_file is not None:
-                        config_result.update(config_from_file)
+                config_result.update(
+                        self.load_config_file(config_dir + "/caster.yml"))
             except yaml.YAMLError as error:
                 print(f"Error in configuration file: {error}")
             except FileNotFoundError as error:
@@ -101,12 +144,139 @@ class Controller:
                 self.create_config(config_dir)
                 return self.load_config(config, config_dir)
 
-        if "plugins" not in config_result:
-            config_result["plugins"] = {}
-        if "contexts" not in config_result:
-            config_result["contexts"] = []
+            # The file's configuration is already validated
+            if not isinstance(config, dict) and config_result:
+                return config_result
+
+        return validate_config(config_result)
+
+    def load_config_file(self, path):
+        """Load and validate configuration file `path`.
+
+        The validated configuration is kept in a snapshot next to the
+        file. As long as the file's content does not change the
+        configuration is restored from the snapshot instead of parsing
+        and validating the file.
+
+        :returns: Configuration dictionary
+
+        """
+        with open(path, "rb") as ymlfile:
+            content = ymlfile.read()
+
+        snapshot = ConfigSnapshot(path + ".snapshot")
+        key = snapshot.key(content)
+
+        config = snapshot.load(key)
+        if config is None:
+            self.log.info("Parsing configuration file '%s'", path)
+            config = validate_config(yaml.load(content, Loader=Loader))
+            snapshot.store(key, config)
+
+        return config
+
+    def reload_config(self):
+        """Apply changes of the configuration file.
+
+        Only the difference to the current configuration is applied.
+        Changed contexts are recompiled, plugins whose configuration
+        changed are swapped and added packages are installed. The
+        engine and unaffected plugins stay loaded.
 
-        return config_result
+        Added packages are installed in the background. The changes are
+        applied by `apply_pending_config` once they are installed.
+
+        :returns: `ConfigDiff` or `None` if the configuration could not
+                  be loaded
+
+        """
+        start = time.perf_counter()
+
+        config = dict(self._config_override or {})
+        try:
+            config.update(self.load_config_file(
+                    os.path.join(self._config_dir, "caster.yml")))
+            config = validate_config(config)
+        except (OSError, ValueError, yaml.YAMLError):
+            self.log.exception("Failed reloading configuration. Keeping"
+                               " current configuration.")
+            return None
+
+        diff = ConfigDiff(self._config, config)
+        if not diff:
+            return diff
+
+        self.log.info("Applying configuration changes: %s", diff)
+
+        for section in diff.restart_required:
+            self.log.warning("Changes of `%s` are applied after restarting"
+                             " Caster", section)
+
+        if diff.added_packages:
+            if self._package_installer is None:
+                self._package_installer = ThreadPoolExecutor(
+                        max_workers=1,
+                        thread_name_prefix="castervoice-packages")
+            # Supersedes a pending reload, its packages are part of
+            # this diff as well
+            self._pending_reload = (config, diff)
+            self._package_install = self._package_installer.submit(
+                    self._dependency_manager.install_packages,
+                    diff.added_packages)
+            self.log.info("Installing packages in the background: %s",
+                          diff.added_packages)
+            return diff
+
+        self._apply_config(config, diff, start)
+        return diff
+
+    def apply_pending_config(self, timeout=0):
+        """Apply a reloaded configuration once its packages are installed.
+
+        Must be called on the engine's thread. Called regularly by the
+        configuration file watcher.
+
+        :param timeout: Seconds to wait for the installation
+        :returns: `True` if a configuration was applied
+
+        """
+        if self._pending_reload is None:
+            return False
+        if not wait([self._package_install], timeout).done:
+            return False
+
+        config, diff = self._pending_reload
+        self._pending_reload = None
+        try:
+            failed = self._package_install.result()
+        except Exception:  # pylint: disable=W0703
+            self.log.exception("Failed installing packages")
+        else:
+            if failed:
+                self.log.error("Failed installing packages: %s", failed)
+
+        self._apply_config(config, diff, time.perf_counter())
+        return True
+
+    def _apply_config(self, config, diff, start):
+        plugins_config = config["plugins"]
+        for plugin_id in diff.changed_plugin_configs:
+            self._plugin_manager.set_config(
+                    plugin_id,
+                    (plugins_config.get("config") or {}).get(plugin_id))
+
+        if diff.contexts_changed:
+            self._context_manager.update_contexts(config["contexts"])
+            self._plugin_manager.load_plugins()
+
+        # Keep sections which require a restart as they are applied
+        for section in RESTART_PLUGIN_SECTIONS:
+            plugins_config[section] = self._config["plugins"].get(section)
+        config["engine"] = self._config.get("engine")
+        self._config = config
+
+        self.log.info("Applied configuration changes in %.3fs",
+                      time.perf_counter() - start)
 
     def create_config(self, config_dir):
         if not os.path.isdir(config_dir):
@@ -148,13 +318,19 @@ class Controller:
 
         return get_engine(**dragonfly_engine)
 
-    def listen(self, on_begin=None, on_recognition=None, on_failure=None):
+    def listen(self, on_begin=None, on_recognition=None, on_failure=None,
+               on_post_recognition=None):
         """TODO: Docstring for listen.
+
+        :param on_post_recognition: Called once a recognized rule's
+                                    actions were executed.
         :returns: TODO
 
         """
         with self._engine.connection():
-            self._engine.do_recognition(on_begin, on_recognition, on_failure)
+            self._engine.do_recognition(
+                    on_begin, on_recognition, on_failure,
+                    post_recognition_callback=on_post_recognition)
 
     @classmethod
     def get(cls):
@@ -1,51 +1,245 @@
 import builtins
+import functools
 import importlib
+import json
 import logging
 import os
+import re
 import site
 import subprocess
 import sys
+import tempfile
+import time
+import types
 
+from concurrent.futures import ThreadPoolExecutor
 from importlib import abc
 from dragonfly import get_current_engine
+import yaml
+
+from castervoice.core.file_watcher import create_file_watcher
+
+try:
+    from yaml import CLoader as Loader, CDumper as Dumper
+except ImportError:
+    from yaml import Loader, Dumper
+
+try:
+    from importlib import metadata
+except ImportError:  # Python < 3.8
+    metadata = None
+
+try:
+    from packaging.requirements import InvalidRequirement, Requirement
+except ImportError:
+    Requirement = None
 
 
 class DependencyManager():
 
     """Docstring for MyClass. """
 
-    def __init__(self, controller):
-        """TODO: to be defined. """
+    # Maximum number of packages downloaded or built concurrently.
+    # `None` uses the `ThreadPoolExecutor` default.
+    max_workers = None
+
+    def __init__(self, controller, package_cache_dir=None):
+        """
+
+        :param controller: Caster controller.
+        :param package_cache_dir: Directory holding the install manifest
+                                  and local wheel cache. Packages are
+                                  always installed with pip if `None`.
+
+        """
 
         self._controller = controller
 
+        self._manifest = PackageManifest(None)
+        self._wheel_dir = None
+        if package_cache_dir is not None:
+            self._wheel_dir = os.path.join(package_cache_dir, "wheels")
+            os.makedirs(self._wheel_dir, exist_ok=True)
+            self._manifest = PackageManifest(
+                    os.path.join(package_cache_dir, "manifest.yml"))
+
         if self._controller.dev_mode:
-            self.reloader = ModuleReloader()
+            self.reloader = ModuleReloader(controller)
 
     log = property(lambda self:
                    logging.getLogger("castervoice.DependencyManager"),
                    doc="TODO")
 
-    def install_package(self, package_config):
-        """TODO: Docstring for load_package.
+    manifest = property(lambda self: self._manifest,
+                        doc="Get package install manifest.")
 
-        :package_config: TODO
-        :returns: TODO
+    def install_packages(self, package_configs):
+        """Install packages which are not installed yet.
 
-        """
-        pip_pkg = package_config["pip"]
+        Wheels of all missing packages are downloaded or built
+        concurrently into the wheel cache before being installed
+        one after another.
 
-        install_command = [sys.executable, '-m', 'pip', 'install']
+        :param package_configs: List of package configurations
+        :returns: List of package configurations which failed installing
 
-        if self._controller.dev_mode and not pip_pkg.startswith('git+'):
-            install_command.append('-e')
-
-        install_command.append(pip_pkg)
-        subprocess.check_call(install_command)
+        """
+        missing = [package_config for package_config in package_configs
+                   if not self.is_satisfied(package_config["pip"])]
+
+        if not missing:
+            return []
+
+        if self._wheel_dir is not None:
+            with ThreadPoolExecutor(max_workers=self.max_workers) \
+                    as executor:
+                # Failures are ignored as the wheel cache may already
+                # contain the required wheels (e.g. when offline)
+                for package_config in missing:
+                    executor.submit(self._build_wheels, package_config["pip"])
+
+        failed = []
+        for package_config in missing:
+            try:
+                self.install_package(package_config)
+            except Exception:  # pylint: disable=W0703
+                self.log.exception("Failed loading package '%s'",
+                                   package_config)
+                failed.append(package_config)
 
         importlib.invalidate_caches()
         importlib.reload(site)
 
+        return failed
+
+    def is_satisfied(self, pip_pkg):
+        """Check whether `pip_pkg` is already installed.
+
+        :param pip_pkg: pip requirement specifier or URL
+        :returns: Boolean
+
+        """
+        if metadata is None:
+            return False
+
+        entry = self._manifest.get(pip_pkg)
+        if entry and entry.get("name") and entry.get("version"):
+            return _installed_version(entry["name"]) == entry["version"]
+
+        if Requirement is None:
+            return False
+
+        try:
+            requirement = Requirement(pip_pkg)
+        except InvalidRequirement:
+            return False
+
+        if requirement.url:
+            return False
+
+        version = _installed_version(requirement.name)
+        return version is not None \
+            and requirement.specifier.contains(version, prereleases=True)
+
+    def _editable(self, pip_pkg):
+        return self._controller.dev_mode and not pip_pkg.startswith('git+')
+
+    def _build_wheels(self, pip_pkg):
+        if self._editable(pip_pkg):
+            return
+
+        subprocess.run([sys.executable, '-m', 'pip', 'wheel', '--quiet',
+                        '--find-links', self._wheel_dir,
+                        '--wheel-dir', self._wheel_dir, pip_pkg],
+                       check=False)
+
+    def install_package(self, package_config):
+        """Install package with pip.
+
+        Uses the local wheel cache and falls back to installing
+        the cached wheel of a previously installed version when
+        the package index is not reachable.
+
+        :package_config: Package configuration
+        :raises subprocess.CalledProcessError: If pip fails
+
+        """
+        pip_pkg = package_config["pip"]
+
+        base_command = [sys.executable, '-m', 'pip', 'install']
+
+        if self._wheel_dir is not None:
+            base_command.extend(['--find-links', self._wheel_dir])
+
+        install_command = list(base_command)
+        with tempfile.TemporaryDirectory() as report_dir:
+            report_path = None
+            if _pip_supports_report():
+                report_path = os.path.join(report_dir, "report.json")
+                install_command.extend(['--report', report_path])
+
+            if self._editable(pip_pkg):
+                install_command.append('-e')
+
+            try:
+                subprocess.check_call(install_command + [pip_pkg])
+            except subprocess.CalledProcessError:
+                entry = self._manifest.get(pip_pkg)
+                if self._wheel_dir is None or not entry \
+                        or not entry.get("version"):
+                    raise
+                self.log.warning("Installing '%s' failed. Installing"
+                                 " cached version %s", pip_pkg,
+                                 entry["version"])
+                # The cached wheel, never the editable source
+                subprocess.check_call(
+                        base_command
+                        + ['--no-index',
+                           f"{entry['name']}=={entry['version']}"])
+                return
+
+            if report_path is None:
+                self._record_installed(pip_pkg)
+            else:
+                self._record(pip_pkg, report_path)
+
+    def _record_installed(self, pip_pkg):
+        """Record `pip_pkg` from the installed distribution's metadata.
+
+        Used with pip versions not supporting install reports. Only
+        requirements naming their distribution can be recorded.
+
+        """
+        if Requirement is None:
+            return
+        try:
+            requirement = Requirement(pip_pkg)
+        except InvalidRequirement:
+            self.log.debug("Can not record '%s' without a pip install"
+                           " report", pip_pkg)
+            return
+
+        version = _installed_version(requirement.name)
+        if version is not None:
+            self._manifest.record(pip_pkg, name=requirement.name,
+                                  version=version, source=requirement.url)
+
+    def _record(self, pip_pkg, report_path):
+        try:
+            with open(report_path, "r", encoding="utf-8") as report_file:
+                report = json.load(report_file)
+        except (OSError, ValueError):
+            self.log.debug("No pip install report for '%s'", pip_pkg)
+            return
+
+        for item in report.get("install", []):
+            if item.get("requested"):
+                self._manifest.record(
+                        pip_pkg,
+                        name=item["metadata"]["name"],
+                        version=item["metadata"]["version"],
+                        source=item.get("download_info", {}).get("url"))
+
     def watch_plugin(self, plugin_id, plugin_instance):
         """TODO: Docstring for watch_plugin.
 
@@ -53,135 +247,280 @@ class DependencyManager():
         :returns: TODO
 
         """
-        self.reloader.watched_plugin_modules[plugin_id] = plugin_instance
+        self.reloader.watch_plugin(plugin_id, plugin_instance)
+
+
+@functools.lru_cache(maxsize=None)
+def _pip_supports_report():
+    """Check whether pip supports `install --report` (pip>=22.2)."""
+    version = re.match(r"(\d+)\.(\d+)", _installed_version("pip") or "")
+    return version is not None \
+        and (int(version.group(1)), int(version.group(2))) >= (22, 2)
+
+
+def _installed_version(name):
+    if metadata is None:
+        return None
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+class PackageManifest():
+
+    """Records resolved name, version and source of installed packages."""
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._entries = {}
+
+        if self._file_path is None:
+            return
+
+        try:
+            with open(self._file_path, "r", encoding="utf-8") as ymlfile:
+                self._entries = yaml.load(ymlfile, Loader=Loader) or {}
+        except yaml.YAMLError as error:
+            print(f"Error in package manifest file: {error}")
+        except FileNotFoundError:
+            pass
+
+    def get(self, pip_pkg):
+        """Get recorded entry of `pip_pkg` or `None`."""
+        return self._entries.get(pip_pkg)
+
+    def record(self, pip_pkg, **entry):
+        """Record `entry` for `pip_pkg` and persist the manifest."""
+        self._entries[pip_pkg] = entry
+
+        if self._file_path is not None:
+            with open(self._file_path, "w", encoding="utf-8") as ymlfile:
+                ymlfile.write(yaml.dump(self._entries, Dumper=Dumper))
 
 
 class ModuleReloader(abc.MetaPathFinder):
+    # pylint: disable=too-many-instance-attributes
     """
         Credits:
             Jon Parise: https://github.com/jparise/python-reloader
     """
 
-    def __init__(self):
+    # Interval in seconds in which file changes are checked
+    CHECK_INTERVAL = 0.05
+
+    # Seconds without further changes before a burst of changes
+    # (e.g. an editor saving several files) triggers a reload
+    DEBOUNCE = 0.1
+
+    def __init__(self, controller=None):
+        """
+
+        :param controller: Caster controller whose plugins are hot
+                           swapped when their modules are reloaded.
+
+        """
+        self._controller = controller
+
         self._baseimport = builtins.__import__
         builtins.__import__ = self._import
 
-        self._parent = None
-
-        # Dictionary where key is the module name (e.g.
-        # 'casterplugin.dictation') and value contains the entries
-        # `module` (module object) and `dependencies`
-        # (list of modules which the module depends on)
-        self._modules = {}
+        # Import graph of source based modules. Maps a module name
+        # (e.g. 'casterplugin.dictation') to the names of modules it
+        # imports (`_dependencies`) and the names of modules importing
+        # it (`_dependents`).
+        self._dependencies = {}
+        self._dependents = {}
 
         self.watched_plugin_modules = {}
 
-        get_current_engine().create_timer(self.reload, 10)
+        self._watcher = create_file_watcher()
+        self._changed_files = set()
+        self._last_change = None
+
+        get_current_engine().create_timer(self.check, self.CHECK_INTERVAL)
 
     log = property(lambda self:
                    logging.getLogger("castervoice.ModuleReloader"),
                    doc="TODO")
 
     def __del__(self):
-        builtins.__import__ = self._baseimport
+        self.close()
+
+    def close(self):
+        """Uninstall the import hook."""
+        # Bound methods compare equal but are not identical
+        # pylint: disable=comparison-with-callable
+        if builtins.__import__ == self._import:
+            builtins.__import__ = self._baseimport
+
+    def watch_plugin(self, plugin_id, plugin_instance):
+        """Reload `plugin_instance` when any of its files change.
+
+        Only files of the plugin's module or package are watched.
+
+        """
+        self.watched_plugin_modules[plugin_id] = plugin_instance
+
+        module = sys.modules[plugin_id]
+        for path in getattr(module, '__path__', None) or [module.__file__]:
+            self._watcher.watch(path)
 
     # pylint: disable=too-many-arguments,redefined-builtin
+    # pylint: disable=too-many-positional-arguments
     def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
         """
             __import__() replacement function that tracks module dependencies.
         """
-        # Track our current parent module.  This is used to find our current
-        # place in the dependency graph.
-        parent = self._parent
-        self._parent = name
-
-        # Perform the actual import work using the base import function.
         base = self._baseimport(name, globals, locals, fromlist, level)
 
-        if base is not None:
-            m = base
-
-            # We manually walk through the imported hierarchy because the
-            # import function only returns the top-level package reference for
-            # a nested import statement (e.g. 'package' for
-            # `import package.module`) when no fromlist has been specified.
-            # It's possible that the package might not have all of its
-            # descendents as attributes, in which case we fall back to using
-            # the immediate ancestor of the module instead.
-            if fromlist is None:
-                for component in name.split('.')[1:]:
-                    try:
-                        m = getattr(m, component)
-                    except AttributeError:
-                        m = sys.modules[m.__name__ + '.' + component]
-
-            module = self._modules.setdefault(name, {})
-            module["module"] = m
-
-            if parent is not None:
-                parent_module = self._modules.setdefault(parent, {})
-                # If this is a nested import for a reloadable (source-based)
-                # module, we append ourself to our parent's dependency list.
-                if hasattr(m, '__file__'):
-                    deps = parent_module.setdefault("dependencies", [])
-                    deps.append(m)
-
-        # Lastly, we always restore our global _parent pointer.
-        self._parent = parent
+        # The importing module. `None` if `__import__` is called directly.
+        importer = globals.get('__name__') if globals else None
+
+        if importer is not None and base is not None:
+            if fromlist:
+                # `from package import module` depends on `package` and
+                # on `module` if it is a module.
+                self._add_dependency(importer, base)
+                for item in fromlist:
+                    value = getattr(base, item, None)
+                    if isinstance(value, types.ModuleType):
+                        self._add_dependency(importer, value)
+            else:
+                # The import function only returns the top-level package
+                # for `import package.module`
+                self._add_dependency(importer, sys.modules.get(name, base))
 
         return base
 
-    def reload(self):
-        """
-            Reloads all modules which have been modified since
-            the last time. Additionally reloads a plugin if the
-            changed module is part of the plugin module/package.
-        """
-        changed_modules = []
-        plugins_to_reload = []
+    def _add_dependency(self, importer, module):
+        name = module.__name__
+        if name == importer or getattr(module, '__file__', None) is None:
+            return
 
-        self.log.debug('Checking for changed modules to be reloaded')
+        dependencies = self._dependencies.get(importer)
+        if dependencies is None:
+            dependencies = self._dependencies[importer] = set()
 
-        for name, info in self._modules.items():
+        if name not in dependencies:
+            dependencies.add(name)
+            self._dependents.setdefault(name, set()).add(importer)
 
-            if 'module' not in info or not name:
-                continue
+    def dependencies(self, name):
+        """Get names of modules imported by module `name`."""
+        return frozenset(self._dependencies.get(name, ()))
 
-            m = info['module']
+    def dependents(self, names):
+        """Get `names` and the names of all transitively dependent modules.
 
-            # It is a package
-            if not hasattr(m, '__file__'):
-                continue
+        :param names: Module names
+        :returns: Set of module names
 
-            if 'last_changed' not in info:
-                self.set_changed_time(name)
+        """
+        result = set(names)
+        pending = list(result)
+        while pending:
+            for dependent in self._dependents.get(pending.pop(), ()):
+                if dependent not in result:
+                    result.add(dependent)
+                    pending.append(dependent)
+        return result
+
+    def reload_order(self, names):
+        """Order module `names` such that dependencies come first.
+
+        Modules within import cycles are ordered by name.
+
+        :param names: Module names
+        :returns: List of module names
+
+        """
+        names = set(names)
+        remaining = {name: len(self._dependencies.get(name, set()) & names)
+                     for name in names}
+
+        order = []
+        ready = sorted(name for name, count in remaining.items()
+                       if count == 0)
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            del remaining[name]
+            for dependent in sorted(self._dependents.get(name, ())):
+                if dependent in remaining:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        ready.append(dependent)
+
+        return order + sorted(remaining)
+
+    def check(self):
+        """
+            Collects file changes and reloads once no further changes
+            occurred for `DEBOUNCE` seconds.
+        """
+        changed_files = self._watcher.changes()
+        now = time.monotonic()
+
+        if changed_files:
+            self._changed_files |= changed_files
+            self._last_change = now
+        elif self._changed_files and \
+                now - self._last_change >= self.DEBOUNCE:
+            changed_files = self._changed_files
+            self._changed_files = set()
+            self.reload(changed_files)
+
+    def reload(self, changed_files):
+        """
+            Reloads the modules of `changed_files` and all modules
+            depending on them, dependencies first. Additionally reloads
+            a plugin if a reloaded module is part of the plugin
+            module/package.
+        """
+        self.log.debug('Files changed: %s', changed_files)
+
+        # Plugin modules are imported with `importlib.import_module`
+        # which bypasses the import hook. Look up all loaded modules.
+        changed_modules = {
+                name for name, m in list(sys.modules.items())
+                if getattr(m, '__file__', None) is not None
+                and os.path.abspath(m.__file__) in changed_files}
+
+        affected = self.dependents(changed_modules)
+
+        plugins_to_reload = {
+                plugin_id: plugin for plugin_id, plugin
+                in self.watched_plugin_modules.items()
+                if any(str.startswith(name, plugin_id) for name in affected)}
+
+        if not affected:
+            return
+
+        # The plugin module itself must be reloaded to pick up changes
+        # of its package
+        affected = self.dependents(affected | plugins_to_reload.keys())
+
+        # Plugins keep running on their current modules' code while
+        # modules are reloaded and replacement plugins are built
+        for name in self.reload_order(affected):
+            module = sys.modules.get(name)
+            if module is None:
                 continue
 
-            if os.path.getmtime(m.__file__) > info['last_changed']:
-                changed_modules.append(m)
-                self.set_changed_time(name)
-
-                for plugin_id, plugin_instance in self. \
-                        watched_plugin_modules.items():
-                    if str.startswith(name, plugin_id):
-                        plugins_to_reload.append(plugin_instance)
-
-        if changed_modules:
-            for plugin in plugins_to_reload:
-                self.log.info('Disabling and unloading plugin %s', plugin)
-                plugin.disable()
-                plugin.unload()
-
-            for rel in changed_modules:
-                self.log.info('Reloading changed module %s', rel)
-                importlib.reload(rel)
-
-            for plugin in plugins_to_reload:
-                self.log.info('Reloading plugin module %s', plugin.__module__)
-                importlib.reload(sys.modules[plugin.__module__])
-                plugin.load()
-
-    def set_changed_time(self, name):
-        m = self._modules[name]['module']
-        last_changed = os.path.getmtime(m.__file__)
-        self._modules[name]['last_changed'] = last_changed
+            self.log.info('Reloading module %s', name)
+            try:
+                importlib.reload(module)
+            except Exception:  # pylint: disable=W0703
+                self.log.exception('Failed reloading module %s. Keeping'
+                                   ' plugins %s running on their current'
+                                   ' version.', name,
+                                   list(plugins_to_reload))
+                return
+
+        if self._controller is None:
+            return
+
+        for plugin_id in plugins_to_reload:
+            self.log.info('Swapping plugin %s', plugin_id)
+            self._controller.plugin_manager.swap_plugin(plugin_id)
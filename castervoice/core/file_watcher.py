@@ -0,0 +1,228 @@
+"""
+
+Watch files for changes.
+
+`create_file_watcher` returns an inotify based watcher on Linux and
+falls back to polling file modification times elsewhere.
+
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+import time
+
+
+class FileWatcher():
+
+    """Base class of file watchers.
+
+    A watched path is either a single file or a directory whose
+    files are watched recursively.
+
+    """
+
+    def __init__(self):
+        self._files = set()
+        self._directories = set()
+
+    log = property(lambda self: logging.getLogger("castervoice.FileWatcher"),
+                   doc="Get class logger.")
+
+    def watch(self, path):
+        """Watch `path` for changes.
+
+        :param path: File or directory
+
+        """
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            self._directories.add(path)
+        else:
+            self._files.add(path)
+
+    def is_watched(self, path):
+        """Check whether a change of `path` is reported."""
+        if path in self._files:
+            return True
+        return any(path.startswith(directory + os.sep)
+                   for directory in self._directories)
+
+    def changes(self):
+        """Get changed files since the last call without blocking.
+
+        :returns: Set of changed file paths
+
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Release watcher resources."""
+
+
+class PollingWatcher(FileWatcher):
+
+    """Polls modification times of watched files.
+
+    Polling happens at most every `interval` seconds.
+
+    """
+
+    def __init__(self, interval=0.5):
+        super().__init__()
+
+        self._interval = interval
+        self._last_poll = 0
+        self._mtimes = {}
+
+    def watch(self, path):
+        super().watch(path)
+        self._mtimes.update(self._scan())
+
+    def _paths(self):
+        yield from self._files
+        for directory in self._directories:
+            for root, _, names in os.walk(directory):
+                for name in names:
+                    yield os.path.join(root, name)
+
+    def _scan(self):
+        mtimes = {}
+        for path in self._paths():
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                pass
+        return mtimes
+
+    def changes(self):
+        now = time.monotonic()
+        if now - self._last_poll < self._interval:
+            return set()
+        self._last_poll = now
+
+        mtimes = self._scan()
+        changed = {path for path in mtimes.keys() | self._mtimes.keys()
+                   if mtimes.get(path) != self._mtimes.get(path)}
+        self._mtimes = mtimes
+        return changed
+
+
+class InotifyWatcher(FileWatcher):
+
+    """Linux inotify based watcher.
+
+    Directories of watched paths are watched, events of files which
+    are not watched are discarded.
+
+    """
+
+    # See inotify(7)
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_ISDIR = 0x40000000
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE \
+        | IN_DELETE
+
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        super().__init__()
+
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # Watch descriptor -> directory
+        self._watches = {}
+
+    def _add_watch(self, directory):
+        if directory in self._watches.values():
+            return
+
+        wd = self._libc.inotify_add_watch(self._fd,
+                                          os.fsencode(directory),
+                                          self.MASK)
+        if wd < 0:
+            self.log.warning("Unable to watch '%s': %s", directory,
+                             os.strerror(ctypes.get_errno()))
+            return
+        self._watches[wd] = directory
+
+    def watch(self, path):
+        super().watch(path)
+
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            for root, _, _ in os.walk(path):
+                self._add_watch(root)
+        else:
+            self._add_watch(os.path.dirname(path))
+
+    def changes(self):
+        changed = set()
+
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+                offset += self._EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+
+                directory = self._watches.get(wd)
+                if directory is None:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+
+                if mask & self.IN_ISDIR:
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO) \
+                            and self.is_watched(path):
+                        self.watch(path)
+                    continue
+
+                if self.is_watched(path):
+                    changed.add(path)
+
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __del__(self):
+        self.close()
+
+
+def _load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    return libc
+
+
+def create_file_watcher():
+    """Create inotify based watcher if available, else polling watcher."""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as error:
+            logging.getLogger("castervoice.FileWatcher") \
+                .info("inotify unavailable, falling back to polling: %s",
+                      error)
+    return PollingWatcher()
@@ -0,0 +1,249 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import threading
+
+try:
+    from importlib import metadata
+except ImportError:  # Python < 3.8
+    metadata = None
+
+
+class GrammarCache():
+
+    """
+
+    Persistent cache of built plugin grammars.
+
+    Grammars are stored per plugin, keyed by a hash of the plugin's
+    package source, the plugin's configuration and the engine type.
+    A plugin whose key is unchanged since a previous start is restored
+    from the cache instead of calling `Plugin.get_grammars`.
+
+    Only plugins setting `Plugin.grammars_cacheable` are cached.
+    Grammars which can not be serialized (e.g. because an action
+    references a lambda) are not cached and rebuilt on every start.
+
+    The cache is bounded to `max_size` bytes. Least recently used
+    entries are evicted first.
+
+    """
+
+    SUFFIX = ".grammars"
+
+    def __init__(self, directory, engine, max_size=100 * 1024 * 1024):
+        """
+
+        :param directory: Cache directory
+        :param engine: Engine grammars are built for
+        :param max_size: Maximum cache size in bytes
+
+        """
+
+        self._directory = directory
+        self._engine = engine
+        self._max_size = max_size
+
+        self._lock = threading.Lock()
+        # path -> `(stamp, hash)` of the sources below path
+        self._source_hashes = {}
+
+        if not os.path.exists(self._directory):
+            os.makedirs(self._directory)
+        elif not os.path.isdir(self._directory):
+            raise NotADirectoryError("Grammar cache directory"
+                                     f" '{self._directory}'"
+                                     " must be a directory!")
+
+    directory = property(lambda self: self._directory,
+                         doc="Get cache directory.")
+
+    log = property(lambda self: logging.getLogger("castervoice.GrammarCache"),
+                   doc="Get class logger.")
+
+    def key(self, plugin):
+        """Compute cache key of `plugin`.
+
+        :param plugin: Plugin
+        :returns: Hex digest
+
+        """
+        dragonfly_version = None
+        if metadata is not None:
+            try:
+                dragonfly_version = metadata.version("dragonfly2")
+            except metadata.PackageNotFoundError:
+                pass
+
+        digest = hashlib.sha256()
+        digest.update(self._source_hash(plugin.id).encode())
+        digest.update(json.dumps([plugin.id, plugin.config,
+                                  self._engine.name,
+                                  dragonfly_version,
+                                  sys.version_info[:2]],
+                                 sort_keys=True, default=repr).encode())
+        return digest.hexdigest()
+
+    def _source_hash(self, plugin_id):
+        # A plugin may use any module of its top level package
+        package = sys.modules[plugin_id.split('.')[0]]
+        paths = getattr(package, '__path__', None) or [package.__file__]
+
+        hashes = []
+        with self._lock:
+            for path in paths:
+                # Only sources changed since they were last hashed (e.g.
+                # edited before reloading the plugin) are hashed again
+                files = _source_files(path)
+                stamp = _stamp(files)
+                cached = self._source_hashes.get(path)
+                if cached is None or cached[0] != stamp:
+                    cached = (stamp, _hash_sources(files))
+                    self._source_hashes[path] = cached
+                hashes.append(cached[1])
+        return ''.join(hashes)
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + self.SUFFIX)
+
+    def load(self, plugin):
+        """Restore `plugin`'s grammars.
+
+        :param plugin: Plugin
+        :returns: List of `Grammar` or `None` if not cached
+
+        """
+        path = self._path(self.key(plugin))
+
+        try:
+            with open(path, 'rb') as cache_file:
+                grammars = _Unpickler(cache_file, self._engine,
+                                      plugin).load()
+        except FileNotFoundError:
+            return None
+        except Exception:  # pylint: disable=W0703
+            self.log.exception("Discarding invalid cache entry of"
+                               " plugin '%s'", plugin.id)
+            self._remove(path)
+            return None
+
+        # Mark as recently used
+        os.utime(path)
+
+        self.log.info("Restored grammars of plugin '%s' from cache",
+                      plugin.id)
+        return grammars
+
+    def store(self, plugin, grammars):
+        """Cache `plugin`'s grammars.
+
+        Must be called before the grammars are loaded into the engine.
+
+        :param plugin: Plugin
+        :param grammars: List of `Grammar`
+
+        """
+        buffer = io.BytesIO()
+        try:
+            _Pickler(buffer, self._engine, plugin).dump(grammars)
+        except Exception as error:  # pylint: disable=W0703
+            self.log.debug("Grammars of plugin '%s' can not be cached: %s",
+                           plugin.id, error)
+            return
+
+        path = self._path(self.key(plugin))
+        try:
+            with tempfile.NamedTemporaryFile(dir=self._directory,
+                                             delete=False) as cache_file:
+                cache_file.write(buffer.getvalue())
+            os.replace(cache_file.name, path)
+        except OSError:
+            self.log.exception("Failed caching grammars of plugin '%s'",
+                               plugin.id)
+            return
+
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self._directory):
+                if entry.name.endswith(self.SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            size = sum(entry[1] for entry in entries)
+            for _, entry_size, path in sorted(entries):
+                if size <= self._max_size:
+                    break
+                self.log.debug("Evicting grammar cache entry '%s'", path)
+                self._remove(path)
+                size -= entry_size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _source_files(path):
+    if os.path.isfile(path):
+        return [path]
+    return sorted(os.path.join(root, name)
+                  for root, _, names in os.walk(path)
+                  for name in names if name.endswith('.py'))
+
+
+def _stamp(files):
+    stamp = []
+    for file_path in files:
+        stat = os.stat(file_path)
+        stamp.append((file_path, stat.st_mtime_ns, stat.st_size))
+    return tuple(stamp)
+
+
+def _hash_sources(files):
+    digest = hashlib.sha256()
+    for file_path in files:
+        digest.update(file_path.encode())
+        with open(file_path, 'rb') as source_file:
+            digest.update(source_file.read())
+    return digest.hexdigest()
+
+
+class _Pickler(pickle.Pickler):
+
+    """Replaces references to live objects with persistent ids."""
+
+    def __init__(self, file, engine, plugin):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self._engine = engine
+        self._plugin = plugin
+
+    def persistent_id(self, obj):
+        if obj is self._engine:
+            return "engine"
+        if obj is self._plugin:
+            return "plugin"
+        return None
+
+
+class _Unpickler(pickle.Unpickler):
+
+    def __init__(self, file, engine, plugin):
+        super().__init__(file)
+        self._objects = {"engine": engine, "plugin": plugin}
+
+    def persistent_load(self, pid):
+        try:
+            return self._objects[pid]
+        except KeyError as error:
+            raise pickle.UnpicklingError(f"Unknown persistent id: {pid}") \
+                from error
@@ -1,11 +1,16 @@
+import copy
 import logging
 import os
 import yaml
 
 try:
-    from yaml import CLoader as Loader, CDumper as Dumper
+    from yaml import CLoader as Loader
 except ImportError:
-    from yaml import Loader, Dumper
+    from yaml import Loader
+
+from castervoice.core import profiler
+from castervoice.core.plugin.state_writer import write_atomic
+from castervoice.metrics import recognition_metrics
 
 
 class Plugin():
@@ -21,6 +26,20 @@ class Plugin():
 
     """
 
+    # Plugins whose `get_grammars` has no side effects besides
+    # returning grammars can set this to allow restoring their
+    # grammars from the grammar cache instead of rebuilding them.
+    grammars_cacheable = False
+
+    # Plugins whose actions may take a while (e.g. running processes
+    # or network requests) can set this to execute their actions on
+    # the manager's action queue instead of blocking recognition.
+    queue_actions = False
+
+    # Seconds a queued action may wait before it is dropped. Overrides
+    # the queue's default timeout if set.
+    action_timeout = None
+
     def __init__(self, manager):
 
         self._id = self.__class__.__module__
@@ -34,10 +53,13 @@ class Plugin():
         self._context = None
 
         self._state = None
-        if self._manager and self._manager.state_directory:
+        if self._manager and self._manager.state_store is not None:
+            self._state = self._manager.state_store.plugin_state(self._id)
+        elif self._manager and self._manager.state_directory:
             self._state = PluginState(os.path
                                       .join(self._manager.state_directory,
-                                            f"{self._id}.state"))
+                                            f"{self._id}.state"),
+                                      self._manager.state_writer)
 
         self._init_context()
 
@@ -58,12 +80,20 @@ class Plugin():
                      set_state,
                      doc="Plugin state.")
 
-    config = property(lambda self: self._manager.get_config(self._id),
+    config = property(lambda self: self._manager.get_config(self._id)
+                      if self._manager else None,
                       doc="Plugin config.")
 
     grammars = property(lambda self: self._grammars,
                         doc="Plugin grammars.")
 
+    context = property(lambda self: self._context,
+                       doc="Plugin context.")
+
+    loaded = property(lambda self: self._loaded,
+                      doc="Boolean indicating whether the plugin's grammars"
+                          " are loaded.")
+
     def persist_state(self):
         self._state.persist()
 
@@ -79,35 +109,141 @@ class Plugin():
         except NotImplementedError:
             return
 
-    def load(self):
-        """Load plugin's grammars."""
+    def build(self):
+        """Build plugin's grammars without loading them into the engine.
+
+        Building does not touch the engine or the manager's grammar
+        index and may therefore run concurrently with building other
+        plugins. Grammars are registered with the manager by `load`.
+
+        """
+        if self._loaded or self._grammars:
+            return
+
+        grammars = None
+        if self._manager is not None:
+            with profiler.phase("restore_grammars", self._id):
+                grammars = self._manager.restore_grammars(self)
+
+        if grammars is None:
+            with profiler.phase("get_grammars", self._id):
+                grammars = self.get_grammars()
+            if self._manager is not None:
+                with profiler.phase("cache_grammars", self._id):
+                    self._manager.cache_grammars(self, grammars)
+
+        for grammar in grammars:
+            self.log.info("Adding grammar: %s(%s)",
+                          self._name, grammar.name)
+            self._grammars.append(grammar)
+
+    def load(self, enabled=True):
+        """Load plugin's grammars.
+
+        :param enabled: Load grammars enabled. Disabled grammars are
+                        loaded into the engine but do not process
+                        recognitions until the plugin is enabled.
+
+        """
         if not self._loaded:
             self.log.info("Loading ...")
 
-            assert not self._grammars
+            self.build()
 
-            for grammar in self.get_grammars():
-                self.log.info("Adding grammar: %s(%s)",
-                              self._name, grammar.name)
-                self._grammars.append(grammar)
+            if self._manager is not None:
+                for grammar in self._grammars:
+                    self._manager.register_grammar(self, grammar)
 
-            self.apply_context()
+            with profiler.phase("apply_context", self._id):
+                self.apply_context()
 
-            for grammar in self._grammars:
-                grammar.load()
+            if self._manager is not None:
+                for grammar in self._grammars:
+                    for rule in grammar.rules:
+                        self._redirect_rule(rule)
+
+            with profiler.phase("grammar_load", self._id):
+                for grammar in self._grammars:
+                    if not enabled:
+                        grammar.disable()
+                    grammar.load()
 
             self._loaded = True
 
+    def _redirect_rule(self, rule):
+        """Forward recognitions of `rule` to the manager instead of
+        executing its actions if the manager does not execute actions,
+        or execute them on the manager's action queue if requested.
+
+        The rule's own `process_recognition` is kept on the rule and
+        wrapped only once, even if the rule is loaded again. `unload`
+        restores it.
+
+        """
+        process_recognition = getattr(rule, "_caster_process_recognition",
+                                      None)
+        if process_recognition is None:
+            process_recognition = rule.process_recognition
+
+        def forward_recognition(node):
+            self._manager.forward_recognition(self, rule, node)
+
+        def queue_recognition(node):
+            # The recognition callback returns before the actions were
+            # executed, the worker records the execution latency
+            recognized = recognition_metrics.defer_execution()
+
+            def execute():
+                try:
+                    process_recognition(node)
+                finally:
+                    recognition_metrics.on_executed(recognized)
+
+            self._manager.action_queue.submit(self._id, execute,
+                                              self.action_timeout)
+
+        if not self._manager.execute_actions:
+            rule.process_recognition = forward_recognition
+        elif self.queue_actions and self._manager.action_queue is not None:
+            rule.process_recognition = queue_recognition
+        else:
+            return
+        # pylint: disable=protected-access
+        rule._caster_process_recognition = process_recognition
+
+    @staticmethod
+    def _restore_rule(rule):
+        """Undo `_redirect_rule`."""
+        process_recognition = rule.__dict__.pop("_caster_process_recognition",
+                                                None)
+        if process_recognition is not None:
+            rule.process_recognition = process_recognition
+
     def unload(self):
         """Unload plugin's grammars."""
         if self._loaded:
             self.log.info("Unloading ...")
-            while len(self._grammars) > 0:
-                _ = self._grammars.pop()
-                del _
+            self.discard()
 
-            self._grammars = []
-            self._loaded = False
+    def discard(self):
+        """Unload and forget all grammars built by the plugin.
+
+        Unlike `unload` this also cleans up after a failed `build` or
+        `load`, which may have left some grammars built or loaded.
+
+        """
+        while len(self._grammars) > 0:
+            _ = self._grammars.pop()
+            if _.loaded:
+                _.unload()
+            for rule in _.rules:
+                self._restore_rule(rule)
+            if self._manager is not None:
+                self._manager.unregister_grammar(_)
+            del _
+
+        self._grammars = []
+        self._loaded = False
 
     def enable(self):
         """Enable plugin."""
@@ -118,6 +254,8 @@ class Plugin():
             for rule in grammar.rules:
                 rule.enable()
 
+        self.invalidate_context()
+
     def disable(self):
         """Disable plugin."""
         for grammar in self._grammars:
@@ -127,6 +265,18 @@ class Plugin():
                 rule.disable()
             grammar.disable()
 
+        self.invalidate_context()
+
+    def invalidate_context(self):
+        """Evaluate contexts anew on the next check.
+
+        Called when the plugin is enabled or disabled. Contexts provided
+        by plugins are evaluated on every check and do not require this.
+
+        """
+        if self._manager is not None:
+            self._manager.invalidate_contexts()
+
     def get_grammars(self):
         """Gather plugins' grammars.
 
@@ -147,6 +297,9 @@ class Plugin():
         the desired state. It is up to the plugin to document which
         context configurations are available.
 
+        The returned context is checked on every recognition, so it may
+        depend on the plugin's state. Keep its `matches` cheap.
+
         :param desired_state: Desired context state configuration
         :returns: Context
 
@@ -202,10 +355,27 @@ class PluginFile:
 
 class PluginState(PluginFile):
 
-    def __init__(self, file_path):
+    """Plugin state persisted to a YAML file.
+
+    With a `StateWriter` the state is written in the background,
+    otherwise `persist` writes it immediately.
+
+    """
+
+    def __init__(self, file_path, writer=None):
         self._file_path = file_path
+        self._writer = writer
         super().__init__(file_path)
 
+        # The last persisted state may not be written yet
+        if self._writer is not None:
+            self._data = copy.deepcopy(self._writer.pending(file_path,
+                                                            self._data))
+
     def persist(self):
-        with open(self._file_path, 'w', encoding="utf-8") as ymlfile:
-            ymlfile.write(yaml.dump(self._data, Dumper=Dumper))
+        if self._writer is None:
+            write_atomic(self._file_path, self._data)
+        else:
+            # Snapshot as the plugin may continue modifying its state
+            self._writer.schedule(self._file_path,
+                                  copy.deepcopy(self._data))
@@ -1,13 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
 from inspect import getmembers, isclass
 import copy
 import importlib
 import logging
 import os
+import sys
+import time
 
+from dragonfly import Window, get_current_engine
+
+from castervoice.core import profiler
+from castervoice.core.action_queue import ActionQueue
+from castervoice.core.plugin.grammar_cache import GrammarCache
 from castervoice.core.plugin.plugin import Plugin
+from castervoice.core.plugin.state_store import StateStore
+from castervoice.core.plugin.state_writer import StateWriter
 
 
 class PluginManager():
+    # pylint: disable=too-many-instance-attributes,too-many-public-methods
 
     """
 
@@ -20,12 +31,29 @@ class PluginManager():
 
     """
 
-    def __init__(self, controller, config, state_directory):
+    # Maximum number of threads used to import plugins and build
+    # their grammars. `None` uses the `ThreadPoolExecutor` default.
+    max_workers = None
+
+    # Default interval in seconds in which lazy plugins are checked
+    # against the foreground window
+    LAZY_CHECK_INTERVAL = 0.25
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, controller, config, state_directory,
+                 grammar_cache_directory=None, execute_actions=True):
         """
 
         :param controller: Caster controller.
         :param config: Plugins configuration.
         :param state_directory: Directory used for plugin states.
+        :param grammar_cache_directory: Directory used to cache plugin
+                                        grammars. No cache is used
+                                        if `None`.
+        :param execute_actions: Execute actions of recognized rules.
+                                Otherwise recognitions are passed to
+                                `recognition_forwarder`, e.g. to be
+                                executed by a remote client.
 
         """
 
@@ -35,6 +63,18 @@ class PluginManager():
 
         self._plugins = {}
         self._plugin_configs = {}
+        self._applied_contexts = {}
+
+        # Reverse index of loaded grammars to their owning plugin.
+        # Kept up to date by `Plugin.load` and `Plugin.unload`.
+        self._grammar_plugins = {}
+
+        # Plugins which are only loaded once their context matches
+        self._lazy_plugins = set()
+        self._lazy_idle_timeout = None
+        self._lazy_check_interval = None
+        self._lazy_last_active = {}
+        self._lazy_timer = None
 
         self._state_directory = state_directory
         if self._state_directory is not None:
@@ -45,17 +85,87 @@ class PluginManager():
                                          f" '{self._state_directory}'"
                                          " must be a directory!")
 
+        self._state_writer = None
+        self._state_store = None
+        self._action_queue = None
+
+        self._execute_actions = execute_actions
+        self._recognition_forwarder = None
+
+        self._grammar_cache = None
+        self._grammar_cache_directory = grammar_cache_directory
+
         self._init_plugins(config)
 
+        # Lazy grammars must be loaded before an utterance begins, the
+        # engine fixes the set of active grammars at its beginning
+        if self._lazy_plugins and self._lazy_check_interval:
+            self._lazy_timer = get_current_engine() \
+                .create_timer(self._check_foreground,
+                              self._lazy_check_interval)
+
     plugins = property(lambda self: self._plugins,
                        doc="Retrieve list of initialized plugins.")
 
+    resident_plugins = property(lambda self: {
+                                    plugin_id: plugin for plugin_id, plugin
+                                    in self._plugins.items() if plugin.loaded
+                                },
+                                doc="Retrieve plugins whose grammars are"
+                                    " loaded.")
+
+    lazy_plugins = property(lambda self: frozenset(self._lazy_plugins),
+                            doc="Ids of plugins loaded once their context"
+                                " matches.")
+
     log = property(lambda self: logging.getLogger("castervoice.PluginManager"),
                    doc="Get class logger.")
 
     state_directory = property(lambda self: self._state_directory,
                                doc="Get plugin state directory.")
 
+    state_store = property(lambda self: self._state_store,
+                           doc="Get `StateStore` holding plugin states."
+                               " `None` if states are kept in YAML"
+                               " files.")
+
+    state_writer = property(lambda self: self._state_writer,
+                            doc="Get `StateWriter` persisting plugin"
+                                " states in the background.")
+
+    action_queue = property(lambda self: self._action_queue,
+                            doc="Get `ActionQueue` executing actions of"
+                                " plugins with `queue_actions` set. `None`"
+                                " if all actions are executed"
+                                " synchronously.")
+
+    execute_actions = property(lambda self: self._execute_actions,
+                               doc="Boolean indicating whether actions of"
+                                   " recognized rules are executed.")
+
+    def set_recognition_forwarder(self, forwarder):
+        self._recognition_forwarder = forwarder
+
+    recognition_forwarder = property(
+            lambda self: self._recognition_forwarder,
+            set_recognition_forwarder,
+            doc="Callable receiving `(plugin, rule, node)` of recognitions"
+                " whose actions are not executed.")
+
+    def forward_recognition(self, plugin, rule, node):
+        """Pass a recognition to the `recognition_forwarder`.
+
+        :param plugin: Plugin owning `rule`
+        :param rule: Recognized rule
+        :param node: Root node of the recognition
+
+        """
+        if self._recognition_forwarder is None:
+            self.log.warning("Dropped recognition of %s: No forwarder",
+                             rule.name)
+            return
+        self._recognition_forwarder(plugin, rule, node)
+
     def _init_plugins(self, config):
         """Initialize plugins from configuration.
 
@@ -66,24 +176,93 @@ class PluginManager():
         if self._initialized:
             return
 
-        local_config = copy.deepcopy(config)
-
-        packages = local_config.pop('packages', [])
-        for package_config in packages:
-            try:
-                self._controller.dependency_manager. \
-                    install_package(package_config)
-            except Exception:  # pylint: disable=W0703
-                self.log.exception("Failed loading package '%s'",
-                                   package_config)
-                continue
-
-        plugin_configs = local_config.pop('config', {})
+        packages = config.get('packages', [])
+        if packages:
+            with profiler.phase("install_packages"):
+                self._controller.dependency_manager \
+                    .install_packages(packages)
+
+        lazy_config = config.get('lazy', None) or {}
+        self._lazy_plugins = set(lazy_config.get('plugins', []))
+        self._lazy_idle_timeout = lazy_config.get('idle_timeout')
+        self._lazy_check_interval = lazy_config.get('check_interval',
+                                                    self.LAZY_CHECK_INTERVAL)
+
+        state_config = config.get('state', None) or {}
+        backend = state_config.get('backend', 'yaml')
+        if self._state_directory is None:
+            pass
+        elif backend == 'sqlite':
+            self._state_store = StateStore(
+                    os.path.join(self._state_directory,
+                                 StateStore.FILE_NAME))
+            self._state_store.migrate(self._state_directory)
+        elif backend != 'yaml':
+            raise ValueError(f"Unknown plugin state backend '{backend}'")
+        elif state_config.get('write_behind', True):
+            self._state_writer = StateWriter(
+                    state_config.get('flush_interval', 1.0))
+
+        actions_config = config.get('actions', None) or {}
+        workers = actions_config.get('workers', 4)
+        if workers:
+            self._action_queue = ActionQueue(workers,
+                                             actions_config.get('timeout'))
+
+        cache_config = config.get('grammar_cache', None) or {}
+        if self._grammar_cache_directory is not None \
+                and cache_config.get('enabled', True):
+            self._grammar_cache = GrammarCache(
+                    self._grammar_cache_directory,
+                    self._controller.engine,
+                    cache_config.get('max_size', 100) * 1024 * 1024)
+
+        # Plugins get their own copy, the loaded configuration is kept
+        # intact to compare it with reloaded configurations
+        plugin_configs = config.get('config', {})
         for plugin_id, plugin_config in plugin_configs.items():
-            self._plugin_configs[plugin_id] = plugin_config
+            self._plugin_configs[plugin_id] = copy.deepcopy(plugin_config)
 
         self._initialized = True
 
+    def _executor(self):
+        # The development mode import hook tracks dependencies of the
+        # module currently being imported and can not handle
+        # concurrent imports.
+        if self._controller is not None and self._controller.dev_mode:
+            return ThreadPoolExecutor(max_workers=1)
+        # Memory can only be attributed to plugins if they are
+        # processed one after another
+        if profiler.active():
+            return ThreadPoolExecutor(max_workers=1)
+        return ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def import_plugins(self, plugin_ids):
+        """Import plugin modules concurrently.
+
+        Import failures are not reported here. They are reported
+        by `init_plugin` which retries the import.
+
+        :param plugin_ids: Plugin Ids
+
+        """
+        plugin_ids = [plugin_id for plugin_id in dict.fromkeys(plugin_ids)
+                      if plugin_id not in self._plugins]
+
+        with self._executor() as executor:
+            futures = [executor.submit(self._import_plugin, plugin_id)
+                       for plugin_id in plugin_ids]
+
+        for plugin_id, future in zip(plugin_ids, futures):
+            if future.exception() is not None:
+                self.log.debug("Deferring import failure of plugin '%s'",
+                               plugin_id)
+
+    @staticmethod
+    def _import_plugin(plugin_id):
+        with profiler.phase("import", plugin_id):
+            return importlib.import_module(plugin_id)
+
     def init_plugin(self, plugin_id):
         """Initialize plugin.
 
@@ -95,39 +274,253 @@ class PluginManager():
             return
 
         try:
-            plugin_module = importlib.import_module(plugin_id)
-        except ModuleNotFoundError:
+            plugin_instance = self._create_plugin(plugin_id)
+        except Exception:  # pylint: disable=W0703
             self.log.exception("Failed loading plugin '%s'", plugin_id)
             return
 
+        if plugin_instance is None:
+            return
+
+        self._plugins[plugin_id] = plugin_instance
+
+        if self._controller is not None and self._controller.dev_mode:
+            self._controller.dependency_manager. \
+                watch_plugin(plugin_id, plugin_instance)
+
+    def _create_plugin(self, plugin_id):
+        """Instantiate plugin from the plugin's current module.
+
+        :param plugin_id: Plugin Id
+        :returns: Plugin or `None` if the module does not define a plugin
+
+        """
+        plugin_module = importlib.import_module(plugin_id)
+
+        plugin_instance = None
         for name, value in getmembers(plugin_module, isclass):
             if issubclass(value, Plugin) and not value == Plugin \
                     and value.__module__ == plugin_id:
                 self.log.info("Initializing plugin: %s.%s",
                               plugin_id, name)
-                plugin_instance = value(self)
+                with profiler.phase("__init__", plugin_id):
+                    plugin_instance = value(self)
 
                 # Ensure the plugin correctly set its id
                 assert plugin_instance.id == plugin_id
 
-                self._plugins[plugin_id] = plugin_instance
+        return plugin_instance
+
+    def reload_plugin(self, plugin_id):
+        """Reload plugin module and hot swap the plugin.
+
+        See `swap_plugin`.
+
+        :param plugin_id: Plugin Id
+        :returns: `True` if the plugin was replaced
+
+        """
+        try:
+            importlib.reload(sys.modules[plugin_id])
+        except Exception:  # pylint: disable=W0703
+            self.log.exception("Failed reloading module of plugin '%s'."
+                               " Keeping current version.", plugin_id)
+            return False
+
+        return self.swap_plugin(plugin_id)
+
+    def swap_plugin(self, plugin_id):
+        """Replace plugin with a new instance of its current module.
+
+        The new plugin's grammars are built and loaded disabled next to
+        the current plugin's grammars, which stay active meanwhile. Once
+        ready the new grammars are enabled and the current ones unloaded
+        in one step. If building or loading the new plugin fails, the
+        grammars it built so far are discarded and the current plugin
+        keeps running.
+
+        The new plugin takes over the current plugin's state and the
+        context applied by configuration.
+
+        :param plugin_id: Plugin Id
+        :returns: `True` if the plugin was replaced
+
+        """
+        current = self._plugins.get(plugin_id)
+        if current is None:
+            self.log.error("Can not swap plugin '%s' as it is not"
+                           " initialized.", plugin_id)
+            return False
+
+        replacement = None
+        try:
+            replacement = self._create_plugin(plugin_id)
+            if replacement is None:
+                raise LookupError(f"Module '{plugin_id}' does not"
+                                  " define a plugin")
+
+            if current.state is not None:
+                replacement.state = current.state
+            if plugin_id in self._applied_contexts:
+                replacement.apply_context(self._applied_contexts[plugin_id])
+
+            if current.loaded:
+                replacement.load(enabled=False)
+        except Exception:  # pylint: disable=W0703
+            self.log.exception("Failed building replacement of plugin"
+                               " '%s'. Keeping current version.", plugin_id)
+            if replacement is not None:
+                replacement.discard()
+            return False
+
+        # Activate
+        self._plugins[plugin_id] = replacement
+        if current.loaded:
+            replacement.enable()
+            current.unload()
+
+        self.log.info("Swapped plugin '%s'", plugin_id)
+
+        if self._controller is not None:
+            if self._controller.context_manager is not None:
+                self._controller.context_manager \
+                    .reload_plugin_contexts(plugin_id)
+            if self._controller.dev_mode:
+                self._controller.dependency_manager. \
+                    watch_plugin(plugin_id, replacement)
+
+        return True
+
+    def set_config(self, plugin_id, config):
+        """Replace configuration of plugin `plugin_id`.
+
+        An initialized plugin is swapped to apply the configuration.
+
+        :param plugin_id: Plugin Id
+        :param config: Plugin configuration or `None` to remove it.
+                       The plugin is given a copy.
+
+        """
+        if config is None:
+            self._plugin_configs.pop(plugin_id, None)
+        else:
+            self._plugin_configs[plugin_id] = copy.deepcopy(config)
+
+        if plugin_id in self._plugins:
+            self.log.info("Configuration of plugin '%s' changed",
+                          plugin_id)
+            self.swap_plugin(plugin_id)
+
+    def remove_plugin(self, plugin_id):
+        """Unload and forget plugin `plugin_id`.
+
+        :param plugin_id: Plugin Id
 
-                if self._controller.dev_mode:
-                    self._controller.dependency_manager. \
-                        watch_plugin(plugin_id, plugin_instance)
+        """
+        plugin = self._plugins.pop(plugin_id, None)
+        if plugin is None:
+            return
+
+        self.log.info("Removing plugin: %s", plugin_id)
+        plugin.unload()
+        self._applied_contexts.pop(plugin_id, None)
+        self._lazy_last_active.pop(plugin_id, None)
 
     def load_plugins(self):
-        """Load all initialized plugins."""
-        for plugin_id, plugin in self._plugins.items():
+        """Load all initialized plugins.
+
+        Grammars of all plugins are built concurrently and then loaded
+        into the engine in the order the plugins were initialized.
+        A failing plugin does not prevent other plugins from loading,
+        the grammars it built or loaded so far are discarded.
+
+        Lazy plugins are skipped. They are loaded by
+        `update_lazy_plugins` once their context matches.
+
+        """
+        plugins = [(plugin_id, plugin)
+                   for plugin_id, plugin in self._plugins.items()
+                   if plugin_id not in self._lazy_plugins]
+
+        with self._executor() as executor:
+            builds = [executor.submit(plugin.build)
+                      for _, plugin in plugins]
+
+        for (plugin_id, plugin), build in zip(plugins, builds):
             self.log.info("Loading plugin: %s", plugin_id)
-            plugin.load()
+            try:
+                build.result()
+                plugin.load()
+            except Exception:  # pylint: disable=W0703
+                self.log.exception("Failed loading plugin '%s'", plugin_id)
+                plugin.discard()
+
+    def update_lazy_plugins(self, executable, title, handle):
+        """Load lazy plugins whose context matches the given window.
+
+        Lazy plugins whose context did not match for longer than the
+        configured `idle_timeout` are unloaded again.
+
+        Called for the foreground window every `check_interval` seconds
+        by an engine timer unless the interval is set to `None`.
+
+        """
+        now = time.monotonic()
+
+        for plugin_id in self._lazy_plugins:
+            plugin = self._plugins.get(plugin_id)
+            if plugin is None:
+                continue
+
+            context = plugin.context
+            if context is None or context.matches(executable, title, handle):
+                self._lazy_last_active[plugin_id] = now
+                if not plugin.loaded:
+                    self.log.info("Loading lazy plugin: %s", plugin_id)
+                    try:
+                        plugin.load()
+                    except Exception:  # pylint: disable=W0703
+                        self.log.exception("Failed loading plugin '%s'",
+                                           plugin_id)
+                        plugin.discard()
+
+            elif plugin.loaded and self._lazy_idle_timeout is not None \
+                    and now - self._lazy_last_active.get(plugin_id, now) \
+                    >= self._lazy_idle_timeout:
+                self.log.info("Unloading idle lazy plugin: %s", plugin_id)
+                plugin.unload()
+
+    def _check_foreground(self):
+        try:
+            window = Window.get_foreground()
+            executable, title, handle = (window.executable, window.title,
+                                         window.handle)
+        except Exception:  # pylint: disable=W0703
+            self.log.debug("Failed getting the foreground window",
+                           exc_info=True)
+            return
+
+        self.update_lazy_plugins(executable, title, handle)
 
     def unload_plugins(self):
-        """Unload all initialized plugins."""
+        """Unload all initialized plugins.
+
+        Stops loading lazy plugins.
+
+        """
+        if self._lazy_timer is not None:
+            self._lazy_timer.stop()
+            self._lazy_timer = None
+
         for plugin_id, plugin in self._plugins.items():
             self.log.info("Unloading plugin: %s", plugin_id)
             plugin.unload()
 
+    def flush_states(self):
+        """Write pending plugin states."""
+        if self._state_writer is not None:
+            self._state_writer.flush()
+
     def apply_context(self, plugin_id, context):
         """Apply context to plugin with `plugin_id`
 
@@ -145,6 +538,7 @@ class PluginManager():
                                ' is not loaded.', plugin_id)
             return
 
+        self._applied_contexts[plugin_id] = context
         self._plugins[plugin_id].apply_context(context)
 
     def get_context(self, plugin_id, desired_state):
@@ -160,6 +554,64 @@ class PluginManager():
                         get(plugin_id, None).get_context(desired_state)
         return None
 
+    def restore_grammars(self, plugin):
+        """Restore `plugin`'s grammars from the grammar cache.
+
+        :param plugin: Plugin
+        :returns: List of `Grammar` or `None` if not cached
+
+        """
+        if self._grammar_cache is None or not plugin.grammars_cacheable:
+            return None
+        return self._grammar_cache.load(plugin)
+
+    def cache_grammars(self, plugin, grammars):
+        """Store `plugin`'s grammars in the grammar cache.
+
+        :param plugin: Plugin
+        :param grammars: List of `Grammar`
+
+        """
+        if self._grammar_cache is not None and plugin.grammars_cacheable:
+            self._grammar_cache.store(plugin, grammars)
+
+    def invalidate_contexts(self):
+        """Invalidate cached context results.
+
+        Must be called when a plugin's contexts may evaluate differently,
+        e.g. when the plugin is enabled or disabled.
+
+        """
+        if self._controller is not None \
+                and self._controller.context_manager is not None:
+            self._controller.context_manager.invalidate()
+
+    def register_grammar(self, plugin, grammar):
+        """Register `grammar` as being provided by `plugin`.
+
+        :param plugin: Plugin owning the grammar
+        :param grammar: Grammar
+
+        """
+        self._grammar_plugins[grammar] = plugin
+
+    def unregister_grammar(self, grammar):
+        """Remove `grammar` from the grammar index.
+
+        :param grammar: Grammar
+
+        """
+        self._grammar_plugins.pop(grammar, None)
+
+    def get_grammar_plugin(self, grammar):
+        """Get plugin which provides `grammar`.
+
+        :param grammar: Grammar
+        :returns: Plugin or `None` if no loaded plugin provides `grammar`
+
+        """
+        return self._grammar_plugins.get(grammar)
+
     def get_config(self, plugin_id):
         """Get config of plugin with `plugin_id`.
 
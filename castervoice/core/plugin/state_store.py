@@ -0,0 +1,303 @@
+from collections.abc import MutableMapping
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import yaml
+
+try:
+    from yaml import CLoader as Loader
+except ImportError:
+    from yaml import Loader
+
+
+class StateStore():
+
+    """
+
+    Single SQLite database holding the states of all plugins.
+
+    Each top level key of a plugin's state is stored as a separate row.
+    Plugins access their state through a `StateMapping` which only
+    loads the keys that are read and only writes the keys that were
+    modified.
+
+    """
+
+    FILE_NAME = "plugins.sqlite"
+
+    def __init__(self, path):
+        """
+
+        :param path: Database file
+
+        """
+
+        self._path = path
+        self._lock = threading.RLock()
+        self._states = {}
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS state ("
+                                     " plugin_id TEXT NOT NULL,"
+                                     " key TEXT NOT NULL,"
+                                     " value BLOB NOT NULL,"
+                                     " PRIMARY KEY (plugin_id, key))")
+
+    log = property(lambda self: logging.getLogger("castervoice.StateStore"),
+                   doc="Get class logger.")
+
+    path = property(lambda self: self._path,
+                    doc="Database file.")
+
+    def plugin_state(self, plugin_id):
+        """Get state of plugin with `plugin_id`.
+
+        Plugin instances sharing an id share their state.
+
+        :param plugin_id: Plugin id
+        :returns: `StoredPluginState`
+
+        """
+        with self._lock:
+            state = self._states.get(plugin_id)
+            if state is None:
+                state = StoredPluginState(self, plugin_id)
+                self._states[plugin_id] = state
+            return state
+
+    def get(self, plugin_id, key):
+        """Load value of `key`.
+
+        :raises KeyError: If `key` is not stored
+
+        """
+        return pickle.loads(self.get_pickled(plugin_id, key))
+
+    def get_pickled(self, plugin_id, key):
+        """Load the pickled value of `key`.
+
+        :raises KeyError: If `key` is not stored
+
+        """
+        with self._lock:
+            row = self._connection.execute(
+                    "SELECT value FROM state WHERE plugin_id = ? AND key = ?",
+                    (plugin_id, key)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def contains(self, plugin_id, key):
+        """Check whether `key` is stored without loading its value."""
+        with self._lock:
+            return self._connection.execute(
+                    "SELECT 1 FROM state WHERE plugin_id = ? AND key = ?",
+                    (plugin_id, key)).fetchone() is not None
+
+    def keys(self, plugin_id):
+        """Get all stored keys of plugin with `plugin_id`."""
+        with self._lock:
+            return [row[0] for row in self._connection.execute(
+                    "SELECT key FROM state WHERE plugin_id = ?",
+                    (plugin_id,))]
+
+    def write(self, plugin_id, items, deleted=(), clear=False):
+        """Update a plugin's state in a single transaction.
+
+        :param plugin_id: Plugin id
+        :param items: Dictionary of keys to store
+        :param deleted: Keys to remove
+        :param clear: Remove all keys not in `items` first
+
+        """
+        self.write_pickled(plugin_id,
+                           {key: pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                            for key, value in items.items()},
+                           deleted, clear)
+
+    def write_pickled(self, plugin_id, items, deleted=(), clear=False):
+        """Like `write` with values of `items` already pickled."""
+        rows = [(plugin_id, key, value) for key, value in items.items()]
+
+        with self._lock, self._connection:
+            if clear:
+                self._connection.execute(
+                        "DELETE FROM state WHERE plugin_id = ?",
+                        (plugin_id,))
+            self._connection.executemany(
+                    "DELETE FROM state WHERE plugin_id = ? AND key = ?",
+                    [(plugin_id, key) for key in deleted])
+            self._connection.executemany(
+                    "INSERT OR REPLACE INTO state (plugin_id, key, value)"
+                    " VALUES (?, ?, ?)", rows)
+
+    def migrate(self, directory):
+        """Import per plugin YAML state files from `directory`.
+
+        Imported files are renamed to `<plugin_id>.state.migrated`.
+        States which are not dictionaries with string keys can not be
+        imported and are left untouched.
+
+        :param directory: Plugin state directory
+
+        """
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".state"):
+                continue
+
+            plugin_id = name[:-len(".state")]
+            path = os.path.join(directory, name)
+            try:
+                with open(path, "r", encoding="utf-8") as ymlfile:
+                    data = yaml.load(ymlfile, Loader=Loader)
+            except (OSError, yaml.YAMLError):
+                self.log.exception("Unable to read state of plugin '%s'",
+                                   plugin_id)
+                continue
+
+            if data is None:
+                data = {}
+            if not isinstance(data, dict) \
+                    or not all(isinstance(key, str) for key in data):
+                self.log.warning("Unable to migrate state of plugin '%s':"
+                                 " State must be a dictionary with string"
+                                 " keys", plugin_id)
+                continue
+
+            if self.keys(plugin_id):
+                self.log.warning("Not migrating state file of plugin '%s'"
+                                 " as its state is already stored",
+                                 plugin_id)
+                continue
+
+            self.write(plugin_id, data)
+            os.replace(path, path + ".migrated")
+            self.log.info("Migrated state of plugin '%s'", plugin_id)
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
+
+
+class StateMapping(MutableMapping):
+
+    """Dictionary-like plugin state loading keys on first access.
+
+    Changes are written with `persist`. Values which were read are
+    compared to their stored version to detect modifications in place,
+    only modified values are written.
+
+    """
+
+    def __init__(self, store, plugin_id):
+        self._store = store
+        self._plugin_id = plugin_id
+
+        self._cache = {}
+        # key -> pickled value as stored, for keys loaded or written
+        self._stored = {}
+        self._deleted = set()
+        self._cleared = False
+
+    def __getitem__(self, key):
+        if key in self._cache:
+            return self._cache[key]
+        if key in self._deleted or self._cleared:
+            raise KeyError(key)
+
+        pickled = self._store.get_pickled(self._plugin_id, key)
+        value = pickle.loads(pickled)
+        self._cache[key] = value
+        self._stored[key] = pickled
+        return value
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, str):
+            raise TypeError(f"State keys must be strings, not {key!r}")
+        self._cache[key] = value
+        self._stored.pop(key, None)
+        self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._cache.pop(key, None)
+        self._stored.pop(key, None)
+        self._deleted.add(key)
+
+    def __contains__(self, key):
+        if key in self._cache:
+            return True
+        if key in self._deleted or self._cleared:
+            return False
+        return self._store.contains(self._plugin_id, key)
+
+    def __iter__(self):
+        keys = dict.fromkeys(self._cache)
+        if not self._cleared:
+            keys.update(dict.fromkeys(
+                    key for key in self._store.keys(self._plugin_id)
+                    if key not in self._deleted))
+        return iter(keys)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"StateMapping({self._plugin_id})"
+
+    def clear(self):
+        self._cache = {}
+        self._stored = {}
+        self._deleted = set()
+        self._cleared = True
+
+    def persist(self):
+        """Write modified keys."""
+        modified = {}
+        for key, value in self._cache.items():
+            pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            if self._stored.get(key) != pickled:
+                modified[key] = pickled
+
+        if modified or self._deleted or self._cleared:
+            self._store.write_pickled(self._plugin_id, modified,
+                                      self._deleted, self._cleared)
+        self._stored.update(modified)
+        self._deleted = set()
+        self._cleared = False
+
+
+class StoredPluginState():
+
+    """Plugin state kept in a `StateStore`.
+
+    Provides the same interface as `PluginState`: `data` is `None`
+    until a state is set.
+
+    """
+
+    def __init__(self, store, plugin_id):
+        self._mapping = StateMapping(store, plugin_id)
+        self._exists = bool(store.keys(plugin_id))
+
+    def set_data(self, new_data):
+        if new_data is self._mapping:
+            return
+        self._mapping.clear()
+        self._exists = new_data is not None
+        if new_data is not None:
+            self._mapping.update(new_data)
+
+    data = property(lambda self: self._mapping if self._exists else None,
+                    set_data,
+                    doc="Plugin state `StateMapping` or `None`.")
+
+    def persist(self):
+        self._mapping.persist()
@@ -0,0 +1,199 @@
+import atexit
+import logging
+import os
+import tempfile
+import threading
+import time
+import yaml
+
+try:
+    from yaml import CDumper as Dumper
+except ImportError:
+    from yaml import Dumper
+
+
+def write_atomic(file_path, data):
+    """Write `data` as YAML to `file_path`.
+
+    The data is written to a temporary file which is synced to disk
+    and renamed to `file_path`. A crash while writing therefore never
+    leaves a truncated file behind.
+
+    :param file_path: Destination file
+    :param data: Data to serialize
+
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    content = yaml.dump(data, Dumper=Dumper)
+
+    with tempfile.NamedTemporaryFile('w', encoding="utf-8", dir=directory,
+                                     delete=False) as ymlfile:
+        try:
+            ymlfile.write(content)
+            ymlfile.flush()
+            os.fsync(ymlfile.fileno())
+        except BaseException:
+            ymlfile.close()
+            os.remove(ymlfile.name)
+            raise
+
+    os.replace(ymlfile.name, file_path)
+
+    # Persist the rename itself
+    if hasattr(os, 'O_DIRECTORY'):
+        directory_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+
+class StateWriter():
+    # pylint: disable=too-many-instance-attributes
+
+    """
+
+    Write-behind persistence of plugin states.
+
+    `schedule` only records the data to write and returns immediately.
+    A background thread writes pending data every `interval` seconds
+    and when closed. Data scheduled repeatedly for the same file before
+    it is written is coalesced into a single write.
+
+    """
+
+    def __init__(self, interval=1.0):
+        """
+
+        :param interval: Seconds between flushes of pending data
+
+        """
+
+        self._interval = interval
+
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._closed = False
+
+        self._writes = 0
+        self._coalesced = 0
+        self._flush_latency = 0.0
+
+    log = property(lambda self: logging.getLogger("castervoice.StateWriter"),
+                   doc="Get class logger.")
+
+    interval = property(lambda self: self._interval,
+                        doc="Seconds between flushes.")
+
+    writes = property(lambda self: self._writes,
+                      doc="Number of files written.")
+
+    coalesced = property(lambda self: self._coalesced,
+                         doc="Number of scheduled writes superseded by a"
+                             " later write before being flushed.")
+
+    flush_latency = property(lambda self: self._flush_latency,
+                             doc="Duration in seconds of the last flush.")
+
+    def schedule(self, file_path, data):
+        """Schedule writing `data` to `file_path`.
+
+        `data` must not be modified afterwards, pass a copy if needed.
+
+        :param file_path: Destination file
+        :param data: Data to serialize
+
+        """
+        with self._condition:
+            closed = self._closed
+            if not closed:
+                self._enqueue(file_path, data)
+
+        # Nothing is flushed anymore after closing
+        if closed:
+            write_atomic(file_path, data)
+
+    def _enqueue(self, file_path, data):
+        if file_path in self._pending:
+            self._coalesced += 1
+        self._pending[file_path] = data
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name="StateWriter",
+                                            daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+        self._condition.notify()
+
+    def pending(self, file_path, default=None):
+        """Get data of `file_path` which is not yet written.
+
+        :param file_path: Destination file
+        :param default: Returned if nothing is pending for `file_path`
+
+        """
+        with self._condition:
+            return self._pending.get(file_path, default)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+
+                # Give further writes the chance to be coalesced
+                deadline = time.monotonic() + self._interval
+                while not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._closed:
+                    return
+
+            self.flush()
+
+    def flush(self):
+        """Write all pending data now."""
+        # Serialize flushes so older data never overwrites newer data
+        with self._flush_lock:
+            with self._condition:
+                pending = self._pending
+                self._pending = {}
+
+            if not pending:
+                return
+
+            start = time.perf_counter()
+            for file_path, data in pending.items():
+                try:
+                    write_atomic(file_path, data)
+                    self._writes += 1
+                except Exception:  # pylint: disable=W0703
+                    self.log.exception("Failed writing state '%s'",
+                                       file_path)
+            self._flush_latency = time.perf_counter() - start
+
+        self.log.debug("Flushed %d states in %.3fs", len(pending),
+                       self._flush_latency)
+
+    def close(self):
+        """Stop the background thread and write all pending data."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+            atexit.unregister(self.close)
+
+        self.flush()
@@ -0,0 +1,215 @@
+"""
+
+Record wall time and peak memory of Caster's start up phases.
+
+Code marks phases with `phase`, which does nothing unless a profiler
+was started with `start`:
+
+    with profiler.phase("get_grammars", plugin_id):
+        ...
+
+"""
+from contextlib import contextmanager
+import json
+import threading
+import time
+import tracemalloc
+
+
+_active = None
+
+# `tracemalloc.reset_peak` requires Python >= 3.9
+_RESET_PEAK = hasattr(tracemalloc, "reset_peak")
+
+
+class StartupProfiler():
+
+    """Collects timings of (nested) phases.
+
+    Peak memory is the maximum memory allocated by Python during a
+    phase in excess of the memory allocated when the phase started.
+
+    Before Python 3.9 the peak can not be reset per phase. A phase's
+    peak is then only exact if it exceeds all earlier peaks, otherwise
+    the memory still allocated at the end of the phase is reported.
+
+    """
+
+    def __init__(self):
+        self._records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._start = None
+        self._total = None
+        self._started_tracemalloc = False
+
+    records = property(lambda self: list(self._records),
+                       doc="List of `(phase, plugin_id, wall, peak_memory)`"
+                           " tuples in order of completion.")
+
+    total = property(lambda self: self._total,
+                     doc="Wall time in seconds between `start` and `stop`.")
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._start = time.perf_counter()
+
+    def stop(self):
+        self._total = time.perf_counter() - self._start
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+    @contextmanager
+    def phase(self, name, plugin_id=None):
+        # Peaks of enclosing phases on this thread. tracemalloc only
+        # tracks a single peak which is reset for each phase.
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        current, peak = tracemalloc.get_traced_memory()
+        if _RESET_PEAK:
+            if stack:
+                stack[-1] = max(stack[-1], peak)
+            tracemalloc.reset_peak()
+        previous_peak = peak
+        stack.append(current)
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - started
+            end_current, end_peak = tracemalloc.get_traced_memory()
+            if not _RESET_PEAK and end_peak <= previous_peak:
+                # The phase's peak is hidden by an earlier one
+                end_peak = end_current
+            peak = max(stack.pop(), end_peak)
+            if stack:
+                stack[-1] = max(stack[-1], peak)
+            with self._lock:
+                self._records.append((name, plugin_id, wall,
+                                      peak - current))
+
+    def phases(self):
+        """Get records of phases not attributed to a plugin.
+
+        :returns: List of `(phase, wall, peak_memory)` sorted by
+                  decreasing wall time
+
+        """
+        return sorted(((name, wall, peak)
+                       for name, plugin_id, wall, peak in self._records
+                       if plugin_id is None),
+                      key=lambda record: record[1], reverse=True)
+
+    def plugins(self):
+        """Get records of plugin phases grouped by plugin.
+
+        :returns: List of `(plugin_id, wall, {phase: (wall, peak)})`
+                  sorted by decreasing total wall time of the plugin
+
+        """
+        plugins = {}
+        for name, plugin_id, wall, peak in self._records:
+            if plugin_id is None:
+                continue
+            plugin_phases = plugins.setdefault(plugin_id, {})
+            phase_wall, phase_peak = plugin_phases.get(name, (0, 0))
+            plugin_phases[name] = (phase_wall + wall, max(phase_peak, peak))
+
+        return sorted(((plugin_id, sum(wall for wall, _ in phases.values()),
+                        phases)
+                       for plugin_id, phases in plugins.items()),
+                      key=lambda record: record[1], reverse=True)
+
+    def report(self):
+        """Format a human readable report.
+
+        :returns: String
+
+        """
+        lines = [f"Startup: {self._total or 0:.3f}s", "",
+                 f"{'phase':<24} {'wall (s)':>10} {'peak (KiB)':>11}"]
+        for name, wall, peak in self.phases():
+            lines.append(f"{name:<24} {wall:>10.3f} {peak / 1024:>11.1f}")
+
+        plugins = self.plugins()
+        if plugins:
+            lines += ["", f"{'plugin / phase':<40} {'wall (s)':>10}"
+                          f" {'peak (KiB)':>11}"]
+        for plugin_id, wall, phases in plugins:
+            lines.append(f"{plugin_id:<40} {wall:>10.3f}")
+            for name, (phase_wall, peak) in sorted(
+                    phases.items(), key=lambda item: item[1][0],
+                    reverse=True):
+                lines.append(f"  {name:<38} {phase_wall:>10.3f}"
+                             f" {peak / 1024:>11.1f}")
+
+        return "\n".join(lines)
+
+    def to_dict(self):
+        """Get all records as a JSON serializable dictionary."""
+        return {
+            "total": self._total,
+            "phases": [{"phase": name, "wall": wall, "peak_memory": peak}
+                       for name, wall, peak in self.phases()],
+            "plugins": {plugin_id: {
+                            "wall": wall,
+                            "phases": {name: {"wall": phase_wall,
+                                              "peak_memory": peak}
+                                       for name, (phase_wall, peak)
+                                       in phases.items()}
+                        } for plugin_id, wall, phases in self.plugins()},
+        }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as json_file:
+            json.dump(self.to_dict(), json_file, indent=2)
+
+
+def start():
+    """Start profiling start up phases.
+
+    :returns: `StartupProfiler`
+
+    """
+    global _active  # pylint: disable=global-statement
+    _active = StartupProfiler()
+    _active.start()
+    return _active
+
+
+def stop():
+    """Stop profiling.
+
+    :returns: The stopped `StartupProfiler` or `None`
+
+    """
+    global _active  # pylint: disable=global-statement
+    profiler, _active = _active, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def active():
+    """Boolean indicating whether a profiler is running."""
+    return _active is not None
+
+
+@contextmanager
+def phase(name, plugin_id=None):
+    """Record phase `name` if a profiler is running.
+
+    :param name: Phase name
+    :param plugin_id: Plugin the phase belongs to
+
+    """
+    if _active is None:
+        yield
+    else:
+        with _active.phase(name, plugin_id):
+            yield
@@ -0,0 +1,68 @@
+"""
+
+Hand calls from native threads over to the gevent hub.
+
+The engine's recognition loop blocks in native code and therefore runs
+in its own OS thread. Anything touching gevent objects (queues,
+greenlets) must happen on the thread running the hub, which is what
+`HubBridge` is for:
+
+    bridge = HubBridge()
+    # In the engine thread
+    bridge.call(watcher.publish, event)
+
+"""
+from collections import deque
+import logging
+
+import gevent
+
+
+class HubBridge():
+
+    """Thread-safe queue of calls executed by the gevent hub.
+
+    Calls are executed in order within the hub's event loop. They must
+    not block or switch greenlets; spawn a greenlet for that.
+
+    """
+
+    def __init__(self, hub=None):
+        """
+
+        :param hub: Hub executing the calls. Defaults to the hub of
+                    the calling thread.
+
+        """
+        hub = hub or gevent.get_hub()
+
+        # Appending and popping are atomic, the deque needs no lock
+        self._calls = deque()
+        self._watcher = hub.loop.async_()
+        self._watcher.start(self._run)
+
+    log = property(lambda self: logging.getLogger("castervoice.HubBridge"),
+                   doc="Get class logger.")
+
+    def call(self, function, *args):
+        """Call `function` with `args` on the hub.
+
+        May be called from any thread.
+
+        """
+        self._calls.append((function, args))
+        self._watcher.send()
+
+    def _run(self):
+        # Wake ups coalesce, so drain all calls queued so far
+        while self._calls:
+            function, args = self._calls.popleft()
+            try:
+                function(*args)
+            except Exception:  # pylint: disable=W0703
+                self.log.exception("Bridged call %s failed", function)
+
+    def close(self):
+        """Stop executing calls."""
+        self._watcher.stop()
+        self._watcher.close()
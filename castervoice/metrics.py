@@ -0,0 +1,238 @@
+"""
+
+Recognition latency metrics in the Prometheus text format.
+
+All updates happen on the engine's recognition thread, which is the
+only writer. Updates therefore need no lock. The exception are
+execution latencies of queued actions, which are recorded by the action
+queue's workers. Execution histograms are updated under a lock which is
+only contended while a queued action completes. Readers (the web
+server) may observe a histogram in the middle of an update, which is
+acceptable for monitoring.
+
+"""
+from bisect import bisect_left
+import threading
+import time
+
+
+# Upper bounds in seconds of latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+
+    """Latency histogram with fixed buckets."""
+
+    __slots__ = ("counts", "sum")
+
+    def __init__(self):
+        # Non-cumulative counts, the last bucket is `+Inf`
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+
+    count = property(lambda self: sum(self.counts),
+                     doc="Number of observations.")
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+
+
+class RecognitionMetrics:
+
+    """Recognition and action execution latencies per plugin and rule.
+
+    Latencies are recorded per rule and labeled with the rule's plugin.
+    Per plugin latencies are aggregated by the `plugin` label.
+
+    `recognition` latency is the time from speech start (`on_begin`)
+    to the recognition. `execution` latency is the time from the
+    recognition to the end of the rule's action execution. For queued
+    actions this includes the time waiting in the queue.
+
+    """
+
+    def __init__(self):
+        self._begin = None
+        self._recognized = None
+        self._execution_lock = threading.Lock()
+
+        # `(plugin_id, rule_name)` -> Count / `Histogram`
+        self._recognitions = {}
+        self._recognition = {}
+        self._execution = {}
+        self._failures = 0
+
+    failures = property(lambda self: self._failures,
+                        doc="Number of failed recognitions.")
+
+    def on_begin(self):
+        self._begin = time.perf_counter()
+
+    def on_recognition(self, plugin_id, rule_name):
+        now = time.perf_counter()
+        key = (plugin_id, rule_name)
+
+        self._recognitions[key] = self._recognitions.get(key, 0) + 1
+
+        if self._begin is not None:
+            histogram = self._recognition.get(key)
+            if histogram is None:
+                histogram = self._recognition[key] = Histogram()
+            histogram.observe(now - self._begin)
+            self._begin = None
+
+        self._recognized = (key, now)
+
+    def on_post_recognition(self):
+        recognized = self._recognized
+        self._recognized = None
+        self.on_executed(recognized)
+
+    def defer_execution(self):
+        """Hand the execution of the current recognition to the caller.
+
+        Called when the recognized rule's actions are queued instead of
+        being executed before `on_post_recognition`.
+
+        :returns: Token to pass to `on_executed` once the actions were
+                  executed
+
+        """
+        recognized = self._recognized
+        self._recognized = None
+        return recognized
+
+    def on_executed(self, recognized):
+        """Record the end of a recognition's action execution.
+
+        May be called on any thread.
+
+        :param recognized: Token returned by `defer_execution`
+
+        """
+        if recognized is None:
+            return
+
+        key, started = recognized
+        with self._execution_lock:
+            histogram = self._execution.get(key)
+            if histogram is None:
+                histogram = self._execution[key] = Histogram()
+            histogram.observe(time.perf_counter() - started)
+
+    def on_failure(self):
+        self._begin = None
+        self._failures += 1
+
+    def recognitions(self):
+        """Get number of recognitions by `(plugin_id, rule_name)`."""
+        return dict(self._recognitions)
+
+    def render(self):
+        """Format metrics in the Prometheus text exposition format.
+
+        :returns: String
+
+        """
+        lines = [
+            "# HELP castervoice_recognitions_total Recognitions per rule.",
+            "# TYPE castervoice_recognitions_total counter",
+        ]
+        for key, count in tuple(self._recognitions.items()):
+            lines.append(f"castervoice_recognitions_total{_labels(key)}"
+                         f" {count}")
+
+        lines += [
+            "# HELP castervoice_recognition_failures_total Failed"
+            " recognitions.",
+            "# TYPE castervoice_recognition_failures_total counter",
+            f"castervoice_recognition_failures_total {self._failures}",
+        ]
+
+        lines += _render_histogram(
+                "castervoice_recognition_latency_seconds",
+                "Time from speech start to recognition.",
+                tuple(self._recognition.items()))
+        lines += _render_histogram(
+                "castervoice_execution_latency_seconds",
+                "Time from recognition to the end of action execution.",
+                tuple(self._execution.items()))
+
+        return "\n".join(lines) + "\n"
+
+
+def render_action_queue(action_queue):
+    """Format counters of an `ActionQueue` in the Prometheus text
+    exposition format.
+
+    :param action_queue: `ActionQueue`
+    :returns: String
+
+    """
+    stats = action_queue.stats()
+    lines = [
+        "# HELP castervoice_action_queue_depth Actions waiting to be"
+        " executed.",
+        "# TYPE castervoice_action_queue_depth gauge",
+        f"castervoice_action_queue_depth {stats.pop('depth')}",
+        "# HELP castervoice_action_queue_running Actions being executed.",
+        "# TYPE castervoice_action_queue_running gauge",
+        f"castervoice_action_queue_running {stats.pop('running')}",
+        "# HELP castervoice_queued_actions_total Queued actions.",
+        "# TYPE castervoice_queued_actions_total counter",
+        f"castervoice_queued_actions_total {stats.pop('submitted')}",
+        "# HELP castervoice_finished_actions_total Queued actions by how"
+        " they finished (done, failed, cancelled or expired).",
+        "# TYPE castervoice_finished_actions_total counter",
+    ]
+    for state, count in sorted(stats.items()):
+        lines.append(f'castervoice_finished_actions_total{{state="{state}"}}'
+                     f" {count}")
+
+    lines += _render_histogram(
+            "castervoice_action_wait_seconds",
+            "Time queued actions waited per plugin lane.",
+            tuple(action_queue.lane_wait_latency().items()),
+            _plugin_labels)
+
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"') \
+        .replace("\n", "\\n")
+
+
+def _labels(key, **extra):
+    plugin_id, rule_name = key
+    labels = [f'plugin="{_escape(plugin_id)}"',
+              f'rule="{_escape(rule_name)}"']
+    labels += [f'{name}="{value}"' for name, value in extra.items()]
+    return "{" + ",".join(labels) + "}"
+
+
+def _plugin_labels(plugin_id, **extra):
+    labels = [f'plugin="{_escape(plugin_id)}"']
+    labels += [f'{name}="{value}"' for name, value in extra.items()]
+    return "{" + ",".join(labels) + "}"
+
+
+def _render_histogram(name, description, histograms, labels=_labels):
+    lines = [f"# HELP {name} {description}",
+             f"# TYPE {name} histogram"]
+    for key, histogram in histograms:
+        counts = list(histogram.counts)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{labels(key, le=bound)}"
+                         f" {cumulative}")
+        lines.append(f"{name}_sum{labels(key)} {histogram.sum}")
+        lines.append(f"{name}_count{labels(key)} {cumulative}")
+    return lines
+
+
+recognition_metrics = RecognitionMetrics()
@@ -0,0 +1,9 @@
+"""
+
+Client-server mode: A server recognizes speech or text sent by clients
+and returns the recognized rule. Clients execute the action locally.
+
+"""
+from .client import RecognitionClient, RecognitionError, RecognitionResult
+from .protocol import ProtocolError
+from .server import RecognitionServer
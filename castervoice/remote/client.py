@@ -0,0 +1,213 @@
+"""
+
+Blocking client of the recognition server.
+
+A client keeps its connection open for any number of requests. Requests
+may be pipelined by sending several before receiving their results:
+
+    with RecognitionClient("unix:/tmp/caster.sock") as client:
+        result = client.recognize_text("say hello")
+        if result is not None:
+            print(result.plugin_id, result.rule_name, result.action)
+
+Recognized actions are executed by the client's own plugins, e.g. of a
+`Controller` loading the same plugins as the server:
+
+            result.execute(controller.plugin_manager)
+
+"""
+import itertools
+import json
+import socket
+
+from dragonfly import MappingRule
+
+from castervoice.remote import protocol
+
+
+class RecognitionError(Exception):
+
+    """Raised when the server failed recognizing a request."""
+
+
+class RecognitionResult():
+
+    """Recognized rule and the action to be executed by the client.
+
+    `spec` is the recognized spec of a `MappingRule` and `action` the
+    representation of the server's action. Extras which can not be
+    represented in JSON are passed as strings.
+
+    """
+
+    __slots__ = ("plugin_id", "rule_name", "words", "spec", "action",
+                 "extras")
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, plugin_id, rule_name, words, spec, action, extras):
+        self.plugin_id = plugin_id
+        self.rule_name = rule_name
+        self.words = words
+        self.spec = spec
+        self.action = action
+        self.extras = extras
+
+    @classmethod
+    def from_payload(cls, payload):
+        result = json.loads(payload.decode("utf-8"))
+        return cls(result["plugin"], result["rule"], tuple(result["words"]),
+                   result.get("spec"), result["action"],
+                   result.get("extras", {}))
+
+    def execute(self, plugin_manager):
+        """Execute the recognized action with the client's plugins.
+
+        The action is looked up by plugin id, rule name and spec in
+        the loaded plugins of `plugin_manager` and executed with the
+        recognition's extras. Actions of plugins queuing their actions
+        are queued. Only recognitions of mapping rules can be executed.
+
+        :param plugin_manager: `PluginManager` executing actions
+        :raises LookupError: If the recognized mapping is not loaded
+
+        """
+        plugin = plugin_manager.plugins.get(self.plugin_id)
+        if plugin is None:
+            raise LookupError(f"Plugin '{self.plugin_id}' is not"
+                              " initialized")
+
+        rule = next((rule for grammar in plugin.grammars
+                     for rule in grammar.rules
+                     if rule.name == self.rule_name), None)
+        if not isinstance(rule, MappingRule) or self.spec not in rule.specs:
+            raise LookupError(f"Plugin '{self.plugin_id}' has no mapping"
+                              f" '{self.spec}' in rule '{self.rule_name}'")
+
+        # pylint: disable=protected-access
+        value = rule._mapping[self.spec]
+        extras = {"_grammar": rule.grammar, "_rule": rule, "_node": None}
+        extras.update(self.extras)
+
+        def process_recognition():
+            rule._process_recognition(value, extras)
+
+        if plugin.queue_actions and plugin_manager.action_queue is not None:
+            plugin_manager.action_queue.submit(plugin.id, process_recognition,
+                                               plugin.action_timeout)
+        else:
+            process_recognition()
+
+    def __repr__(self):
+        return (f"RecognitionResult(plugin_id={self.plugin_id!r},"
+                f" rule_name={self.rule_name!r}, words={self.words!r},"
+                f" spec={self.spec!r}, action={self.action!r},"
+                f" extras={self.extras!r})")
+
+
+class RecognitionClient():
+
+    """Persistent connection to a recognition server."""
+
+    # Bytes of audio sent per frame
+    AUDIO_CHUNK_SIZE = 32 * 1024
+
+    def __init__(self, address, timeout=None):
+        """
+
+        :param address: `HOST:PORT` or `unix:PATH`
+        :param timeout: Socket timeout in seconds
+
+        """
+        family, connect_address = protocol.parse_address(address)
+        self._sock = socket.socket(family, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        if family != socket.AF_UNIX:
+            # Frames are small, do not delay them
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock.connect(connect_address)
+
+        self._request_ids = itertools.count(1)
+        # request_id -> `(message_type, payload)` received while
+        # waiting for another request
+        self._responses = {}
+
+    def send_text(self, utterance):
+        """Request recognizing `utterance` without waiting for it.
+
+        :returns: Request id to pass to `receive`
+
+        """
+        request_id = next(self._request_ids)
+        self._sock.sendall(protocol.encode(protocol.TEXT, request_id,
+                                           utterance.encode("utf-8")))
+        return request_id
+
+    def send_audio(self, audio):
+        """Request recognizing `audio` without waiting for it.
+
+        :param audio: Bytes or iterable of bytes of 16 kHz, 16 bit,
+                      mono PCM audio
+        :returns: Request id to pass to `receive`
+
+        """
+        chunks = audio
+        if isinstance(audio, (bytes, bytearray)):
+            chunks = (audio[index:index + self.AUDIO_CHUNK_SIZE]
+                      for index in range(0, len(audio),
+                                         self.AUDIO_CHUNK_SIZE))
+
+        request_id = next(self._request_ids)
+        for chunk in chunks:
+            self._sock.sendall(protocol.encode(protocol.AUDIO, request_id,
+                                               chunk))
+        self._sock.sendall(protocol.encode(protocol.AUDIO_END, request_id))
+        return request_id
+
+    def receive(self, request_id):
+        """Wait for the result of request `request_id`.
+
+        :returns: `RecognitionResult` or `None` if nothing was
+                  recognized
+
+        """
+        while request_id not in self._responses:
+            frame = protocol.read_frame(self._sock)
+            if frame is None:
+                raise ConnectionError("Server closed the connection")
+            message_type, response_id, payload = frame
+            self._responses[response_id] = (message_type, payload)
+
+        message_type, payload = self._responses.pop(request_id)
+        if message_type == protocol.RESULT:
+            return RecognitionResult.from_payload(payload)
+        if message_type == protocol.NO_MATCH:
+            return None
+        if message_type == protocol.ERROR:
+            raise RecognitionError(payload.decode("utf-8"))
+        raise protocol.ProtocolError(f"Unexpected message type"
+                                     f" {message_type:#x}")
+
+    def recognize_text(self, utterance):
+        """Recognize `utterance`.
+
+        :returns: `RecognitionResult` or `None`
+
+        """
+        return self.receive(self.send_text(utterance))
+
+    def recognize_audio(self, audio):
+        """Recognize `audio`. See `send_audio`.
+
+        :returns: `RecognitionResult` or `None`
+
+        """
+        return self.receive(self.send_audio(audio))
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
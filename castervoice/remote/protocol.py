@@ -0,0 +1,124 @@
+"""
+
+Length-prefixed binary protocol between recognition server and clients.
+
+Every message is a frame:
+
+    | length (uint32) | type (uint8) | request_id (uint32) | payload |
+
+All integers are big endian. `length` counts the bytes following it,
+i.e. type, request id and payload.
+
+Clients choose request ids. Responses carry the id of their request,
+so a connection can have several requests in flight and is kept open
+for any number of requests.
+
+"""
+import socket
+import struct
+
+
+HEADER = struct.Struct("!IBI")
+
+# Bytes of a frame counted by `length` besides the payload
+_TYPE_AND_ID_SIZE = HEADER.size - 4
+
+MAX_PAYLOAD_SIZE = 16 * 1024 * 1024
+
+# Client messages
+
+# Payload: UTF-8 encoded utterance
+TEXT = 0x01
+# Payload: chunk of 16 kHz, 16 bit, mono PCM audio. Chunks are
+# collected per request id until `AUDIO_END`.
+AUDIO = 0x02
+# Payload: empty. Recognize the request's audio chunks.
+AUDIO_END = 0x03
+
+# Server messages
+
+# Payload: UTF-8 encoded JSON object with `plugin`, `rule`, `words`,
+# `action` (representation of the rule's action) and `extras`
+RESULT = 0x81
+# Payload: empty
+NO_MATCH = 0x82
+# Payload: UTF-8 encoded error message
+ERROR = 0x83
+
+AUDIO_SAMPLE_RATE = 16000
+AUDIO_SAMPLE_WIDTH = 2
+AUDIO_CHANNELS = 1
+
+
+class ProtocolError(Exception):
+
+    """Raised when a peer violates the protocol."""
+
+
+def encode(message_type, request_id, payload=b""):
+    """Encode a frame.
+
+    :returns: Bytes
+
+    """
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f"Payload of {len(payload)} bytes exceeds"
+                            f" {MAX_PAYLOAD_SIZE} bytes")
+    return HEADER.pack(len(payload) + _TYPE_AND_ID_SIZE, message_type,
+                       request_id) + payload
+
+
+def _receive_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            if received == 0:
+                return None
+            raise ProtocolError("Connection closed within a frame")
+        received += count
+    return bytes(buffer)
+
+
+def read_frame(sock):
+    """Read a frame from `sock`.
+
+    :returns: `(message_type, request_id, payload)` or `None` if the
+              peer closed the connection
+
+    """
+    header = _receive_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+
+    length, message_type, request_id = HEADER.unpack(header)
+    size = length - _TYPE_AND_ID_SIZE
+    if size < 0 or size > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f"Invalid frame length {length}")
+
+    payload = b""
+    if size:
+        payload = _receive_exactly(sock, size)
+        if payload is None:
+            raise ProtocolError("Connection closed within a frame")
+    return message_type, request_id, payload
+
+
+def parse_address(address):
+    """Parse `unix:PATH` or `HOST:PORT`.
+
+    :returns: `(family, address)` as accepted by `socket.socket` and
+              `socket.bind`/`socket.connect`
+
+    """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+
+    host, separator, port = address.rpartition(":")
+    if not separator or not port.isdigit():
+        raise ValueError(f"Invalid address '{address}'. Expected"
+                         " `HOST:PORT` or `unix:PATH`")
+    return socket.AF_INET6 if ":" in host else socket.AF_INET, \
+        (host.strip("[]") or "127.0.0.1", int(port))
@@ -0,0 +1,291 @@
+"""
+
+Serve recognitions of the local engine to clients over a socket.
+
+Connections are handled by greenlets on the gevent hub. Recognition
+requests of all connections are processed one after another by the
+engine thread (`serve_engine`). Actions of recognized rules are not
+executed on the server. The client receives the recognized mapping
+and its extras to execute the action with its own plugins (see
+`RecognitionResult.execute`).
+
+Recognitions are published to the server's event subscribers and
+recorded in its metrics like local recognitions.
+
+"""
+import json
+import logging
+import os
+import queue
+import tempfile
+import wave
+
+import gevent
+import gevent.queue
+from gevent import socket
+from gevent.server import StreamServer
+
+from dragonfly import MappingRule, MimicFailure
+from dragonfly.actions.action_base import BoundAction
+
+from castervoice import watcher
+from castervoice.hub_bridge import HubBridge
+from castervoice.remote import protocol
+
+
+# Maximum bytes of audio collected for a single request
+MAX_AUDIO_SIZE = 64 * 1024 * 1024
+
+
+class _Connection():
+
+    """Client connection state."""
+
+    __slots__ = ("sock", "responses", "audio", "closed")
+
+    def __init__(self, sock):
+        self.sock = sock
+        # Encoded frames written by the connection's writer greenlet
+        self.responses = gevent.queue.Queue()
+        # request_id -> audio received so far
+        self.audio = {}
+        self.closed = False
+
+
+class RecognitionServer():
+
+    """Recognition server of a `Controller` not executing actions."""
+
+    def __init__(self, controller, address):
+        """
+
+        :param controller: Controller created with
+                           `execute_actions=False`
+        :param address: `HOST:PORT` or `unix:PATH`
+
+        """
+        if controller.plugin_manager.execute_actions:
+            raise ValueError("The recognition server requires a controller"
+                             " not executing actions")
+
+        self._controller = controller
+        self._address = address
+
+        # Requests processed by the engine thread, `None` stops it
+        self._requests = queue.Queue()
+        self._bridge = HubBridge()
+
+        # Recognition captured while processing a request. Only
+        # accessed by the engine thread.
+        self._recognition = None
+        controller.plugin_manager.recognition_forwarder = self._capture
+
+        family, bind_address = protocol.parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(bind_address):
+            os.unlink(bind_address)
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(bind_address)
+        listener.listen(128)
+        self._server = StreamServer(listener, self._handle)
+
+    log = property(lambda self:
+                   logging.getLogger("castervoice.RecognitionServer"),
+                   doc="Get class logger.")
+
+    address = property(lambda self: self._address,
+                       doc="Address the server listens on.")
+
+    def start(self):
+        """Start accepting connections on the hub."""
+        self._server.start()
+        self.log.info("Serving recognitions on %s", self._address)
+
+    def close(self):
+        """Stop accepting connections and stop `serve_engine`."""
+        self._server.stop()
+        self._requests.put(None)
+        family, bind_address = protocol.parse_address(self._address)
+        if family == socket.AF_UNIX and os.path.exists(bind_address):
+            os.unlink(bind_address)
+
+    def _handle(self, sock, _address):
+        if sock.family != socket.AF_UNIX:
+            # Frames are small, do not delay them
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = _Connection(sock)
+        writer = gevent.spawn(self._write, connection)
+        try:
+            while True:
+                frame = protocol.read_frame(sock)
+                if frame is None:
+                    break
+                self._dispatch(connection, *frame)
+        except (protocol.ProtocolError, OSError) as error:
+            self.log.warning("Closing connection: %s", error)
+        finally:
+            connection.closed = True
+            connection.responses.put(None)
+            writer.join()
+            sock.close()
+
+    def _dispatch(self, connection, message_type, request_id, payload):
+        if message_type == protocol.TEXT:
+            self._requests.put((connection, request_id, message_type,
+                                payload))
+        elif message_type == protocol.AUDIO:
+            audio = connection.audio.setdefault(request_id, bytearray())
+            audio += payload
+            if len(audio) > MAX_AUDIO_SIZE:
+                del connection.audio[request_id]
+                self._respond(connection, request_id, protocol.ERROR,
+                              b"Audio exceeds the maximum size")
+        elif message_type == protocol.AUDIO_END:
+            if request_id not in connection.audio:
+                self._respond(connection, request_id, protocol.ERROR,
+                              b"No audio received")
+                return
+            audio = bytes(connection.audio.pop(request_id))
+            self._requests.put((connection, request_id, message_type,
+                                audio))
+        else:
+            raise protocol.ProtocolError(f"Unknown message type"
+                                         f" {message_type:#x}")
+
+    @staticmethod
+    def _respond(connection, request_id, message_type, payload=b""):
+        if not connection.closed:
+            connection.responses.put(protocol.encode(message_type,
+                                                     request_id, payload))
+
+    def _write(self, connection):
+        while True:
+            frame = connection.responses.get()
+            if frame is None:
+                return
+            try:
+                connection.sock.sendall(frame)
+            except OSError as error:
+                self.log.warning("Failed sending response: %s", error)
+                return
+
+    def _capture(self, plugin, rule, node):
+        self._recognition = (plugin, rule, node)
+
+    def serve_engine(self):
+        """Process recognition requests until `close` is called.
+
+        Must run on the engine's thread. Blocks.
+
+        """
+        with self._controller.engine.connection():
+            while True:
+                request = self._requests.get()
+                if request is None:
+                    return
+
+                connection, request_id, message_type, payload = request
+                if connection.closed:
+                    continue
+                response_type, response = self._recognize(message_type,
+                                                          payload)
+                self._bridge.call(self._respond, connection, request_id,
+                                  response_type, response)
+
+    def _recognize(self, message_type, payload):
+        engine = self._controller.engine
+        self._recognition = None
+
+        self._bridge.call(watcher.publish, watcher.create_begin_event())
+        try:
+            if message_type == protocol.TEXT:
+                engine.mimic(payload.decode("utf-8").split())
+            elif hasattr(engine, "recognize_wave_file"):
+                self._recognize_audio(payload)
+            else:
+                return protocol.ERROR, \
+                    f"Engine '{engine.name}' can not recognize audio" \
+                    .encode("utf-8")
+        except MimicFailure:
+            pass
+        except Exception as error:  # pylint: disable=W0703
+            self.log.exception("Recognition failed")
+            return protocol.ERROR, str(error).encode("utf-8")
+
+        if self._recognition is None:
+            self._bridge.call(watcher.publish,
+                              watcher.create_failure_event())
+            return protocol.NO_MATCH, b""
+
+        plugin, rule, node = self._recognition
+        self._recognition = None
+        words = node.words()
+        self._bridge.call(watcher.publish,
+                          watcher.create_event(words, rule, node))
+
+        spec, action, extras = _describe_recognition(rule, node)
+        return protocol.RESULT, json.dumps({
+            "plugin": plugin.id,
+            "rule": rule.name,
+            "words": words,
+            "spec": spec,
+            "action": action,
+            "extras": extras,
+        }).encode("utf-8")
+
+    def _recognize_audio(self, audio):
+        with tempfile.NamedTemporaryFile(suffix=".wav",
+                                         delete=False) as wave_file:
+            path = wave_file.name
+        try:
+            with wave.open(path, "wb") as writer:
+                # pylint: disable=no-member
+                writer.setnchannels(protocol.AUDIO_CHANNELS)
+                writer.setsampwidth(protocol.AUDIO_SAMPLE_WIDTH)
+                writer.setframerate(protocol.AUDIO_SAMPLE_RATE)
+                writer.writeframes(audio)
+            self._controller.engine.recognize_wave_file(path)
+        finally:
+            os.unlink(path)
+
+
+def _describe_recognition(rule, node):
+    """Describe the action a recognition would execute.
+
+    :returns: `(spec, action, extras)` with the recognized spec of a
+              `MappingRule` (or `None`), the action's representation
+              (or `None`) and a dictionary of the recognition's extras
+
+    """
+    try:
+        value = node.value()
+    except Exception:  # pylint: disable=W0703
+        return None, None, {}
+
+    # Mapping rules bind their action to the recognition's extras
+    if isinstance(value, BoundAction):
+        # pylint: disable=protected-access
+        value = value._action
+
+    spec = None
+    data = {}
+    if isinstance(rule, MappingRule):
+        # The root's child is the alternative of all mappings
+        compound = node.children[0].children[0].actor
+        spec = rule.specs[rule.element.children.index(compound)]
+
+        # Same extras as `MappingRule.process_recognition`
+        # pylint: disable=protected-access
+        data.update(rule._defaults)
+        for name, element in rule._extras.items():
+            extra_node = node.get_child_by_name(name, shallow=True)
+            if extra_node:
+                data[name] = extra_node.value()
+            elif element.has_default():
+                data[name] = element.default
+
+    extras = {name: extra if isinstance(extra, (str, int, float, bool))
+              or extra is None else str(extra)
+              for name, extra in data.items() if not name.startswith("_")}
+    return spec, None if value is None else repr(value), extras
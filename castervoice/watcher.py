@@ -1,61 +1,486 @@
+import itertools
+import time
+
 import gevent.queue
 
 from castervoice.core.controller import Controller
+from castervoice.metrics import recognition_metrics
+
+# Overflow policies of a consumer `Subscription`
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+DISCONNECT = "disconnect"
+
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+DEFAULT_CAPACITY = 100
+
+# Event types
+RECOGNITION = "recognition"
+BEGIN = "begin"
+FAILURE = "failure"
+
+EVENT_TYPES = (RECOGNITION, BEGIN, FAILURE)
+
+# Interval in seconds in which idle event streams send a keep alive
+# comment. Writing to the stream is the only way to notice that a
+# client went away.
+KEEP_ALIVE_INTERVAL = 15
+
+KEEP_ALIVE = b": keep-alive\n\n"
 
-consumer_queues = []
+# Number of recent events kept to be replayed to reconnecting clients
+REPLAY_CAPACITY = 1000
+
+subscriptions = []
+
+# Index key of subscriptions without a plugin filter. Unlike `None` it
+# can not collide with the plugin id of an event.
+_ALL_PLUGINS = object()
+
+# Index of `subscriptions` by event type and plugin id. Subscriptions
+# without a plugin filter are indexed under `(type, _ALL_PLUGINS)`.
+_plugin_subscriptions = {}
+
+_sequence = itertools.count(1)
 
 
 class RecognitionEvent:
+    # pylint: disable=too-many-instance-attributes
 
-    def __init__(self, plugin_name, words, rule, node):
-        self.plugin_name = plugin_name
-        self.words = words
-        self.rule = rule
-        self.node = node
+    """Immutable snapshot of a recognition.
 
+    Events do not reference dragonfly's rule or node objects so that
+    queued events do not keep grammars alive. The executed action is
+    kept as a string instead.
 
-def new_queue():
-    queue = gevent.queue.Queue()
-    consumer_queues.append(queue)
-    return queue
+    `begin` and `failure` events have neither a plugin id, a rule name,
+    words nor an action.
 
+    """
 
-def on_recognition(words, rule, node):
-    plugin_name = None
-    for plugin_name, plugin in Controller.get().plugin_manager.plugins.items():
-        if rule.grammar in plugin.grammars:
-            break
+    __slots__ = ("_sequence", "_timestamp", "_plugin_id", "_rule_name",
+                 "_words", "_action", "_event_type", "_payload")
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, sequence, timestamp, plugin_id, rule_name, words,
+                 event_type=RECOGNITION, action=None):
+        self._sequence = sequence
+        self._timestamp = timestamp
+        self._plugin_id = plugin_id
+        self._rule_name = rule_name
+        self._words = tuple(words)
+        self._action = action
+        self._event_type = event_type
+        self._payload = None
+
+    sequence = property(lambda self: self._sequence,
+                        doc="Monotonically increasing event number.")
+
+    timestamp = property(lambda self: self._timestamp,
+                         doc="Time of the recognition (`time.time()`).")
+
+    plugin_id = property(lambda self: self._plugin_id,
+                         doc="Id of the plugin owning the recognized rule.")
+
+    rule_name = property(lambda self: self._rule_name,
+                         doc="Name of the recognized rule.")
+
+    words = property(lambda self: self._words,
+                     doc="Tuple of recognized words.")
+
+    action = property(lambda self: self._action,
+                      doc="Representation of the executed action or"
+                          " `None`.")
+
+    event_type = property(lambda self: self._event_type,
+                          doc="One of `EVENT_TYPES`.")
+
+    @property
+    def payload(self):
+        """Server-sent event of the recognition as bytes.
+
+        Formatted once on first access and shared by all consumers.
+        Events other than recognitions are named by their type, so
+        browsers only dispatch them to listeners of that type.
+
+        """
+        if self._payload is None:
+            if self._event_type == RECOGNITION:
+                self._payload = (f"id: {self._sequence}\n"
+                                 f"data: {self._plugin_id}:"
+                                 f" {' '.join(self._words)}\n\n").encode()
+            else:
+                self._payload = (f"id: {self._sequence}\n"
+                                 f"event: {self._event_type}\n"
+                                 f"data: {self._event_type}\n\n").encode()
+        return self._payload
+
+
+class ReplayBuffer:
+
+    """Fixed size ring buffer of the most recent events.
+
+    Events are stored at the index given by their sequence number, so
+    looking up an event by sequence number is O(1) and replaying does
+    not copy the buffer.
+
+    """
+
+    def __init__(self, capacity=REPLAY_CAPACITY):
+        if capacity < 1:
+            raise ValueError("Replay buffer capacity must be at least 1")
+
+        self._events = [None] * capacity
+        self._latest = 0
+
+    capacity = property(lambda self: len(self._events),
+                        doc="Maximum number of buffered events.")
+
+    latest = property(lambda self: self._latest,
+                      doc="Sequence number of the most recent event.")
+
+    def append(self, event):
+        self._events[event.sequence % len(self._events)] = event
+        self._latest = event.sequence
+
+    def get(self, sequence):
+        """Get event with `sequence` or `None` if it is not buffered."""
+        event = self._events[sequence % len(self._events)]
+        if event is None or event.sequence != sequence:
+            return None
+        return event
+
+    def since(self, sequence, until=None):
+        """Generate buffered events following `sequence`.
+
+        :param sequence: Sequence number of the last event received
+        :param until: Sequence number of the last event to generate.
+                      Defaults to the most recent event.
+
+        """
+        until = self._latest if until is None else until
+        start = max(sequence + 1, until - len(self._events) + 1)
+        for current in range(start, until + 1):
+            # Events may be overwritten while a consumer replays
+            event = self.get(current)
+            if event is not None:
+                yield event
+
+
+class ConsumerDisconnected(Exception):
+
+    """Raised when reading from a disconnected `Subscription`."""
+
+
+class Subscription:
+
+    """Bounded consumer queue of recognition events.
+
+    When the queue is full the subscription's `policy` decides what
+    happens to a new event:
+
+        `drop-oldest`: Discard the oldest queued event.
+        `drop-newest`: Discard the new event.
+        `disconnect`: Unsubscribe the consumer. Subsequent reads
+                      raise `ConsumerDisconnected`.
+
+    Subscriptions only receive events of the given `plugins`, `rules`
+    and event `types`. Each filter matches all events if `None`. Empty
+    filters are rejected as they would not match any event. `begin` and
+    `failure` events do not pass plugin or rule filters.
+
+    """
+
+    # Sentinel waking up a reader blocked on a disconnected subscription
+    _DISCONNECTED = object()
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, policy=DROP_OLDEST,
+                 plugins=None, rules=None, types=None):
+
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}'. Must be"
+                             f" one of {OVERFLOW_POLICIES}")
+
+        if capacity < 1:
+            raise ValueError("Subscription capacity must be at least 1")
+
+        self._queue = gevent.queue.Queue(maxsize=capacity)
+        self._policy = policy
+        self._dropped = 0
+        self._disconnected = False
+        self._plugins = frozenset(plugins) if plugins is not None else None
+        self._rules = frozenset(rules) if rules is not None else None
+        self._types = frozenset(types) if types is not None else None
+        if frozenset() in (self._plugins, self._rules, self._types):
+            raise ValueError("Subscription filters must not be empty. Use"
+                             " `None` to receive events of all plugins,"
+                             " rules or types")
+
+        if self._types is not None and not self._types <= set(EVENT_TYPES):
+            raise ValueError(f"Unknown event types"
+                             f" {sorted(self._types - set(EVENT_TYPES))}."
+                             f" Must be in {EVENT_TYPES}")
+
+    policy = property(lambda self: self._policy,
+                      doc="Overflow policy.")
+
+    dropped = property(lambda self: self._dropped,
+                       doc="Number of events dropped due to overflow.")
+
+    disconnected = property(lambda self: self._disconnected,
+                            doc="Boolean indicating whether the consumer"
+                                " was disconnected.")
+
+    plugins = property(lambda self: self._plugins,
+                       doc="Plugin ids of received events or `None`.")
+
+    rules = property(lambda self: self._rules,
+                     doc="Rule names of received events or `None`.")
+
+    types = property(lambda self: self._types,
+                     doc="Types of received events or `None`.")
+
+    def matches(self, event):
+        """Boolean indicating whether `event` passes the filters."""
+        return (self._plugins is None or event.plugin_id in self._plugins) \
+            and (self._rules is None or event.rule_name in self._rules) \
+            and (self._types is None or event.event_type in self._types)
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def put(self, event):
+        """Queue `event` applying the overflow policy if full.
+
+        :param event: Recognition event
+
+        """
+        if self._disconnected:
+            return
+
+        try:
+            self._queue.put_nowait(event)
+            return
+        except gevent.queue.Full:
+            pass
+
+        self._dropped += 1
+
+        if self._policy == DROP_OLDEST:
+            self._queue.get_nowait()
+            self._queue.put_nowait(event)
+        elif self._policy == DISCONNECT:
+            unsubscribe(self)
+            self._disconnect()
+
+    def get(self, block=True, timeout=None):
+        """Get next event.
+
+        :param block: Block until an event is available
+        :param timeout: Seconds to block before raising `gevent.queue.Empty`
+        :returns: Recognition event
+
+        """
+        if self._disconnected:
+            raise ConsumerDisconnected()
+
+        event = self._queue.get(block, timeout)
+        if event is self._DISCONNECTED:
+            raise ConsumerDisconnected()
+
+        return event
+
+    def _disconnect(self):
+        self._disconnected = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(self._DISCONNECTED)
+
+
+replay_buffer = ReplayBuffer()
+
+
+def subscribe(capacity=DEFAULT_CAPACITY, policy=DROP_OLDEST, plugins=None,
+              rules=None, types=None):
+    """Subscribe to recognition events.
+
+    :param capacity: Maximum number of queued events
+    :param policy: Overflow policy
+    :param plugins: Only receive events of these plugin ids
+    :param rules: Only receive events of rules with these names
+    :param types: Only receive events of these `EVENT_TYPES`
+    :returns: Subscription
+
+    """
+    subscription = Subscription(capacity, policy, plugins, rules, types)
+    subscriptions.append(subscription)
+    for key in _index_keys(subscription):
+        _plugin_subscriptions.setdefault(key, []).append(subscription)
+    return subscription
+
+
+def _index_keys(subscription):
+    types = EVENT_TYPES if subscription.types is None else subscription.types
+    plugins = (_ALL_PLUGINS,) if subscription.plugins is None \
+        else subscription.plugins
+    return [(event_type, plugin_id)
+            for event_type in types for plugin_id in plugins]
+
+
+def unsubscribe(subscription):
+    """Stop delivering recognition events to `subscription`.
+
+    :param subscription: Subscription returned by `subscribe`
+
+    """
+    try:
+        subscriptions.remove(subscription)
+    except ValueError:
+        return
+
+    for key in _index_keys(subscription):
+        indexed = _plugin_subscriptions[key]
+        indexed.remove(subscription)
+        if not indexed:
+            del _plugin_subscriptions[key]
+
+
+def create_event(words, rule, node=None):
+    """Snapshot a recognition of `rule` and record its metrics.
+
+    Called on the engine's thread.
+
+    :param node: Recognized node, its value is the executed action
+    :returns: `RecognitionEvent`
+
+    """
+    plugin = Controller.get().plugin_manager.get_grammar_plugin(rule.grammar)
 
     # It would be odd recognizing a rule which is not present in
     # any plugin's grammar
-    assert plugin_name
+    assert plugin
+
+    recognition_metrics.on_recognition(plugin.id, rule.name)
+
+    action = repr(node.value()) if node is not None else None
+
+    return RecognitionEvent(next(_sequence), time.time(), plugin.id,
+                            rule.name, words, action=action)
+
+
+def create_begin_event():
+    """Create an event of the start of speech and record its metrics.
+
+    Called on the engine's thread.
+
+    :returns: `RecognitionEvent`
+
+    """
+    recognition_metrics.on_begin()
+    return RecognitionEvent(next(_sequence), time.time(), None, None, (),
+                            BEGIN)
+
+
+def create_failure_event():
+    """Create an event of a failed recognition and record its metrics.
+
+    Called on the engine's thread.
+
+    :returns: `RecognitionEvent`
+
+    """
+    recognition_metrics.on_failure()
+    return RecognitionEvent(next(_sequence), time.time(), None, None, (),
+                            FAILURE)
 
-    recognition_event = RecognitionEvent(plugin_name, words, rule, node)
-    for queue in consumer_queues:
-        queue.put_nowait(recognition_event)
+
+def publish(event):
+    """Deliver `event` to interested subscriptions.
+
+    Must be called on the thread running the gevent hub.
+
+    """
+    replay_buffer.append(event)
+
+    # Only subscriptions interested in the type and plugin are visited.
+    # Copy as the `disconnect` policy unsubscribes.
+    event_type = event.event_type
+    for subscription in (
+            *_plugin_subscriptions.get((event_type, _ALL_PLUGINS), ()),
+            *_plugin_subscriptions.get((event_type, event.plugin_id), ())):
+        if subscription.rules is None \
+                or event.rule_name in subscription.rules:
+            subscription.put(event)
+
+
+def on_recognition(words, rule, node):
+    publish(create_event(words, rule, node))
 
 
 def on_begin():
+    publish(create_begin_event())
     print("Speech start detected.")
 
 
+def on_post_recognition(words):
+    # pylint: disable=unused-argument
+    recognition_metrics.on_post_recognition()
+
+
 def on_failure():
+    publish(create_failure_event())
     print("Sorry, what was that?")
 
 
 def log():
-    queue = new_queue()
+    subscription = subscribe(types=[RECOGNITION])
     while True:
-        reco = queue.get()
+        reco = subscription.get()
         print(f"Recognized: {' '.join(reco.words)}")
-        print(f"    Executing rule: {reco.rule}")
-        print(f"    Action: {reco.node.value()}")
+        print(f"    Executing rule: {reco.plugin_id}:{reco.rule_name}")
+        if reco.action is not None:
+            print(f"    Action: {reco.action}")
 
 
-def stream_recognitions():
-    queue = new_queue()
+def stream_recognitions(capacity=DEFAULT_CAPACITY, policy=DROP_OLDEST,
+                        last_event_id=None, plugins=None, rules=None,
+                        types=None):
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    """Generate server-sent events of recognitions as bytes.
 
-    while True:
-        reco = queue.get()
-        s = f"{reco.plugin_name}: {' '.join(reco.words)}"
-        yield f"data: {s}\n\n"
+    The subscription is removed once the client disconnects (the
+    generator is closed) or, with the `disconnect` policy, once the
+    client falls behind.
+
+    :param last_event_id: Sequence number of the last event a
+                          reconnecting client received. Buffered events
+                          following it are replayed first.
+    :param plugins: Only stream events of these plugin ids
+    :param rules: Only stream events of rules with these names
+    :param types: Only stream events of these `EVENT_TYPES`
+
+    """
+    subscription = subscribe(capacity, policy, plugins, rules, types)
+
+    try:
+        if last_event_id is not None:
+            # Events after `replayed` are delivered by the subscription
+            replayed = replay_buffer.latest
+            if last_event_id < replayed:
+                for reco in replay_buffer.since(last_event_id, replayed):
+                    if subscription.matches(reco):
+                        yield reco.payload
+
+        while True:
+            try:
+                reco = subscription.get(timeout=KEEP_ALIVE_INTERVAL)
+            except gevent.queue.Empty:
+                yield KEEP_ALIVE
+                continue
+            except ConsumerDisconnected:
+                return
+
+            yield reco.payload
+    finally:
+        unsubscribe(subscription)
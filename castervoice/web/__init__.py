@@ -1,14 +1,45 @@
-from flask import Flask, Response, request
+from flask import Flask, Response, abort, request
 
-from castervoice.watcher import stream_recognitions
+from castervoice import watcher
+from castervoice.core.controller import Controller
+from castervoice.metrics import recognition_metrics, render_action_queue
 
 app = Flask(__package__)
 
 
+@app.route('/metrics')
+def metrics():
+    text = recognition_metrics.render()
+
+    controller = Controller.get()
+    if controller is not None \
+            and controller.plugin_manager.action_queue is not None:
+        text += render_action_queue(controller.plugin_manager.action_queue)
+
+    return Response(text,
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app.route('/events')
 def index():
     if request.headers.get('accept') == 'text/event-stream':
-        return Response(stream_recognitions(),
+        capacity = request.args.get('capacity', watcher.DEFAULT_CAPACITY,
+                                    type=int)
+        policy = request.args.get('policy', watcher.DROP_OLDEST)
+        if capacity < 1 or policy not in watcher.OVERFLOW_POLICIES:
+            abort(400)
+
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        plugins = request.args.getlist('plugin') or None
+        rules = request.args.getlist('rule') or None
+        types = request.args.getlist('type') or None
+        if types is not None \
+                and not set(types) <= set(watcher.EVENT_TYPES):
+            abort(400)
+
+        return Response(watcher.stream_recognitions(capacity, policy,
+                                                    last_event_id,
+                                                    plugins, rules, types),
                         content_type='text/event-stream')
     return """
 <!doctype html>
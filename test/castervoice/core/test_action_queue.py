@@ -0,0 +1,190 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from dragonfly import Function, Grammar, MappingRule, get_engine
+
+from castervoice.core.action_queue import (
+        CANCELLED,
+        DONE,
+        EXPIRED,
+        ActionQueue
+        )
+from castervoice.core.plugin import Plugin, plugin as plugin_module
+
+
+class TestActionQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = ActionQueue(workers=4)
+
+    def tearDown(self):
+        self.queue.close()
+
+    def test_plugin_order(self):
+        calls = []
+
+        def action(plugin_id, index):
+            # Later actions would overtake earlier ones without ordering
+            time.sleep(0.001 * (5 - index))
+            calls.append((plugin_id, index))
+
+        for index in range(5):
+            for plugin_id in ("a", "b"):
+                self.queue.submit(plugin_id,
+                                  lambda p=plugin_id, i=index: action(p, i))
+        self.assertTrue(self.queue.join(5))
+
+        for plugin_id in ("a", "b"):
+            self.assertEqual([index for called, index in calls
+                              if called == plugin_id], list(range(5)))
+        self.assertEqual(self.queue.stats()[DONE], 10)
+        self.assertEqual(self.queue.execution_latency.count, 10)
+        self.assertEqual({plugin_id: histogram.count for plugin_id, histogram
+                          in self.queue.lane_wait_latency().items()},
+                         {"a": 5, "b": 5})
+
+    def test_plugins_run_concurrently(self):
+        release = threading.Event()
+        self.queue.submit("slow", release.wait)
+
+        executed = threading.Event()
+        self.queue.submit("fast", executed.set)
+        self.assertTrue(executed.wait(5))
+
+        release.set()
+        self.assertTrue(self.queue.join(5))
+
+    def test_cancel_and_timeout(self):
+        started = threading.Event()
+        release = threading.Event()
+        self.queue.submit("plugin", lambda: started.set() or release.wait())
+        self.assertTrue(started.wait(5))
+        cancelled = self.queue.submit("plugin", lambda: None)
+        expired = self.queue.submit("plugin", lambda: None, timeout=0)
+        kept = self.queue.submit("plugin", lambda: None)
+        self.assertEqual(self.queue.depth, 3)
+
+        self.assertTrue(cancelled.cancel())
+        self.assertFalse(cancelled.cancel())
+        release.set()
+        with self.assertLogs("castervoice.ActionQueue", "WARNING"):
+            self.assertTrue(self.queue.join(5))
+
+        self.assertEqual(cancelled.state, CANCELLED)
+        self.assertEqual(expired.state, EXPIRED)
+        self.assertEqual(kept.state, DONE)
+        self.assertEqual(self.queue.depth, 0)
+
+    def test_failure(self):
+        def fail():
+            raise RuntimeError("action failed")
+
+        with self.assertLogs("castervoice.ActionQueue", "ERROR"):
+            self.queue.submit("plugin", fail)
+            self.assertTrue(self.queue.join(5))
+        self.queue.submit("plugin", lambda: None)
+        self.assertTrue(self.queue.join(5))
+        self.assertEqual(self.queue.stats()["failed"], 1)
+        self.assertEqual(self.queue.stats()[DONE], 1)
+
+
+class QueuedPlugin(Plugin):
+    # pylint: disable=abstract-method
+
+    queue_actions = True
+
+    def __init__(self, manager):
+        super().__init__(manager)
+        self.threads = []
+
+    def get_grammars(self):
+        grammar = Grammar("queued")
+        grammar.add_rule(MappingRule(name="queued", mapping={
+            "queued action": Function(
+                lambda: self.threads.append(threading.current_thread()))}))
+        return [grammar]
+
+
+class ReusedGrammarPlugin(QueuedPlugin):
+    # pylint: disable=abstract-method
+
+    def __init__(self, manager):
+        super().__init__(manager)
+        self.reused = super().get_grammars()
+
+    def get_grammars(self):
+        # Same grammar objects on every load
+        return self.reused
+
+
+class MockPluginManager():
+
+    state_directory = None
+    state_writer = None
+    state_store = None
+    execute_actions = True
+
+    def __init__(self):
+        self.action_queue = ActionQueue(workers=1)
+
+    def restore_grammars(self, plugin):
+        # pylint: disable=unused-argument
+        return None
+
+    def cache_grammars(self, plugin, grammars):
+        pass
+
+    def register_grammar(self, plugin, grammar):
+        pass
+
+    def unregister_grammar(self, grammar):
+        pass
+
+
+class TestQueuedPlugin(unittest.TestCase):
+
+    def test_mimic(self):
+        engine = get_engine("text")
+        manager = MockPluginManager()
+        plugin = QueuedPlugin(manager)
+        plugin.load()
+        try:
+            with mock.patch.object(plugin_module,
+                                   "recognition_metrics") as metrics:
+                engine.mimic("queued action")
+                self.assertTrue(manager.action_queue.join(5))
+        finally:
+            plugin.unload()
+            manager.action_queue.close()
+
+        # Execution latency is recorded once the worker executed the
+        # action
+        metrics.on_executed.assert_called_once_with(
+                metrics.defer_execution.return_value)
+
+        self.assertEqual(len(plugin.threads), 1)
+        self.assertIsNot(plugin.threads[0], threading.current_thread())
+
+    def test_reload(self):
+        engine = get_engine("text")
+        manager = MockPluginManager()
+        plugin = ReusedGrammarPlugin(manager)
+        rule = plugin.reused[0].rules[0]
+        try:
+            for _ in range(4):
+                plugin.load()
+                plugin.unload()
+            self.assertIs(rule.process_recognition.__func__,
+                          MappingRule.process_recognition)
+
+            plugin.load()
+            engine.mimic("queued action")
+            self.assertTrue(manager.action_queue.join(5))
+        finally:
+            plugin.unload()
+            manager.action_queue.close()
+
+        self.assertEqual(manager.action_queue.stats()[DONE], 1)
+        self.assertEqual(len(plugin.threads), 1)
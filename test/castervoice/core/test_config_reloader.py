@@ -0,0 +1,176 @@
+import importlib
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import yaml
+from dragonfly import MimicFailure, get_engine
+
+from castervoice.core.config_reloader import ConfigDiff
+from castervoice.core.controller import Controller
+
+
+PLUGIN_SOURCE = """
+from dragonfly import Function, Grammar, MappingRule
+from castervoice.core.plugin import Plugin
+
+
+class ConfigPlugin(Plugin):
+    def get_grammars(self):
+        grammar = Grammar("config")
+        grammar.add_rule(MappingRule(mapping={
+            "say " + self.config["word"]: Function(lambda: None)}))
+        return [grammar]
+"""
+
+
+def make_config(word="one", contexts=None):
+    return {"engine": {"text": {}},
+            "plugins": {"config": {"configplugin": {"word": word}}},
+            "contexts": contexts or [{"name": "global",
+                                      "plugins": ["configplugin"]},
+                                     {"name": "code",
+                                      "executable": "code"}]}
+
+
+class TestConfigDiff(unittest.TestCase):
+
+    def test_diff(self):
+        old = make_config()
+        new = make_config("two", [{"name": "global", "plugins": []},
+                                  {"name": "term", "executable": "term"}])
+        new["plugins"]["packages"] = [{"pip": "package"}]
+        new["engine"] = {"kaldi": {}}
+
+        diff = ConfigDiff(old, new)
+        self.assertEqual(diff.added_contexts, ["term"])
+        self.assertEqual(diff.removed_contexts, ["code"])
+        self.assertEqual(diff.changed_contexts, ["global"])
+        self.assertEqual(diff.changed_plugin_configs, ["configplugin"])
+        self.assertEqual(diff.added_packages, [{"pip": "package"}])
+        self.assertEqual(diff.restart_required, ["engine"])
+
+    def test_unchanged(self):
+        self.assertFalse(ConfigDiff(make_config(), make_config()))
+
+
+class TestConfigReload(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = get_engine("text")
+
+        # pylint: disable=consider-using-with
+        self.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.directory.name, "configplugin.py"), "w",
+                  encoding="utf-8") as plugin_file:
+            plugin_file.write(PLUGIN_SOURCE)
+        sys.path.insert(0, self.directory.name)
+        importlib.invalidate_caches()
+
+        self.write_config(make_config())
+        self.controller = Controller(config_dir=self.directory.name)
+
+    def tearDown(self):
+        self.controller.plugin_manager.unload_plugins()
+        sys.path.remove(self.directory.name)
+        sys.modules.pop("configplugin", None)
+        self.directory.cleanup()
+
+    def write_config(self, config):
+        with open(os.path.join(self.directory.name, "caster.yml"), "w",
+                  encoding="utf-8") as config_file:
+            yaml.dump(config, config_file)
+
+    def test_plugin_config(self):
+        self.engine.mimic("say one")
+
+        self.write_config(make_config("two"))
+        diff = self.controller.reload_config()
+        self.assertEqual(diff.changed_plugin_configs, ["configplugin"])
+        self.assertFalse(diff.contexts_changed)
+
+        self.engine.mimic("say two")
+        with self.assertRaises(MimicFailure):
+            self.engine.mimic("say one")
+
+    def test_contexts(self):
+        context_manager = self.controller.context_manager
+        global_context = context_manager.contexts["global"]
+        code_context = context_manager.contexts["code"]
+        plugin = self.controller.plugin_manager.plugins["configplugin"]
+
+        self.write_config(make_config(contexts=[
+                {"name": "global", "plugins": ["configplugin"]},
+                {"name": "code", "executable": "vim"},
+                {"name": "term", "executable": "term"}]))
+        diff = self.controller.reload_config()
+        self.assertEqual(diff.added_contexts, ["term"])
+        self.assertEqual(diff.changed_contexts, ["code"])
+
+        # Unchanged contexts and plugins are kept
+        self.assertIs(context_manager.contexts["global"], global_context)
+        self.assertIsNot(context_manager.contexts["code"], code_context)
+        self.assertIs(self.controller.plugin_manager.plugins["configplugin"],
+                      plugin)
+
+        self.write_config(make_config(contexts=[{"name": "global",
+                                                 "plugins": []}]))
+        self.controller.reload_config()
+        self.assertNotIn("configplugin",
+                         self.controller.plugin_manager.plugins)
+        with self.assertRaises(MimicFailure):
+            self.engine.mimic("say one")
+
+    def test_invalid_config(self):
+        with open(os.path.join(self.directory.name, "caster.yml"), "w",
+                  encoding="utf-8") as config_file:
+            config_file.write("contexts: {")
+
+        with self.assertLogs("castervoice", "ERROR"):
+            self.assertIsNone(self.controller.reload_config())
+        self.engine.mimic("say one")
+
+    def test_context_graph_collected(self):
+        graph = self.controller.context_manager.graph
+        nodes = len(graph.nodes)
+
+        for executable in ("vim", "term", "code"):
+            self.write_config(make_config(contexts=[
+                    {"name": "global", "plugins": ["configplugin"]},
+                    {"name": "code", "executable": executable}]))
+            self.controller.reload_config()
+
+        self.assertEqual(len(graph.nodes), nodes)
+        self.assertTrue(self.controller.context_manager.contexts["code"]
+                        .matches("code", "title", 1))
+
+    def test_packages_installed_in_background(self):
+        installing = threading.Event()
+        installed = threading.Event()
+
+        def install_packages(_packages):
+            installing.set()
+            installed.wait(5)
+            return []
+
+        config = make_config("two")
+        config["plugins"]["packages"] = [{"pip": "package"}]
+        self.write_config(config)
+        with mock.patch.object(self.controller.dependency_manager,
+                               "install_packages", install_packages):
+            diff = self.controller.reload_config()
+            self.assertEqual(diff.added_packages, [{"pip": "package"}])
+            self.assertTrue(installing.wait(5))
+
+            # Nothing changes until the packages are installed
+            self.assertFalse(self.controller.apply_pending_config())
+            self.engine.mimic("say one")
+
+            installed.set()
+            self.assertTrue(self.controller.apply_pending_config(5))
+
+        self.engine.mimic("say two")
+        self.assertFalse(self.controller.apply_pending_config())
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from castervoice.core.config_snapshot import validate_config
+from castervoice.core.controller import Controller
+
+
+CONFIG = """
+engine:
+  text: {}
+contexts:
+  - name: code
+    executable: code
+"""
+
+
+class TestConfigSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.directory = tempfile.TemporaryDirectory()
+        self.write_config(CONFIG)
+        self.controller = Controller({"engine": {"text": {}}})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_config(self, content):
+        path = os.path.join(self.directory.name, "caster.yml")
+        with open(path, "w", encoding="utf-8") as config_file:
+            config_file.write(content)
+
+    def load(self):
+        return self.controller.load_config(None, self.directory.name)
+
+    def test_warm_load(self):
+        config = self.load()
+        self.assertEqual(config["contexts"],
+                         [{"name": "code", "executable": "code",
+                           "plugins": []}])
+        self.assertEqual(config["plugins"], {})
+
+        with mock.patch("yaml.load") as load:
+            self.assertEqual(self.load(), config)
+        load.assert_not_called()
+
+    def test_changed_file(self):
+        self.load()
+        self.write_config(CONFIG.replace("code", "term"))
+        self.assertEqual(self.load()["contexts"][0]["name"], "term")
+
+    def test_invalid_snapshot(self):
+        self.load()
+        with open(os.path.join(self.directory.name, "caster.yml.snapshot"),
+                  "wb") as snapshot_file:
+            snapshot_file.write(b"invalid")
+
+        with self.assertLogs("castervoice.ConfigSnapshot", "ERROR"):
+            self.assertEqual(self.load()["contexts"][0]["name"], "code")
+
+
+class TestValidateConfig(unittest.TestCase):
+
+    def test_defaults(self):
+        self.assertEqual(validate_config({"plugins": None}),
+                         {"plugins": {}, "contexts": []})
+
+    def test_invalid(self):
+        for config in ([], {"plugins": []}, {"contexts": {}},
+                       {"contexts": [{"executable": "code"}]},
+                       {"contexts": [{"name": "code", "plugins": "a"}]}):
+            with self.assertRaises(ValueError):
+                validate_config(config)
@@ -0,0 +1,111 @@
+import unittest
+
+from dragonfly import Context as DragonflyContext
+
+from castervoice.core.context import ConfigContext
+from castervoice.core.context_manager import ContextManager
+
+
+class CountingContext(DragonflyContext):
+
+    def __init__(self, result=True):
+        super().__init__()
+        self.result = result
+        self.calls = 0
+
+    def matches(self, executable, title, handle):
+        self.calls += 1
+        return self.result
+
+
+class MockPluginManager():
+
+    def __init__(self):
+        self.plugin_context = CountingContext()
+
+    def import_plugins(self, plugin_ids):
+        pass
+
+    def get_context(self, plugin_id, desired_state):
+        # pylint: disable=unused-argument
+        return self.plugin_context
+
+
+class MockController():
+    plugin_manager = None
+    context_manager = None
+
+
+class TestContextManager(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = MockController()
+        self.controller.plugin_manager = MockPluginManager()
+        self.manager = ContextManager(self.controller, [])
+        self.controller.context_manager = self.manager
+
+    def context(self, extends=None, **config):
+        context = ConfigContext(self.manager, config, extends)
+        self.manager.contexts[context.name] = context
+        return context
+
+    @property
+    def plugin_context_calls(self):
+        return self.controller.plugin_manager.plugin_context.calls
+
+    def test_shared_plugin_node(self):
+        first = self.context(name="first", plugin={"mode": "normal"})
+        second = self.context(name="second", executable="code",
+                              plugin={"mode": "normal"})
+
+        self.assertIs(first.node.children[-1], second.node.children[-1])
+
+    def test_evaluated_once_per_window(self):
+        contexts = [self.context(name=str(i), executable="code")
+                    for i in range(5)]
+
+        for context in contexts:
+            self.assertTrue(context.matches("code", "title", 1))
+        self.assertEqual(self.manager.cache_misses, 1)
+        self.assertEqual(self.manager.cache_hits, 4)
+
+        self.assertFalse(contexts[0].matches("other", "title", 2))
+        self.assertEqual(self.manager.cache_misses, 2)
+
+    def test_plugin_evaluated_per_check(self):
+        contexts = [self.context(name=str(i), plugin="state")
+                    for i in range(5)]
+
+        for context in contexts:
+            self.assertTrue(context.matches("code", "title", 1))
+        self.assertEqual(self.plugin_context_calls, 5)
+        self.assertEqual(self.manager.cache_hits, 4)
+
+    def test_invalidated_on_disable(self):
+        context = self.context(name="code", executable="code")
+
+        self.assertTrue(context.matches("code", "title", 1))
+        context.disable()
+        self.assertFalse(context.matches("code", "title", 1))
+        self.assertEqual(self.manager.cache_misses, 2)
+
+    def test_plugin_state_change(self):
+        context = self.context(name="state", plugin="state")
+
+        self.assertTrue(context.matches("code", "title", 1))
+        self.controller.plugin_manager.plugin_context.result = False
+        self.assertFalse(context.matches("code", "title", 1))
+
+    def test_cheap_tests_first(self):
+        context = self.context(name="code", executable="code",
+                               plugin="state")
+
+        self.assertFalse(context.matches("other", "title", 1))
+        self.assertEqual(self.plugin_context_calls, 0)
+
+    def test_extends(self):
+        base = self.context(name="base", executable="code")
+        extended = self.context(base, name="extended", plugin="state")
+
+        self.assertFalse(extended.matches("other", "title", 1))
+        self.assertTrue(extended.matches("code", "title", 1))
@@ -0,0 +1,100 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from castervoice.core import dependency_manager
+from castervoice.core.dependency_manager import DependencyManager
+
+
+class MockController():
+    dev_mode = False
+
+
+class TestDependencyManager(unittest.TestCase):
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.directory = tempfile.TemporaryDirectory()
+        self.manager = DependencyManager(MockController(),
+                                         self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_requirement_satisfied(self):
+        self.assertTrue(self.manager.is_satisfied("PyYAML"))
+        self.assertTrue(self.manager.is_satisfied("PyYAML>=1.0"))
+        self.assertFalse(self.manager.is_satisfied("PyYAML<1.0"))
+        self.assertFalse(self.manager.is_satisfied("not-a-caster-package"))
+
+    def test_manifest_satisfied(self):
+        url = "git+https://example.com/caster-plugins.git"
+        self.assertFalse(self.manager.is_satisfied(url))
+
+        self.manager.manifest.record(url, name="not-a-caster-package",
+                                     version="1.0", source=url)
+        self.assertFalse(self.manager.is_satisfied(url))
+
+        self.manager.manifest.record(url, name="PyYAML",
+                                     version=_pyyaml_version(),
+                                     source=url)
+        self.assertTrue(self.manager.is_satisfied(url))
+
+        # Manifest is persisted
+        manager = DependencyManager(MockController(), self.directory.name)
+        self.assertTrue(manager.is_satisfied(url))
+        self.assertTrue(os.path.isdir(os.path.join(self.directory.name,
+                                                   "wheels")))
+
+    def test_nothing_to_install(self):
+        self.assertEqual(self.manager.install_packages([{"pip": "PyYAML"}]),
+                         [])
+
+    def test_install_without_report(self):
+        with mock.patch.object(dependency_manager, "_pip_supports_report",
+                               return_value=False), \
+                mock.patch("subprocess.check_call") as check_call:
+            self.manager.install_package({"pip": "PyYAML>=1.0"})
+
+        self.assertNotIn("--report", check_call.call_args[0][0])
+        self.assertEqual(self.manager.manifest.get("PyYAML>=1.0"),
+                         {"name": "PyYAML", "version": _pyyaml_version(),
+                          "source": None})
+
+    def test_offline_fallback(self):
+        self.manager.manifest.record("PyYAML", name="PyYAML",
+                                     version="1.0", source=None)
+        commands = []
+
+        def check_call(command):
+            commands.append(command)
+            if len(commands) == 1:
+                raise subprocess.CalledProcessError(1, command)
+
+        controller = MockController()
+        controller.dev_mode = True
+        manager = DependencyManager(controller, self.directory.name)
+        with mock.patch("subprocess.check_call", check_call):
+            manager.install_package({"pip": "PyYAML"})
+
+        self.assertIn("-e", commands[0])
+        self.assertNotIn("-e", commands[1])
+        self.assertNotIn("--report", commands[1])
+        self.assertEqual(commands[1][-2:], ["--no-index", "PyYAML==1.0"])
+
+    def test_without_metadata(self):
+        # pylint: disable=protected-access
+        with mock.patch.object(dependency_manager, "metadata", None):
+            dependency_manager._pip_supports_report.cache_clear()
+            try:
+                self.assertFalse(dependency_manager._pip_supports_report())
+            finally:
+                dependency_manager._pip_supports_report.cache_clear()
+
+
+def _pyyaml_version():
+    # pylint: disable=import-outside-toplevel
+    from importlib import metadata
+    return metadata.version("PyYAML")
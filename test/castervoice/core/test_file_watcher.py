@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from castervoice.core.file_watcher import InotifyWatcher, PollingWatcher
+
+
+class FileWatcherTests():
+    # pylint: disable=no-member
+
+    def create_watcher(self):
+        raise NotImplementedError()
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.directory = tempfile.TemporaryDirectory()
+        self.package = os.path.join(self.directory.name, "package")
+        os.mkdir(self.package)
+        self.watcher = self.create_watcher()
+
+    def tearDown(self):
+        self.watcher.close()
+        self.directory.cleanup()
+
+    def write(self, path, content):
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+
+    def test_package_changes(self):
+        module = os.path.join(self.package, "module.py")
+        self.write(module, "")
+        self.watcher.watch(self.package)
+        self.assertEqual(self.watcher.changes(), set())
+
+        self.write(module, "changed = True")
+        self.assertIn(module, self.watcher.changes())
+
+    def test_unwatched_file(self):
+        module = os.path.join(self.directory.name, "module.py")
+        other = os.path.join(self.directory.name, "other.py")
+        self.write(module, "")
+        self.write(other, "")
+        self.watcher.watch(module)
+        self.assertEqual(self.watcher.changes(), set())
+
+        self.write(other, "changed = True")
+        self.assertEqual(self.watcher.changes(), set())
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "Requires Linux")
+class TestInotifyWatcher(FileWatcherTests, unittest.TestCase):
+
+    def create_watcher(self):
+        return InotifyWatcher()
+
+
+class TestPollingWatcher(FileWatcherTests, unittest.TestCase):
+
+    def create_watcher(self):
+        return PollingWatcher(interval=0)
+
+    def write(self, path, content):
+        super().write(path, content)
+        # Ensure the modification time changes on coarse clocks
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
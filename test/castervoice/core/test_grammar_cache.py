@@ -0,0 +1,99 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+
+from dragonfly import Function, Grammar, MappingRule, get_engine
+
+from castervoice.core.plugin import Plugin
+from castervoice.core.plugin.grammar_cache import GrammarCache
+
+
+def action():
+    pass
+
+
+class CacheablePlugin(Plugin):
+
+    grammars_cacheable = True
+
+    def get_context(self, desired_state=None):
+        return None
+
+    def get_grammars(self):
+        grammar = Grammar("cached_grammar")
+        grammar.add_rule(MappingRule(mapping={"cached grammar":
+                                              Function(action)}))
+        return [grammar]
+
+
+EDITED_PLUGIN_SOURCE = """
+from dragonfly import Grammar, MappingRule, Text
+from castervoice.core.plugin import Plugin
+
+
+class EditedPlugin(Plugin):
+
+    grammars_cacheable = True
+
+    def get_grammars(self):
+        grammar = Grammar("edited_grammar")
+        grammar.add_rule(MappingRule(name="edited", mapping={{
+            "{word} word": Text("word")}}))
+        return [grammar]
+"""
+
+
+class TestGrammarCache(unittest.TestCase):
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = GrammarCache(self.directory.name, get_engine("text"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_restore(self):
+        plugin = CacheablePlugin(None)
+        self.assertIsNone(self.cache.load(plugin))
+
+        self.cache.store(plugin, plugin.get_grammars())
+        grammars = self.cache.load(plugin)
+        self.assertEqual([grammar.name for grammar in grammars],
+                         ["cached_grammar"])
+        self.assertIs(grammars[0].engine, get_engine())
+
+    def test_eviction(self):
+        plugin = CacheablePlugin(None)
+        cache = GrammarCache(self.directory.name, get_engine("text"), 0)
+
+        cache.store(plugin, plugin.get_grammars())
+        self.assertIsNone(cache.load(plugin))
+
+    def test_edited_source(self):
+        sys.path.insert(0, self.directory.name)
+        path = os.path.join(self.directory.name, "editedplugin.py")
+        try:
+            specs = []
+            for word in ("alpha", "beta"):
+                with open(path, "w", encoding="utf-8") as plugin_file:
+                    plugin_file.write(
+                            EDITED_PLUGIN_SOURCE.format(word=word))
+                importlib.invalidate_caches()
+                if "editedplugin" in sys.modules:
+                    importlib.reload(sys.modules["editedplugin"])
+                module = importlib.import_module("editedplugin")
+
+                plugin = module.EditedPlugin(None)
+                grammars = self.cache.load(plugin)
+                if grammars is None:
+                    grammars = plugin.get_grammars()
+                    self.cache.store(plugin, grammars)
+                specs.append(grammars[0].rules[0].specs)
+        finally:
+            sys.path.remove(self.directory.name)
+            sys.modules.pop("editedplugin", None)
+
+        self.assertEqual(specs, [["alpha word"], ["beta word"]])
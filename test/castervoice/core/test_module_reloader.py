@@ -0,0 +1,66 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+
+from dragonfly import get_engine
+
+from castervoice.core.dependency_manager import ModuleReloader
+
+
+MODULES = {
+    "reloadpkg/__init__.py": "",
+    "reloadpkg/base.py": "VALUE = 1\n",
+    "reloadpkg/middle.py": "from reloadpkg import base\n"
+                           "from reloadpkg.base import VALUE\n",
+    "reloadpkg/top.py": "import reloadpkg.middle\n"
+                        "from . import middle\n",
+    "reloadpkg/other.py": "",
+}
+
+
+class TestModuleReloader(unittest.TestCase):
+
+    def setUp(self):
+        get_engine("text")
+
+        # pylint: disable=consider-using-with
+        self.directory = tempfile.TemporaryDirectory()
+        for path, source in MODULES.items():
+            path = os.path.join(self.directory.name, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as module_file:
+                module_file.write(source)
+        sys.path.insert(0, self.directory.name)
+
+        self.reloader = ModuleReloader()
+        importlib.import_module("reloadpkg.top")
+        importlib.import_module("reloadpkg.other")
+
+    def tearDown(self):
+        self.reloader.close()
+        sys.path.remove(self.directory.name)
+        for name in list(sys.modules):
+            if name.startswith("reloadpkg"):
+                del sys.modules[name]
+        self.directory.cleanup()
+
+    def test_dependencies_deduplicated(self):
+        self.assertEqual(self.reloader.dependencies("reloadpkg.middle"),
+                         {"reloadpkg", "reloadpkg.base"})
+
+        importlib.reload(sys.modules["reloadpkg.middle"])
+        self.assertEqual(self.reloader.dependencies("reloadpkg.middle"),
+                         {"reloadpkg", "reloadpkg.base"})
+
+    def test_transitive_dependents(self):
+        self.assertEqual(self.reloader.dependents({"reloadpkg.base"}),
+                         {"reloadpkg.base", "reloadpkg.middle",
+                          "reloadpkg.top"})
+
+    def test_reload_order(self):
+        affected = self.reloader.dependents({"reloadpkg.base"})
+        self.assertEqual(self.reloader.reload_order(affected),
+                         ["reloadpkg.base", "reloadpkg.middle",
+                          "reloadpkg.top"])
@@ -1,7 +1,11 @@
 import tempfile
+import time
 import unittest
+from unittest import mock
 
-from castervoice.core.plugin import Plugin
+from dragonfly import AppContext, Function, Grammar, MappingRule, get_engine
+
+from castervoice.core.plugin import Plugin, PluginManager
 
 
 class MockPlugin(Plugin):
@@ -20,6 +24,10 @@ class MockPluginManager():
     # pylint: disable=consider-using-with
     d = tempfile.TemporaryDirectory()
     state_directory = d.name
+    state_writer = None
+    state_store = None
+    action_queue = None
+    execute_actions = True
 
 
 class TestPlugin(unittest.TestCase):
@@ -45,3 +53,139 @@ class TestPlugin(unittest.TestCase):
         del plugin
         plugin = MockPlugin(manager)
         self.assertEqual(plugin.state, state)
+
+
+class GrammarPlugin(MockPlugin):
+    def get_grammars(self):
+        grammar = Grammar("test_grammar")
+        grammar.add_rule(MappingRule(mapping={"test grammar index":
+                                              Function(lambda: None)}))
+        return [grammar]
+
+
+class FailingPlugin(MockPlugin):
+    def get_grammars(self):
+        raise RuntimeError("Failed building grammars")
+
+
+class FailingGrammar(Grammar):
+    def load(self):
+        raise RuntimeError("Failed loading grammar")
+
+
+class FailingLoadPlugin(MockPlugin):
+    def get_grammars(self):
+        grammar = Grammar("loaded_grammar")
+        grammar.add_rule(MappingRule(mapping={"loaded grammar":
+                                              Function(lambda: None)}))
+        return [grammar, FailingGrammar("failing_grammar")]
+
+
+class TestPluginManager(unittest.TestCase):
+
+    def setUp(self):
+        get_engine("text")
+
+    def test_grammar_index(self):
+        manager = PluginManager(None, {}, None)
+        plugin = GrammarPlugin(manager)
+
+        plugin.load()
+        grammar = plugin.grammars[0]
+        self.assertIs(manager.get_grammar_plugin(grammar), plugin)
+
+        plugin.unload()
+        self.assertIsNone(manager.get_grammar_plugin(grammar))
+
+    def test_config_copied(self):
+        config = {'config': {'plugin': {'words': ['a']}}}
+        manager = PluginManager(None, config, None)
+        manager.get_config('plugin')['words'].append('b')
+
+        plugin_config = {'words': ['c']}
+        manager.set_config('other', plugin_config)
+        manager.get_config('other')['words'].append('d')
+
+        self.assertEqual(config, {'config': {'plugin': {'words': ['a']}}})
+        self.assertEqual(plugin_config, {'words': ['c']})
+
+    def test_load_failure_isolated(self):
+        manager = PluginManager(None, {}, None)
+
+        failing = FailingPlugin(manager)
+        plugin = GrammarPlugin(manager)
+        manager.plugins[failing.id + ".failing"] = failing
+        manager.plugins[plugin.id] = plugin
+
+        with self.assertLogs("castervoice.PluginManager", "ERROR"):
+            manager.load_plugins()
+        self.assertEqual(len(plugin.grammars), 1)
+        self.assertEqual(failing.grammars, [])
+
+    def test_load_failure_discarded(self):
+        engine = get_engine("text")
+        manager = PluginManager(None, {}, None)
+        plugin = FailingLoadPlugin(manager)
+        manager.plugins[plugin.id] = plugin
+
+        plugin.build()
+        grammars = list(plugin.grammars)
+        # Building in worker threads leaves the grammar index alone
+        self.assertIsNone(manager.get_grammar_plugin(grammars[0]))
+
+        with self.assertLogs("castervoice.PluginManager", "ERROR"):
+            manager.load_plugins()
+        self.assertEqual(plugin.grammars, [])
+        self.assertFalse(plugin.loaded)
+        for grammar in grammars:
+            self.assertFalse(grammar.loaded)
+            self.assertNotIn(grammar, engine.grammars)
+            self.assertIsNone(manager.get_grammar_plugin(grammar))
+
+    def test_lazy_loading(self):
+        manager = PluginManager(None, {'lazy': {'plugins': [__name__],
+                                                'idle_timeout': 0,
+                                                'check_interval': None}},
+                                None)
+        plugin = GrammarPlugin(manager)
+        plugin.apply_context(AppContext(executable="code"))
+        manager.plugins[plugin.id] = plugin
+
+        manager.load_plugins()
+        self.assertEqual(manager.resident_plugins, {})
+
+        manager.update_lazy_plugins("code", "title", 1)
+        self.assertIn(plugin.id, manager.resident_plugins)
+
+        manager.update_lazy_plugins("other", "title", 2)
+        self.assertEqual(manager.resident_plugins, {})
+
+    def test_lazy_loading_timer(self):
+        manager = PluginManager(None, {'lazy': {'plugins': [__name__],
+                                                'check_interval': 0.01}},
+                                None)
+        plugin = GrammarPlugin(manager)
+        manager.plugins[plugin.id] = plugin
+
+        # Loaded in the background without waiting for an utterance
+        deadline = time.monotonic() + 5
+        while not plugin.loaded and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(plugin.loaded)
+
+        manager.unload_plugins()
+        time.sleep(0.05)
+        self.assertFalse(plugin.loaded)
+
+    def test_lazy_loading_without_foreground_window(self):
+        manager = PluginManager(None, {'lazy': {'plugins': [__name__],
+                                                'check_interval': None}},
+                                None)
+        plugin = GrammarPlugin(manager)
+        manager.plugins[plugin.id] = plugin
+
+        with mock.patch("castervoice.core.plugin.plugin_manager.Window"
+                        ".get_foreground", side_effect=OSError()):
+            # pylint: disable=protected-access
+            manager._check_foreground()
+        self.assertFalse(plugin.loaded)
@@ -0,0 +1,105 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+
+from dragonfly import MimicFailure, get_engine
+
+from castervoice.core.plugin import PluginManager
+
+
+PLUGIN_SOURCE = """
+from dragonfly import Function, Grammar, MappingRule
+from castervoice.core.plugin import Plugin
+
+RECOGNIZED = []
+
+
+class FailingGrammar(Grammar):
+    def load(self):
+        raise RuntimeError("Failed loading grammar")
+
+
+class SwapPlugin(Plugin):
+    def get_grammars(self):
+        {body}
+        grammar = Grammar("swap")
+        grammar.add_rule(MappingRule(mapping={{
+            "swap {version}": Function(lambda: RECOGNIZED.append(1))}}))
+        return [grammar] + {extra}
+"""
+
+
+class TestPluginSwap(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = get_engine("text")
+
+        # Rewritten sources may keep size and modification time
+        self.dont_write_bytecode = sys.dont_write_bytecode
+        sys.dont_write_bytecode = True
+
+        # pylint: disable=consider-using-with
+        self.directory = tempfile.TemporaryDirectory()
+        sys.path.insert(0, self.directory.name)
+
+        self.write_plugin("one")
+        self.manager = PluginManager(None, {}, None)
+        self.manager.init_plugin("swapplugin")
+        self.manager.load_plugins()
+
+    def tearDown(self):
+        self.manager.unload_plugins()
+        sys.path.remove(self.directory.name)
+        del sys.modules["swapplugin"]
+        self.directory.cleanup()
+        sys.dont_write_bytecode = self.dont_write_bytecode
+
+    def write_plugin(self, version, body="pass", extra="[]"):
+        path = os.path.join(self.directory.name, "swapplugin.py")
+        with open(path, "w", encoding="utf-8") as plugin_file:
+            plugin_file.write(PLUGIN_SOURCE.format(version=version,
+                                                   body=body, extra=extra))
+        importlib.invalidate_caches()
+
+    def test_swap(self):
+        self.write_plugin("two")
+        self.assertTrue(self.manager.reload_plugin("swapplugin"))
+
+        self.engine.mimic("swap two")
+        with self.assertRaises(MimicFailure):
+            self.engine.mimic("swap one")
+
+    def test_failed_build_keeps_plugin(self):
+        current = self.manager.plugins["swapplugin"]
+
+        self.write_plugin("two", body="raise RuntimeError()")
+        with self.assertLogs("castervoice.PluginManager", "ERROR"):
+            self.assertFalse(self.manager.reload_plugin("swapplugin"))
+
+        self.assertIs(self.manager.plugins["swapplugin"], current)
+        self.engine.mimic("swap one")
+
+    def test_failed_load_discards_grammars(self):
+        current = self.manager.plugins["swapplugin"]
+
+        # The first grammar is loaded before the second one fails
+        self.write_plugin("two", extra="[FailingGrammar('failing')]")
+        with self.assertLogs("castervoice.PluginManager", "ERROR"):
+            self.assertFalse(self.manager.reload_plugin("swapplugin"))
+
+        grammars = [grammar for grammar in self.engine.grammars
+                    if grammar.name in ("swap", "failing")]
+        self.assertEqual(grammars, current.grammars)
+        # pylint: disable=protected-access
+        self.assertEqual(list(self.manager._grammar_plugins),
+                         current.grammars)
+        self.engine.mimic("swap one")
+
+    def test_failed_import_keeps_plugin(self):
+        self.write_plugin("two", body="syntax error")
+        with self.assertLogs("castervoice.PluginManager", "ERROR"):
+            self.assertFalse(self.manager.reload_plugin("swapplugin"))
+
+        self.engine.mimic("swap one")
@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+
+from castervoice.core import profiler
+
+
+class TestProfiler(unittest.TestCase):
+
+    def tearDown(self):
+        profiler.stop()
+
+    def test_inactive(self):
+        self.assertFalse(profiler.active())
+        with profiler.phase("phase"):
+            pass
+        self.assertIsNone(profiler.stop())
+
+    def test_phases_without_reset_peak(self):
+        with mock.patch.object(profiler, "_RESET_PEAK", False):
+            self.test_phases()
+
+    def test_phases(self):
+        startup_profile = profiler.start()
+        with profiler.phase("outer"):
+            with profiler.phase("import", "plugin"):
+                data = bytearray(1024 * 1024)
+            del data
+            with profiler.phase("get_grammars", "plugin"):
+                pass
+        self.assertIs(profiler.stop(), startup_profile)
+
+        phases = startup_profile.phases()
+        self.assertEqual([name for name, _, _ in phases], ["outer"])
+        # The inner phase's peak is part of the outer phase's peak
+        self.assertGreater(phases[0][2], 1000 * 1024)
+
+        ((plugin_id, wall, plugin_phases),) = startup_profile.plugins()
+        self.assertEqual(plugin_id, "plugin")
+        self.assertEqual(set(plugin_phases), {"import", "get_grammars"})
+        self.assertGreater(plugin_phases["import"][1], 1000 * 1024)
+        self.assertLessEqual(wall, phases[0][1])
+
+        self.assertIn("get_grammars", startup_profile.report())
+        self.assertEqual(startup_profile.to_dict()["plugins"]["plugin"]
+                         ["phases"]["import"]["wall"],
+                         plugin_phases["import"][0])
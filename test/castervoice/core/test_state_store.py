@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import yaml
+
+from castervoice.core.plugin import Plugin, PluginManager
+from castervoice.core.plugin.state_store import StateStore
+
+
+class TestStateStore(unittest.TestCase):
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, StateStore.FILE_NAME)
+        self.store = StateStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def reopen(self):
+        self.store.close()
+        self.store = StateStore(self.path)
+        return self.store.plugin_state("plugin").data
+
+    def test_lazy_access(self):
+        self.store.write("plugin", {"words": ["a", "b"], "count": 1})
+
+        state = self.store.plugin_state("plugin").data
+        self.assertEqual(state["words"], ["a", "b"])
+        self.assertEqual(state["count"], 1)
+        state["count"] += 1
+        with mock.patch.object(self.store, "write_pickled",
+                               wraps=self.store.write_pickled) as write:
+            state.persist()
+            state.persist()
+
+        # Only the modified key was written back, once
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(list(write.call_args[0][1]), ["count"])
+        self.assertEqual(dict(self.reopen()),
+                         {"words": ["a", "b"], "count": 2})
+
+    def test_no_state(self):
+        state = self.store.plugin_state("plugin")
+        self.assertIsNone(state.data)
+        self.assertIsNone(self.reopen())
+
+        state = self.store.plugin_state("plugin")
+        state.data = {}
+        self.assertEqual(dict(state.data), {})
+        state.data = None
+        self.assertIsNone(state.data)
+
+    def test_modify_in_place(self):
+        self.store.plugin_state("plugin").data = {"words": []}
+        state = self.store.plugin_state("plugin").data
+        state.persist()
+
+        state["words"].append("word")
+        state.persist()
+        self.assertEqual(self.reopen()["words"], ["word"])
+
+    def test_delete_and_clear(self):
+        self.store.plugin_state("plugin").data = {"a": 1, "b": 2}
+        state = self.store.plugin_state("plugin").data
+        state.persist()
+
+        del state["a"]
+        state.persist()
+        self.assertEqual(dict(self.reopen()), {"b": 2})
+
+        state = self.store.plugin_state("plugin")
+        state.data = {"c": 3}
+        state.persist()
+        self.assertEqual(dict(self.reopen()), {"c": 3})
+
+    def test_string_keys(self):
+        with self.assertRaises(TypeError):
+            self.store.plugin_state("plugin").data = {1: 1}
+
+    def test_migrate(self):
+        for name, data in (("plugin", {"count": 3}), ("invalid", [1])):
+            with open(os.path.join(self.directory.name, f"{name}.state"),
+                      "w", encoding="utf-8") as ymlfile:
+                yaml.dump(data, ymlfile)
+
+        with self.assertLogs("castervoice.StateStore", "WARNING"):
+            self.store.migrate(self.directory.name)
+
+        self.assertEqual(self.store.plugin_state("plugin").data["count"], 3)
+        files = os.listdir(self.directory.name)
+        self.assertIn("invalid.state", files)
+        self.assertIn("plugin.state.migrated", files)
+        self.assertNotIn("plugin.state", files)
+
+
+class TestStateStorePlugin(unittest.TestCase):
+
+    def test_plugin_state(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manager = PluginManager(None, {"state": {"backend": "sqlite"}},
+                                    directory)
+            plugin = Plugin(manager)
+            self.assertIsNone(plugin.state)
+            plugin.state = {"count": 1}
+            plugin.persist_state()
+
+            replacement = Plugin(manager)
+            replacement.state = plugin.state
+            self.assertEqual(dict(replacement.state), {"count": 1})
+
+            manager.state_store.close()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import yaml
+
+from castervoice.core.plugin.plugin import PluginState
+from castervoice.core.plugin.state_writer import StateWriter, write_atomic
+
+
+class TestStateWriter(unittest.TestCase):
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "plugin.state")
+        self.writer = StateWriter(interval=60)
+
+    def tearDown(self):
+        self.writer.close()
+        self.directory.cleanup()
+
+    def read(self):
+        with open(self.path, "r", encoding="utf-8") as state_file:
+            return yaml.safe_load(state_file)
+
+    def test_coalesce(self):
+        for count in range(5):
+            self.writer.schedule(self.path, {"count": count})
+        self.assertFalse(os.path.exists(self.path))
+
+        self.writer.flush()
+        self.assertEqual(self.read(), {"count": 4})
+        self.assertEqual(self.writer.writes, 1)
+        self.assertEqual(self.writer.coalesced, 4)
+
+    def test_close_flushes(self):
+        self.writer.schedule(self.path, {"count": 1})
+        self.writer.close()
+        self.assertEqual(self.read(), {"count": 1})
+
+        # Written immediately once closed
+        self.writer.schedule(self.path, {"count": 2})
+        self.assertEqual(self.read(), {"count": 2})
+
+    def test_background_flush(self):
+        writer = StateWriter(interval=0.01)
+        writer.schedule(self.path, {"count": 1})
+        deadline = time.monotonic() + 1
+        while writer.writes == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(writer.writes, 1)
+        writer.close()
+        self.assertEqual(self.read(), {"count": 1})
+
+    def test_failed_write_keeps_file(self):
+        write_atomic(self.path, {"count": 1})
+
+        with mock.patch("os.fsync", side_effect=OSError("disk full")), \
+                self.assertRaises(OSError):
+            write_atomic(self.path, {"count": 2})
+
+        self.assertEqual(self.read(), {"count": 1})
+        self.assertEqual(os.listdir(self.directory.name), ["plugin.state"])
+
+    def test_pending_state(self):
+        state = PluginState(self.path, self.writer)
+        state.data = {"items": [1]}
+        state.persist()
+        state.data["items"].append(2)
+
+        self.assertEqual(PluginState(self.path, self.writer).data,
+                         {"items": [1]})
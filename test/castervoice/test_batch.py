@@ -0,0 +1,94 @@
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import yaml
+from dragonfly import get_engine
+
+from castervoice import batch
+from castervoice.core.controller import Controller
+
+
+PLUGIN_SOURCE = """
+from dragonfly import Function, Grammar, MappingRule
+from castervoice.core.plugin import Plugin
+
+
+class BatchPlugin(Plugin):
+    def get_grammars(self):
+        grammar = Grammar("batch")
+        grammar.add_rule(MappingRule(name="greet", mapping={
+            "say hello": Function(lambda: None)}))
+        return [grammar]
+"""
+
+
+class TestParseUtterances(unittest.TestCase):
+
+    def test_parse(self):
+        lines = ["say hello\n", "\n", "# comment\n",
+                 "say hello\tbatchplugin:greet\n"]
+        self.assertEqual(list(batch.parse_utterances(lines)),
+                         [("say hello", None),
+                          ("say hello", "batchplugin:greet")])
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        get_engine("text")
+
+        # pylint: disable=consider-using-with
+        self.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.directory.name, "batchplugin.py"), "w",
+                  encoding="utf-8") as plugin_file:
+            plugin_file.write(PLUGIN_SOURCE)
+        with open(os.path.join(self.directory.name, "caster.yml"), "w",
+                  encoding="utf-8") as config_file:
+            yaml.dump({"engine": {"text": {}},
+                       "contexts": [{"name": "global",
+                                     "plugins": ["batchplugin"]}]},
+                      config_file)
+        sys.path.insert(0, self.directory.name)
+        importlib.invalidate_caches()
+
+        self.controller = Controller(config_dir=self.directory.name)
+
+    def tearDown(self):
+        # Disconnecting the engine after a batch run unloaded all grammars
+        sys.path.remove(self.directory.name)
+        sys.modules.pop("batchplugin", None)
+        self.directory.cleanup()
+
+    def test_report(self):
+        output = io.StringIO()
+        passed = batch.run_batch(self.controller,
+                                 ["say hello\tbatchplugin:greet\n",
+                                  "say hello\tbatchplugin\n"], output)
+        self.assertTrue(passed)
+
+        report = output.getvalue()
+        self.assertIn("'say hello' -> batchplugin:greet", report)
+        self.assertIn("2 utterances, 2 recognized, 0 failed", report)
+        self.assertIn("Throughput:", report)
+
+    def test_failures(self):
+        output = io.StringIO()
+        passed = batch.run_batch(self.controller,
+                                 ["say goodbye\n",
+                                  "say hello\tbatchplugin:other\n",
+                                  "say hello\n"], output, as_json=True)
+        self.assertFalse(passed)
+
+        report = json.loads(output.getvalue())
+        self.assertEqual([result["passed"] for result in report["results"]],
+                         [False, False, True])
+        self.assertEqual(report["results"][0]["rule"], None)
+        self.assertEqual(report["results"][1]["plugin"], "batchplugin")
+        self.assertEqual(report["summary"]["recognized"], 2)
+        self.assertEqual(report["summary"]["failed"], 2)
+        self.assertGreater(report["summary"]["latency_max"], 0)
@@ -0,0 +1,48 @@
+import threading
+import unittest
+
+import gevent.event
+
+from castervoice.hub_bridge import HubBridge
+
+
+class TestHubBridge(unittest.TestCase):
+
+    def setUp(self):
+        self.bridge = HubBridge()
+
+    def tearDown(self):
+        self.bridge.close()
+
+    def test_call_from_thread(self):
+        calls = []
+        done = gevent.event.Event()
+
+        def call(index):
+            calls.append((index, threading.current_thread()))
+            if index == 9:
+                done.set()
+
+        def produce():
+            for index in range(10):
+                self.bridge.call(call, index)
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        self.assertTrue(done.wait(5))
+        producer.join()
+
+        self.assertEqual([index for index, _ in calls], list(range(10)))
+        self.assertTrue(all(thread is threading.current_thread()
+                            for _, thread in calls))
+
+    def test_failing_call(self):
+        done = gevent.event.Event()
+
+        def fail():
+            raise RuntimeError("call failed")
+
+        with self.assertLogs("castervoice.HubBridge", "ERROR"):
+            self.bridge.call(fail)
+            self.bridge.call(done.set)
+            self.assertTrue(done.wait(5))
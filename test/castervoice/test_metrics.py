@@ -0,0 +1,102 @@
+import threading
+import unittest
+from unittest import mock
+
+from castervoice import metrics
+from castervoice.core.action_queue import ActionQueue
+from castervoice.core.controller import Controller
+from castervoice.web import app
+
+
+class TestRecognitionMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = metrics.RecognitionMetrics()
+
+    def test_latencies(self):
+        with mock.patch("time.perf_counter",
+                        side_effect=[1.0, 1.125, 1.15625]):
+            self.metrics.on_begin()
+            self.metrics.on_recognition("plugin", "rule")
+            self.metrics.on_post_recognition()
+
+        # Recognized without a detected speech start
+        self.metrics.on_recognition("plugin", "rule")
+        self.metrics.on_failure()
+
+        self.assertEqual(self.metrics.recognitions(), {("plugin", "rule"): 2})
+        self.assertEqual(self.metrics.failures, 1)
+
+        text = self.metrics.render()
+        labels = 'plugin="plugin",rule="rule"'
+        self.assertIn(f"castervoice_recognitions_total{{{labels}}} 2", text)
+        self.assertIn("castervoice_recognition_failures_total 1", text)
+        self.assertIn("castervoice_recognition_latency_seconds_bucket"
+                      f'{{{labels},le="0.1"}} 0', text)
+        self.assertIn("castervoice_recognition_latency_seconds_bucket"
+                      f'{{{labels},le="0.25"}} 1', text)
+        self.assertIn("castervoice_execution_latency_seconds_bucket"
+                      f'{{{labels},le="0.05"}} 1', text)
+        self.assertIn("castervoice_execution_latency_seconds_bucket"
+                      f'{{{labels},le="+Inf"}} 1', text)
+
+    def test_deferred_execution(self):
+        with mock.patch("time.perf_counter", side_effect=[1.0, 1.5]):
+            self.metrics.on_recognition("plugin", "rule")
+            recognized = self.metrics.defer_execution()
+            # The recognition callback returns before the action was
+            # executed
+            self.metrics.on_post_recognition()
+            self.metrics.on_executed(recognized)
+
+        text = self.metrics.render()
+        labels = 'plugin="plugin",rule="rule"'
+        self.assertIn("castervoice_execution_latency_seconds_bucket"
+                      f'{{{labels},le="0.25"}} 0', text)
+        self.assertIn("castervoice_execution_latency_seconds_bucket"
+                      f'{{{labels},le="0.5"}} 1', text)
+        self.assertIn("castervoice_execution_latency_seconds_count"
+                      f"{{{labels}}} 1", text)
+
+    def test_action_queue(self):
+        queue = ActionQueue(workers=1)
+        try:
+            release = threading.Event()
+            queue.submit("plugin", release.wait)
+            queue.submit("plugin", lambda: None).cancel()
+            queue.submit("plugin", lambda: None, timeout=0)
+            queue.submit("plugin", lambda: None)
+            text = metrics.render_action_queue(queue)
+            release.set()
+            with self.assertLogs("castervoice.ActionQueue", "WARNING"):
+                self.assertTrue(queue.join(5))
+        finally:
+            queue.close()
+
+        self.assertIn("castervoice_action_queue_depth 2", text)
+
+        text = metrics.render_action_queue(queue)
+        self.assertIn("castervoice_action_queue_depth 0", text)
+        self.assertIn("castervoice_queued_actions_total 4", text)
+        for state, count in (("done", 2), ("cancelled", 1), ("expired", 1)):
+            self.assertIn("castervoice_finished_actions_total"
+                          f'{{state="{state}"}} {count}', text)
+        self.assertIn('castervoice_action_wait_seconds_count{plugin="plugin"}'
+                      " 2", text)
+
+    def test_label_escaping(self):
+        self.metrics.on_recognition("plugin", 'say "hi"')
+        self.assertIn('rule="say \\"hi\\""', self.metrics.render())
+
+    def test_route(self):
+        response = app.test_client().get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        self.assertIn(b"castervoice_recognition_failures_total",
+                      response.data)
+
+        with mock.patch.object(Controller, "get") as get:
+            get.return_value.plugin_manager.action_queue = ActionQueue()
+            response = app.test_client().get("/metrics")
+            get.return_value.plugin_manager.action_queue.close()
+        self.assertIn(b"castervoice_action_queue_depth 0", response.data)
@@ -0,0 +1,194 @@
+import importlib
+import os
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+import gevent
+import yaml
+from dragonfly import get_engine
+
+from castervoice import watcher
+from castervoice.core.controller import Controller
+from castervoice.core.plugin import PluginManager
+from castervoice.metrics import recognition_metrics
+from castervoice.remote import (
+        RecognitionClient,
+        RecognitionError,
+        RecognitionServer
+        )
+from castervoice.remote import protocol
+
+
+PLUGIN_SOURCE = """
+from dragonfly import Function, Grammar, IntegerRef, MappingRule, Text
+from castervoice.core.plugin import Plugin
+
+executed = []
+
+
+class RemotePlugin(Plugin):
+    def get_grammars(self):
+        grammar = Grammar("remote")
+        grammar.add_rule(MappingRule(name="greet", mapping={
+            "say hello": Text("hello"),
+            "say <n>": Text("%(n)d"),
+            "run function": Function(lambda: executed.append(True))},
+            extras=[IntegerRef("n", 1, 10)]))
+        return [grammar]
+"""
+
+
+class TestProtocol(unittest.TestCase):
+
+    def test_frames(self):
+        first, second = socket.socketpair()
+        with first, second:
+            first.sendall(protocol.encode(protocol.TEXT, 7, b"say hello")
+                          + protocol.encode(protocol.NO_MATCH, 8))
+            self.assertEqual(protocol.read_frame(second),
+                             (protocol.TEXT, 7, b"say hello"))
+            self.assertEqual(protocol.read_frame(second),
+                             (protocol.NO_MATCH, 8, b""))
+
+            first.sendall(protocol.encode(protocol.TEXT, 9, b"say")[:-1])
+            first.close()
+            with self.assertRaises(protocol.ProtocolError):
+                protocol.read_frame(second)
+
+    def test_parse_address(self):
+        self.assertEqual(protocol.parse_address("unix:/tmp/caster.sock"),
+                         (socket.AF_UNIX, "/tmp/caster.sock"))
+        self.assertEqual(protocol.parse_address("localhost:23424"),
+                         (socket.AF_INET, ("localhost", 23424)))
+        with self.assertRaises(ValueError):
+            protocol.parse_address("localhost")
+
+
+class TestRecognitionServer(unittest.TestCase):
+
+    def setUp(self):
+        get_engine("text")
+
+        # pylint: disable=consider-using-with
+        self.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.directory.name, "remoteplugin.py"), "w",
+                  encoding="utf-8") as plugin_file:
+            plugin_file.write(PLUGIN_SOURCE)
+        with open(os.path.join(self.directory.name, "caster.yml"), "w",
+                  encoding="utf-8") as config_file:
+            yaml.dump({"engine": {"text": {}},
+                       "contexts": [{"name": "global",
+                                     "plugins": ["remoteplugin"]}]},
+                      config_file)
+        sys.path.insert(0, self.directory.name)
+        importlib.invalidate_caches()
+
+        self.controller = Controller(config_dir=self.directory.name,
+                                     execute_actions=False)
+        self.address = f"unix:{self.directory.name}/server.sock"
+        self.server = RecognitionServer(self.controller, self.address)
+        self.server.start()
+        self.engine_thread = threading.Thread(target=self.server.serve_engine)
+        self.engine_thread.start()
+
+    def tearDown(self):
+        self.server.close()
+        self.engine_thread.join()
+        sys.path.remove(self.directory.name)
+        sys.modules.pop("remoteplugin", None)
+        self.directory.cleanup()
+
+    def run_clients(self, client_function, count=1):
+        """Run `client_function` in `count` threads, serving meanwhile."""
+        results = []
+        errors = []
+
+        def run():
+            try:
+                with RecognitionClient(self.address, timeout=5) as client:
+                    results.append(client_function(client))
+            except Exception as error:  # pylint: disable=W0703
+                errors.append(error)
+
+        threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            gevent.sleep(0.001)
+
+        if errors:
+            raise errors[0]
+        return results
+
+    def test_round_trip(self):
+        def recognize(client):
+            return (client.recognize_text("say hello"),
+                    client.recognize_text("say goodbye"),
+                    client.recognize_text("say five"),
+                    client.recognize_text("run function"))
+
+        hello, no_match, number, function = self.run_clients(recognize)[0]
+        self.assertEqual((hello.plugin_id, hello.rule_name, hello.words,
+                          hello.spec),
+                         ("remoteplugin", "greet", ("say", "hello"),
+                          "say hello"))
+        self.assertIn("hello", hello.action)
+        self.assertIsNone(no_match)
+        self.assertEqual((number.spec, number.extras), ("say <n>", {"n": 5}))
+        self.assertEqual(function.spec, "run function")
+
+        # Actions are left to the client
+        self.assertEqual(sys.modules["remoteplugin"].executed, [])
+
+    def test_execute(self):
+        function = self.run_clients(
+                lambda client: client.recognize_text("run function"))[0]
+
+        # The client's own plugins, built without loading them into the
+        # engine shared with the server
+        manager = PluginManager(None, {'actions': {'workers': 0}}, None)
+        manager.init_plugin("remoteplugin")
+        manager.plugins["remoteplugin"].build()
+
+        function.execute(manager)
+        self.assertEqual(sys.modules["remoteplugin"].executed, [True])
+
+        function.spec = "unknown"
+        with self.assertRaises(LookupError):
+            function.execute(manager)
+
+    def test_events_and_metrics(self):
+        subscription = watcher.subscribe(plugins=["remoteplugin"])
+        recognitions = recognition_metrics.recognitions() \
+            .get(("remoteplugin", "greet"), 0)
+        try:
+            self.run_clients(lambda client:
+                             client.recognize_text("say hello"))
+            # Published on the hub
+            gevent.sleep(0.01)
+        finally:
+            watcher.unsubscribe(subscription)
+
+        self.assertEqual(subscription.get(timeout=1).words, ("say", "hello"))
+        self.assertEqual(recognition_metrics.recognitions()
+                         [("remoteplugin", "greet")], recognitions + 1)
+
+    def test_concurrent_pipelined_clients(self):
+        def recognize(client):
+            request_ids = [client.send_text(utterance) for utterance
+                           in ("say hello", "nothing") * 10]
+            # Results can be received in any order
+            return [client.receive(request_id)
+                    for request_id in reversed(request_ids)]
+
+        for results in self.run_clients(recognize, 4):
+            self.assertEqual([result is None for result in results],
+                             [True, False] * 10)
+
+    def test_audio_unsupported(self):
+        with self.assertRaises(RecognitionError):
+            self.run_clients(lambda client:
+                             client.recognize_audio(b"\0" * 3200))
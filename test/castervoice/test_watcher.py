@@ -0,0 +1,210 @@
+import unittest
+
+from unittest import mock
+
+from castervoice import watcher
+from castervoice.web import app
+
+
+class TestSubscription(unittest.TestCase):
+
+    def tearDown(self):
+        for subscription in tuple(watcher.subscriptions):
+            watcher.unsubscribe(subscription)
+
+    def test_unsubscribe(self):
+        subscription = watcher.subscribe()
+        self.assertIn(subscription, watcher.subscriptions)
+
+        watcher.unsubscribe(subscription)
+        self.assertNotIn(subscription, watcher.subscriptions)
+
+    def test_drop_oldest(self):
+        subscription = watcher.subscribe(2, watcher.DROP_OLDEST)
+        for event in range(3):
+            subscription.put(event)
+
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual(subscription.get(), 1)
+        self.assertEqual(subscription.get(), 2)
+
+    def test_drop_newest(self):
+        subscription = watcher.subscribe(2, watcher.DROP_NEWEST)
+        for event in range(3):
+            subscription.put(event)
+
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual(subscription.get(), 0)
+        self.assertEqual(subscription.get(), 1)
+
+    def test_disconnect(self):
+        subscription = watcher.subscribe(1, watcher.DISCONNECT)
+        subscription.put(0)
+        subscription.put(1)
+
+        self.assertTrue(subscription.disconnected)
+        self.assertNotIn(subscription, watcher.subscriptions)
+        with self.assertRaises(watcher.ConsumerDisconnected):
+            subscription.get()
+
+    def test_stream_cleanup(self):
+        stream = watcher.stream_recognitions()
+
+        with mock.patch.object(watcher, 'KEEP_ALIVE_INTERVAL', 0):
+            self.assertTrue(next(stream).startswith(b':'))
+        self.assertEqual(len(watcher.subscriptions), 1)
+
+        stream.close()
+        self.assertEqual(len(watcher.subscriptions), 0)
+
+    def test_shared_payload(self):
+        rule = mock.Mock(grammar="grammar")
+        rule.name = "rule"
+        plugin = mock.Mock(id="plugin")
+        streams = [watcher.stream_recognitions() for _ in range(2)]
+
+        with mock.patch.object(watcher.Controller, "get") as get:
+            get.return_value.plugin_manager.get_grammar_plugin \
+                .return_value = plugin
+            # Subscribe by starting the streams
+            with mock.patch.object(watcher, 'KEEP_ALIVE_INTERVAL', 0):
+                for stream in streams:
+                    next(stream)
+            watcher.on_recognition(["say", "hello"], rule, None)
+            watcher.on_recognition(["again"], rule,
+                                   mock.Mock(**{"value.return_value":
+                                                "action"}))
+
+        first, second = (next(stream) for stream in streams)
+        self.assertEqual(first, b"id: %d\ndata: plugin: say hello\n\n"
+                         % (watcher.replay_buffer.latest - 1))
+        self.assertIs(first, second)
+
+        event = watcher.subscriptions[0].get()
+        self.assertEqual((event.plugin_id, event.rule_name, event.words,
+                          event.action),
+                         ("plugin", "rule", ("again",), "'action'"))
+        self.assertGreater(event.sequence, 1)
+        with self.assertRaises(AttributeError):
+            event.rule = rule
+
+        for stream in streams:
+            stream.close()
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            watcher.subscribe(policy="unknown")
+
+    def test_filters(self):
+        everything = watcher.subscribe()
+        plugin_only = watcher.subscribe(plugins=["plugin"])
+        rule_only = watcher.subscribe(plugins=["plugin", "other"],
+                                      rules=["rule"])
+        other = watcher.subscribe(plugins=["other"])
+
+        rules = []
+        for name in ("rule", "another"):
+            rules.append(mock.Mock(grammar=name))
+            rules[-1].name = name
+
+        with mock.patch.object(watcher.Controller, "get") as get:
+            get.return_value.plugin_manager.get_grammar_plugin \
+                .return_value = mock.Mock(id="plugin")
+            for rule in rules:
+                watcher.on_recognition(["word"], rule, None)
+
+        self.assertEqual((len(everything), len(plugin_only), len(rule_only),
+                          len(other)), (2, 2, 1, 0))
+        self.assertEqual(rule_only.get().rule_name, "rule")
+
+        watcher.unsubscribe(rule_only)
+        watcher.unsubscribe(other)
+        # pylint: disable=protected-access
+        self.assertEqual(
+                watcher._plugin_subscriptions,
+                {**{(event_type, watcher._ALL_PLUGINS): [everything]
+                    for event_type in watcher.EVENT_TYPES},
+                 **{(event_type, "plugin"): [plugin_only]
+                    for event_type in watcher.EVENT_TYPES}})
+
+    def test_type_filters(self):
+        everything = watcher.subscribe()
+        failures = watcher.subscribe(types=[watcher.FAILURE])
+        status = watcher.subscribe(types=[watcher.BEGIN, watcher.FAILURE])
+        plugin_failures = watcher.subscribe(plugins=["plugin"],
+                                            types=[watcher.FAILURE])
+
+        with mock.patch.object(watcher, "print"):
+            watcher.on_begin()
+            watcher.on_failure()
+        watcher.publish(watcher.RecognitionEvent(3, 0, "plugin", "rule",
+                                                 ["word"]))
+
+        self.assertEqual([len(everything), len(failures), len(status),
+                          len(plugin_failures)], [3, 1, 2, 0])
+        self.assertEqual([status.get().event_type, status.get().event_type],
+                         [watcher.BEGIN, watcher.FAILURE])
+        failure = failures.get()
+        self.assertEqual((failure.plugin_id, failure.rule_name,
+                          failure.words), (None, None, ()))
+        self.assertEqual(failure.payload,
+                         b"id: %d\nevent: failure\ndata: failure\n\n"
+                         % failure.sequence)
+
+        watcher.unsubscribe(status)
+        # pylint: disable=protected-access
+        self.assertEqual(
+                watcher._plugin_subscriptions,
+                {**{(event_type, watcher._ALL_PLUGINS): [everything]
+                    for event_type in watcher.EVENT_TYPES},
+                 (watcher.FAILURE, watcher._ALL_PLUGINS): [everything,
+                                                           failures],
+                 (watcher.FAILURE, "plugin"): [plugin_failures]})
+
+    def test_type_route(self):
+        response = app.test_client().get(
+                "/events?type=failure&type=unknown",
+                headers={"Accept": "text/event-stream"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(watcher.subscriptions, [])
+
+    def test_empty_filters(self):
+        with self.assertRaises(ValueError):
+            watcher.subscribe(plugins=[])
+        with self.assertRaises(ValueError):
+            watcher.subscribe(rules=())
+        with self.assertRaises(ValueError):
+            watcher.subscribe(types=[])
+        with self.assertRaises(ValueError):
+            watcher.subscribe(types=["unknown"])
+        self.assertEqual(watcher.subscriptions, [])
+
+    def test_event_without_plugin(self):
+        everything = watcher.subscribe()
+        watcher.publish(watcher.RecognitionEvent(1, 0, None, "rule",
+                                                 ["word"]))
+        self.assertEqual(len(everything), 1)
+
+    def test_replay(self):
+        events = [watcher.RecognitionEvent(sequence, 0, "plugin", "rule",
+                                           [str(sequence)])
+                  for sequence in range(1, 6)]
+        buffer = watcher.ReplayBuffer(3)
+        for event in events[:4]:
+            buffer.append(event)
+
+        stream = watcher.stream_recognitions(last_event_id=1)
+        with mock.patch.object(watcher, 'replay_buffer', buffer):
+            # Event 2 is still buffered, event 5 arrives while replaying
+            self.assertIs(next(stream), events[1].payload)
+            buffer.append(events[4])
+            watcher.subscriptions[0].put(events[4])
+            self.assertIs(next(stream), events[2].payload)
+            self.assertIs(next(stream), events[3].payload)
+            self.assertIs(next(stream), events[4].payload)
+        stream.close()
+
+        # Event 1 was overwritten
+        self.assertEqual([event.sequence for event in buffer.since(0)],
+                         [3, 4, 5])
+        self.assertIsNone(buffer.get(1))